@@ -11,12 +11,100 @@ import xml
 from collections import OrderedDict
 from xml.sax import make_parser
 import argparse
+import contextlib
+import csv
 import json
 import ntpath
 import os
 import xml
-from collections import OrderedDict
+from collections import OrderedDict, deque
 from xml.sax import make_parser
+import gzip
+import hashlib
+import io
+import mmap
+import multiprocessing
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import xml.parsers.expat
+
+# optional serialization and compression libraries
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# optional parser backend
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# byte patterns used to locate the documents in a teiCorpus file without parsing it
+TEI_START_PATTERN = re.compile(rb'<(?:TEI|tei)[\s>]')
+TEI_END_PATTERN = re.compile(rb'</(?:TEI|tei)\s*>')
+# prolog before the root element: XML declaration, comments, processing instructions and document type 
+# declaration with its internal subset
+TEI_PROLOG_PATTERN = re.compile(rb'(?:\xef\xbb\xbf)?(?:\s+|<\?.*?\?>|<!--.*?-->|<!DOCTYPE[^\[>]*(?:\[.*?\]\s*)?>)*', re.S)
+
+# output formats and their file extension, the streaming formats are written document per document
+OUTPUT_FORMATS = OrderedDict([("json", ".json"), ("compact", ".json"), ("jsonl", ".jsonl"), ("msgpack", ".msgpack"), ("cbor", ".cbor")])
+STREAMING_FORMATS = ("jsonl", "msgpack", "cbor")
+COMPRESSIONS = OrderedDict([("gzip", ".gz"), ("zstd", ".zst")])
+
+# extension of the sidecar index of a JSON Lines output, and document fields which are not idno types
+INDEX_EXTENSION = ".idx.json"
+DOCUMENT_FIELDS = ("id", "lang", "level", "type", "subtype", "title", "abstract", "body_text")
+
+# name of the manifest file written in the output directory by the incremental batch mode
+MANIFEST_FILE = ".tei2json-manifest.json"
+
+# extension of the checkpoint written next to the output by the resilient mode, for resuming a run
+CHECKPOINT_EXTENSION = ".checkpoint.json"
+
+# directory created by the conversion cache in its cache_dir, holding one subdirectory per converter version
+CACHE_DIRECTORY = "tei2json-cache"
+
+# namespace of the xml: attributes (xml:id, xml:lang), as expanded by lxml
+XML_NAMESPACE = "http://www.w3.org/XML/1998/namespace"
+
+class TextBuffer(object):
+    """
+    Append-only text buffer: the pieces are joined once when the value is requested, so that 
+    building a long paragraph from many SAX chunks is linear in its length
+    """
+
+    __slots__ = ('pieces', 'length')
+
+    def __init__(self, text=''):
+        self.pieces = [text] if text else []
+        self.length = len(text)
+
+    def append(self, text):
+        if text:
+            self.pieces.append(text)
+            self.length += len(text)
+
+    def getvalue(self):
+        if len(self.pieces) > 1:
+            self.pieces = [''.join(self.pieces)]
+        return self.pieces[0] if self.pieces else ''
+
+    def __len__(self):
+        return self.length
 
 
 class TEIContentHandler(xml.sax.ContentHandler):
@@ -24,7 +112,8 @@ class TEIContentHandler(xml.sax.ContentHandler):
     TEI XML SAX handler for reading sections/paragraph with mixed content within xml text tags  
     """
 
-    # local paragraph
+    # local paragraph, section and paragraph are TextBuffer while being filled, 
+    # section is then kept as string for the following paragraphs
     section = None
     paragraph = None
     ref_spans = None
@@ -37,6 +126,7 @@ class TEIContentHandler(xml.sax.ContentHandler):
     currentOffset = -1
     abstract = False
     current_reference = None
+    current_reference_text = None
     current_item_list = None
     current_formula = None
     skip = False
@@ -53,377 +143,1226 @@ class TEIContentHandler(xml.sax.ContentHandler):
     # dict corresponding to the full corpus in JSON 
     corpus = None 
 
-    def __init__(self):
+    # optional callable receiving each converted document as soon as it is complete (streaming mode),
+    # the document is then not kept in the corpus
+    document_sink = None
+
+    # optional SpanValidator checking the offsets of the converted paragraphs
+    validator = None
+
+    # optional CorpusStatistics counting paragraphs, tokens and annotations
+    statistics = None
+
+    def __init__(self, document_sink=None, validator=None, statistics=None):
         xml.sax.ContentHandler.__init__(self)
+        self.document_sink = document_sink
+        self.validator = validator
+        self.statistics = statistics
+        # pieces of text received by characters() since the last element event
+        self.chunks = []
+        # element handlers dispatched by tag name, the other elements are skipped
+        self.start_handlers = {
+            'teiCorpus': self._start_tei_corpus,
+            'TEI': self._start_tei,
+            'tei': self._start_tei,
+            'teiHeader': self._start_tei_header,
+            'idno': self._start_idno,
+            'fileDesc': self._start_file_desc,
+            'abstract': self._start_abstract,
+            'head': self._start_head,
+            'p': self._start_paragraph,
+            'figDesc': self._start_paragraph,
+            'note': self._start_note,
+            'ref': self._start_ref,
+            'body': self._start_body,
+            'list': self._start_list,
+            'item': self._start_item,
+            'label': self._start_item,
+            'formula': self._start_formula,
+            'rs': self._start_rs,
+            'respStmt': self._start_resp_stmt
+        }
+        self.end_handlers = {
+            'TEI': self._end_tei,
+            'tei': self._end_tei,
+            'head': self._end_head,
+            'div': self._end_div,
+            'idno': self._end_idno,
+            'hi': self._end_hi,
+            'p': self._end_paragraph,
+            'figDesc': self._end_paragraph,
+            'note': self._end_note,
+            'abstract': self._end_abstract,
+            'ref': self._end_ref,
+            'item': self._end_item,
+            'label': self._end_item,
+            'formula': self._end_formula,
+            # these are the mathml only, chemical formulas are external files not considered here 
+            'mi': self._end_math,
+            'mo': self._end_math,
+            'mn': self._end_math,
+            '<mrow>': self._end_math,
+            'rs': self._end_rs,
+            'title': self._end_title,
+            'resp': self._end_resp,
+            'name': self._end_name,
+            'respStmt': self._end_resp_stmt,
+            'teiCorpus': self._end_tei_corpus
+        }
 
     def startElement(self, name, attrs):
+        if self.chunks:
+            self._flush_characters()
+
         if self.accumulated != '' and not self.in_head_section:
-            if self.paragraph == None:
-                self.paragraph = ''
-            self.paragraph += self.accumulated
+            self._append_paragraph(self.accumulated)
             self.currentOffset += len(self.accumulated)
             if self.current_reference is not None:
-                if 'text' in self.current_reference:
-                    self.current_reference['text'] = self.current_reference['text'] + self.accumulated
-                else:
-                    self.current_reference['text'] = self.accumulated
+                self.current_reference_text.append(self.accumulated)
         elif self.accumulated != '':
-            if self.section is None:
-                self.section = ''
-            self.section += self.accumulated 
+            self._append_section(self.accumulated)
             self.currentOffset += len(self.accumulated)
+            if self.current_reference is not None:
+                self.current_reference_text.append(self.accumulated)
 
-        if name == 'teiCorpus':
-            self.corpus = OrderedDict()
-            self.corpus["documents"] = []
-        elif name == 'TEI' or name == 'tei':
-            # beginning of a document, reinit all
-            self.section = None
-            self.paragraph = None
-            self.current_reference = None
-            self.current_item_list = None
-            self.current_formula = None
-            self.document = OrderedDict()
-            # default lang set here
-            self.document["lang"] = "en"
-            self.document["level"] = "paragraph"
-            self.accumulated = ''
-            self.abstract = False
-            self.is_footnote = False
-            self.in_head_section = False
-            if attrs.getLength() != 0:
-                if "type" in attrs:
-                    self.document["type"] = attrs.getValue("type")
-                if "subtype" in attrs:
-                    self.document["subtype"] = attrs.getValue("subtype")
-                if "xml:lang" in attrs:
-                    # usually NLM/Pub2TEI put the lang attribue at <TEI> when available
-                    self.document["lang"] = attrs.getValue("xml:lang")
-                    self.document.move_to_end('lang', last=False)
-        elif name == 'teiHeader':
-            # GROBID produces a lang attribute at general level at the <teiHeader> and <text> elements, 
-            
-            if attrs.getLength() != 0:
-                if "xml:lang" in attrs:
-                    self.document["lang"] = attrs.getValue("xml:lang")
-                    self.document.move_to_end('lang', last=False)
-        elif name == 'idno':
-            # we have possible document metadata
-            if attrs.getLength() != 0:
-                if "type" in attrs:
-                    self.idno_type = attrs.getValue("type")
-        elif name == 'fileDesc':
-            if attrs.getLength() != 0:
-                if "xml:id" in attrs:
-                    self.document["id"] = attrs.getValue("xml:id")
-                    self.document.move_to_end('id', last=False)
-        elif name == "abstract":
-            self.abstract = True
-            self.document["abstract"] = []
-            self.ref_spans = None
-            self.formula_spans = None
-            self.list_spans = None
-            self.annotations = []
-        elif name == "head":
-            # beginning of paragraph
-            self.section = ''
-            self.in_head_section = True
-            self.ref_spans = None
-            self.currentOffset = 0
-            self.annotations = []
-        elif name == "p" or name == 'figDesc':
-            # beginning of paragraph
-            self.paragraph = ''
-            self.ref_spans = None
-            self.formula_spans = None
-            self.list_spans = None
-            self.currentOffset = 0
-            self.annotations = []
-        elif name == "note": 
-            # footnotes will be considered as paragraphs, others are not relevant (in header or reference section)
-            self.is_footnote = False
-            if attrs.getLength() != 0:
-                if "place" in attrs and attrs.getValue("place") == 'foot':
-                    # beginning of paragraph
-                    self.paragraph = ''
-                    self.ref_spans = None
-                    self.formula_spans = None
-                    self.list_spans = None
-                    self.currentOffset = 0
-                    self.is_footnote = True
-                    self.annotations = []
-        elif name == "ref":
-            if attrs.getLength() != 0:
-                if "type" in attrs:
-                    self.current_reference = OrderedDict()
-                    self.current_reference["type"] = attrs.getValue("type")
-                    #if "target" in attrs:
-                    #    if attrs.getValue("target") is not None:
-                    #        self.current_reference["ref_id"] = attrs.getValue("target").replace("#", "")
-                    self.current_reference["start"] = self.currentOffset
-        elif name == "body":
-            self.document["body_text"] = []
-        elif name == 'list':
-            self.list_spans = []
-            if self.paragraph == None:
-                self.paragraph = '\n'
-            else:
-                self.paragraph += '\n'
-            self.currentOffset += 1    
-            self.annotations = []
-        elif name == 'item' or name == 'label':
-            self.current_item_list = OrderedDict()
-            self.current_item_list["start"] = self.currentOffset
-            self.current_item_list["type"] = name
-        elif name == 'formula':
-            self.current_formula = OrderedDict()
-            if self.paragraph == None:
-                self.currentOffset = 0
-            self.current_formula["start"] = self.currentOffset
-        elif name == 'rs':
-            self.annotation = {}
-            self.annotation["start"] = self.currentOffset
-            if attrs.getLength() != 0:
-                if "type" in attrs:
-                    self.annotation["type"] = attrs.getValue("type")
-                if "subtype" in attrs:
-                    self.annotation["subtype"] = attrs.getValue("subtype")
-                if "xml:id" in attrs:
-                    self.annotation["id"] = attrs.getValue("xml:id")
-                if "corresp" in attrs:
-                    self.annotation["corresp"] = attrs.getValue("corresp")
-                if "resp" in attrs:
-                    self.annotation["resp"] = attrs.getValue("resp")
-                if "cert" in attrs:
-                    self.annotation["cert"] = attrs.getValue("cert")
-        elif name == 'respStmt':
-            self.resp = {}
-            if attrs.getLength() != 0:
-                if "xml:id" in attrs:
-                    self.resp["id"] = attrs.getValue("xml:id")
+        handler = self.start_handlers.get(name)
+        if handler is not None:
+            handler(name, attrs)
         else:
             self.skip = True
 
         self.accumulated = ''
 
+    def _start_tei_corpus(self, name, attrs):
+        self.corpus = OrderedDict()
+        self.corpus["documents"] = []
+
+    def _start_tei(self, name, attrs):
+        # beginning of a document, reinit all
+        self.section = None
+        self.paragraph = None
+        self.current_reference = None
+        self.current_reference_text = None
+        self.current_item_list = None
+        self.current_formula = None
+        # documents are converted independently of the previous ones, the parallel mode relies on it
+        self.ref_spans = None
+        self.formula_spans = None
+        self.list_spans = None
+        self.annotations = None
+        self.document = OrderedDict()
+        # default lang set here
+        self.document["lang"] = "en"
+        self.document["level"] = "paragraph"
+        self.accumulated = ''
+        self.abstract = False
+        self.is_footnote = False
+        self.in_head_section = False
+        if attrs:
+            if "type" in attrs:
+                self.document["type"] = attrs["type"]
+            if "subtype" in attrs:
+                self.document["subtype"] = attrs["subtype"]
+            if "xml:lang" in attrs:
+                # usually NLM/Pub2TEI put the lang attribue at <TEI> when available
+                self.document["lang"] = attrs["xml:lang"]
+                self.document.move_to_end('lang', last=False)
+
+    def _start_tei_header(self, name, attrs):
+        # GROBID produces a lang attribute at general level at the <teiHeader> and <text> elements, 
+        
+        if attrs:
+            if "xml:lang" in attrs:
+                self.document["lang"] = attrs["xml:lang"]
+                self.document.move_to_end('lang', last=False)
+
+    def _start_idno(self, name, attrs):
+        # we have possible document metadata
+        if attrs:
+            if "type" in attrs:
+                self.idno_type = attrs["type"]
+
+    def _start_file_desc(self, name, attrs):
+        if attrs:
+            if "xml:id" in attrs:
+                self.document["id"] = attrs["xml:id"]
+                self.document.move_to_end('id', last=False)
+
+    def _start_abstract(self, name, attrs):
+        self.abstract = True
+        self.document["abstract"] = []
+        self.ref_spans = None
+        self.formula_spans = None
+        self.list_spans = None
+        self.annotations = []
+
+    def _start_head(self, name, attrs):
+        # beginning of paragraph
+        self.section = TextBuffer()
+        self.in_head_section = True
+        self.ref_spans = None
+        self.currentOffset = 0
+        self.annotations = []
+
+    def _start_paragraph(self, name, attrs):
+        # beginning of paragraph
+        self.paragraph = TextBuffer()
+        self.ref_spans = None
+        self.formula_spans = None
+        self.list_spans = None
+        self.currentOffset = 0
+        self.annotations = []
+
+    def _start_note(self, name, attrs):
+        # footnotes will be considered as paragraphs, others are not relevant (in header or reference section)
+        self.is_footnote = False
+        if attrs:
+            if "place" in attrs and attrs["place"] == 'foot':
+                # beginning of paragraph
+                self.paragraph = TextBuffer()
+                self.ref_spans = None
+                self.formula_spans = None
+                self.list_spans = None
+                self.currentOffset = 0
+                self.is_footnote = True
+                self.annotations = []
+
+    def _start_ref(self, name, attrs):
+        if attrs:
+            if "type" in attrs:
+                self.current_reference = OrderedDict()
+                self.current_reference["type"] = attrs["type"]
+                #if "target" in attrs:
+                #    if attrs["target"] is not None:
+                #        self.current_reference["ref_id"] = attrs["target"].replace("#", "")
+                self.current_reference["start"] = self.currentOffset
+                self.current_reference_text = TextBuffer()
+
+    def _start_body(self, name, attrs):
+        self.document["body_text"] = []
+
+    def _start_list(self, name, attrs):
+        self.list_spans = []
+        self._append_paragraph('\n')
+        self.currentOffset += 1    
+        self.annotations = []
+
+    def _start_item(self, name, attrs):
+        self.current_item_list = OrderedDict()
+        self.current_item_list["start"] = self.currentOffset
+        self.current_item_list["type"] = name
+
+    def _start_formula(self, name, attrs):
+        self.current_formula = OrderedDict()
+        if self.paragraph == None:
+            self.currentOffset = 0
+        self.current_formula["start"] = self.currentOffset
+
+    def _start_rs(self, name, attrs):
+        self.annotation = {}
+        self.annotation["start"] = self.currentOffset
+        if attrs:
+            if "type" in attrs:
+                self.annotation["type"] = attrs["type"]
+            if "subtype" in attrs:
+                self.annotation["subtype"] = attrs["subtype"]
+            if "xml:id" in attrs:
+                self.annotation["id"] = attrs["xml:id"]
+            if "corresp" in attrs:
+                self.annotation["corresp"] = attrs["corresp"]
+            if "resp" in attrs:
+                self.annotation["resp"] = attrs["resp"]
+            if "cert" in attrs:
+                self.annotation["cert"] = attrs["cert"]
+
+    def _start_resp_stmt(self, name, attrs):
+        self.resp = {}
+        if attrs:
+            if "xml:id" in attrs:
+                self.resp["id"] = attrs["xml:id"]
+
     def endElement(self, name):
-        if name == 'TEI' or name == 'tei':
+        if self.chunks:
+            self._flush_characters()
+
+        handler = self.end_handlers.get(name)
+        if handler is not None:
+            handler(name)
+        else:
+            self._end_skipped(name)
+        # print("endElement '" + name + "'")
+
+        self.currentOffset += len(self.accumulated)
+
+        self.accumulated = ''
+
+    def _end_tei(self, name):
+        if self.statistics is not None:
+            self.statistics.add_document(self.document)
+        if self.document_sink is not None:
+            # streaming mode: hand over the document and drop it
+            self.document_sink(self.document)
+            self.document = None
+        else:
             self.corpus["documents"].append(self.document)
-        elif name == "head":
-            if self.section is None:
-                self.section = ''
-            self.section += self.accumulated
-            local_paragraph = OrderedDict()
-            local_paragraph['text'] = self.section
-            
-            if self.ref_spans is not None and len(self.ref_spans) > 0:
-                local_paragraph['ref_spans'] = self.ref_spans
-
-            if self.annotations is not None:
-                if len(self.annotations) > 0:
-                    local_paragraph["annotations"] = self.annotations
-
-            if _is_not_empty(local_paragraph['text']):
-                if self.abstract:
-                    self.document["abstract"].append(local_paragraph)
-                elif "body_text" in self.document:
-                    self.document["body_text"].append(local_paragraph)
-
-            # Validating the reference offsets
-            if self.ref_spans is not None and _is_not_empty(self.section):
-                for reference in self.ref_spans:
-                    if self.section[reference["start"]:reference["end"]] != reference['text']:
-                        print("The reference " + reference['text']
-                              + " offsets are not matching in section title '" + self.section + "'. The offsets correspond to "
-                              + self.section[reference["start"]:reference["end"]])
-                        print(local_paragraph)
-
-            self.ref_spans = None
-            self.annotations = None
-            self.in_head_section = False
-        elif name == 'div':
-            self.section = None
-        elif name == 'idno':
-            if self.idno_type != None:
-                self.document[self.idno_type] = self.accumulated
-                self.idno_type = None
-        elif name == "hi":
-            if self.in_head_section:
-                if self.section is None:
-                    self.section = self.accumulated
-                else:
-                    self.section += self.accumulated
-            else:
-                if self.paragraph == None:
-                    self.paragraph = ''
-                self.paragraph += self.accumulated
-            if self.current_reference is not None:
-                if 'text' in self.current_reference:
-                    self.current_reference['text'] = self.current_reference['text'] + self.accumulated
-                else:
-                    self.current_reference['text'] = self.accumulated
-        elif name == "p" or name == 'figDesc' or (name == 'note' and self.is_footnote):
-            # end of paragraph
-            if self.paragraph == None:
-                self.paragraph = ''
-            self.paragraph += self.accumulated
 
+    def _end_head(self, name):
+        self._append_section(self.accumulated)
+        self.section = self.section.getvalue()
+        local_paragraph = OrderedDict()
+        local_paragraph['text'] = self.section
+        
+        if self.ref_spans is not None and len(self.ref_spans) > 0:
+            local_paragraph['ref_spans'] = self.ref_spans
+
+        if self.annotations is not None:
+            if len(self.annotations) > 0:
+                local_paragraph["annotations"] = self.annotations
+
+        self._add_paragraph(local_paragraph)
+
+        self.ref_spans = None
+        self.annotations = None
+        self.in_head_section = False
+
+    def _end_div(self, name):
+        self.section = None
+
+    def _end_idno(self, name):
+        if self.idno_type != None:
+            self.document[self.idno_type] = self.accumulated
+            self.idno_type = None
+
+    def _end_hi(self, name):
+        if self.in_head_section:
+            self._append_section(self.accumulated)
+        else:
+            self._append_paragraph(self.accumulated)
+        if self.current_reference is not None:
+            self.current_reference_text.append(self.accumulated)
+
+    def _end_paragraph(self, name):
+        # end of paragraph
+        self._append_paragraph(self.accumulated)
+        paragraph = self.paragraph.getvalue()
+
+        local_paragraph = OrderedDict()
+        if self.section is not None:
+            local_paragraph['section'] = self.section
+        local_paragraph['text'] = paragraph
+        if self.ref_spans is not None and len(self.ref_spans) > 0:
+            local_paragraph['ref_spans'] = self.ref_spans
+        if self.list_spans is not None and len(self.list_spans) > 0:
+            local_paragraph['list_spans'] = self.list_spans
+        if self.formula_spans is not None and len(self.formula_spans) > 0:
+            local_paragraph['formula_spans'] = self.formula_spans
+        if self.annotations is not None and len(self.annotations) > 0:
+            local_paragraph["annotations"] = self.annotations
+
+        self._add_paragraph(local_paragraph)
+
+        self.paragraph = None
+        self.currentOffset = 0
+        self.is_footnote = False
+        self.ref_spans = None
+        self.formula_spans = None
+        self.list_spans = None
+        self.annotations = None
+
+    def _end_note(self, name):
+        if self.is_footnote:
+            self._end_paragraph(name)
+        else:
+            self._end_skipped(name)
+
+    def _end_abstract(self, name):
+        self.abstract = False
+
+    def _end_ref(self, name):
+        if self.in_head_section:
+            self._append_section(self.accumulated)
+        else:
+            self._append_paragraph(self.accumulated)
+
+        if self.current_reference is not None:
+            self.current_reference_text.append(self.accumulated)
+            self.current_reference["text"] = self.current_reference_text.getvalue()
+            self.current_reference["end"] = self.currentOffset + len(self.accumulated)
+            if self.ref_spans is None:
+                self.ref_spans = []
+            self.ref_spans.append(self.current_reference)
+        self.current_reference = None
+        self.current_reference_text = None
+
+    def _end_item(self, name):
+        self._append_paragraph(self.accumulated)
+        if self.current_item_list is not None:
+            self.current_item_list["end"] = self.currentOffset + len(self.accumulated)
+            if self.list_spans is not None:
+                self.list_spans.append(self.current_item_list)
+        self.current_item_list = None
+        if name == 'item':
+            self._append_paragraph('\n')
+        elif name == 'label':
+            self._append_paragraph(' ')
+        # the separator added after the item or label
+        self.currentOffset += 1
+
+    def _end_formula(self, name):
+        if self.current_formula is not None:
+            self.current_formula["end"] = self.currentOffset + len(self.accumulated)
+            if self.formula_spans is None:
+                self.formula_spans = []
+            self.formula_spans.append(self.current_formula)
+        self.current_formula = None
+
+        # at this point, if the formula appears outside a paragraph (GROBID TEI schema), we consider it as a 
+        # paragraph in the JSON output
+        if self.paragraph is None:
             local_paragraph = OrderedDict()
             if self.section is not None:
                 local_paragraph['section'] = self.section
-            local_paragraph['text'] = self.paragraph
-            if self.ref_spans is not None and len(self.ref_spans) > 0:
-                local_paragraph['ref_spans'] = self.ref_spans
-            if self.list_spans is not None and len(self.list_spans) > 0:
-                local_paragraph['list_spans'] = self.list_spans
+            local_paragraph['text'] = self.accumulated
             if self.formula_spans is not None and len(self.formula_spans) > 0:
                 local_paragraph['formula_spans'] = self.formula_spans
-            if self.annotations is not None and len(self.annotations) > 0:
-                local_paragraph["annotations"] = self.annotations
-            
-
-            if _is_not_empty(local_paragraph['text']):
-                if self.abstract:
-                    self.document["abstract"].append(local_paragraph)
-                elif self.document != None and "body_text" in self.document:
-                    self.document["body_text"].append(local_paragraph)
-
-            # Validating the reference offsets
-            if self.ref_spans is not None and _is_not_empty(local_paragraph['text']):
-                for reference in self.ref_spans:
-                    if self.paragraph[reference["start"]:reference["end"]] != reference['text']:
-                        print("The reference " + reference['text']
-                              + " offsets are not matching in paragraph '" + self.paragraph + "'. The offsets correspond to "
-                              + self.paragraph[reference["start"]:reference["end"]])
-                        print(local_paragraph)
-
-            self.paragraph = None
+            self._add_paragraph(local_paragraph)
             self.currentOffset = 0
-            self.is_footnote = False
-            self.ref_spans = None
-            self.formula_spans = None
-            self.list_spans = None
-            self.annotations = None
-
-        elif name == "abstract":
-            self.abstract = False
-        elif name == 'ref':
-            if self.in_head_section:
-                if self.section is None:
-                    self.section = self.accumulated
-                else:
-                    self.section += self.accumulated
-            else:
-                if self.paragraph == None:
-                    self.paragraph = ''
-                self.paragraph += self.accumulated
+            self.paragraph = None
+        else:
+            self.paragraph.append(self.accumulated)
 
-            if self.current_reference is not None:
-                self.current_reference["text"] = self.current_reference["text"] \
-                                                 + self.accumulated if 'text' in self.current_reference else self.accumulated
-                self.current_reference["end"] = self.currentOffset + len(self.accumulated)
-                if self.ref_spans is None:
-                    self.ref_spans = []
-                self.ref_spans.append(self.current_reference)
-            self.current_reference = None
-        elif name == 'item' or name == 'label':
-            if self.paragraph is None:
-                self.paragraph = ''
-            self.paragraph += self.accumulated
-            if self.current_item_list is not None:
-                self.current_item_list["end"] = self.currentOffset + len(self.accumulated)
-                if self.list_spans is not None:
-                    self.list_spans.append(self.current_item_list)
-            self.current_item_list = None
-            if name == 'item':
-                if self.paragraph == None:
-                    self.paragraph = '\n'
-                else:
-                    self.paragraph += '\n'
-            elif name == 'label':
-                if self.paragraph == None:
-                    self.paragraph = ' '
-                else:
-                    self.paragraph += ' '
-        elif name == 'formula':
-            if self.current_formula is not None:
-                self.current_formula["end"] = self.currentOffset + len(self.accumulated)
-                if self.formula_spans is None:
-                    self.formula_spans = []
-                self.formula_spans.append(self.current_formula)
-            self.current_formula = None
-
-            # at this point, if the formula appears outside a paragraph (GROBID TEI schema), we consider it as a 
-            # paragraph in the JSON output
-            if self.paragraph == None:
-                self.paragraph = self.accumulated
-                local_paragraph = OrderedDict()
-                if self.section is not None:
-                    local_paragraph['section'] = self.section
-                local_paragraph['text'] = self.paragraph
-                if self.formula_spans is not None and len(self.formula_spans) > 0:
-                    local_paragraph['formula_spans'] = self.formula_spans
-                if _is_not_empty(local_paragraph['text']):
-                    if self.abstract:
-                        self.document["abstract"].append(local_paragraph)
-                    elif "body_text" in self.document:
-                        self.document["body_text"].append(local_paragraph)
-                self.currentOffset = 0
-                self.paragraph = None
-            else:
-                self.paragraph += self.accumulated
-        elif name == 'mi' or name == 'mo' or name == "mn" or name == '<mrow>':
-            # these are the mathml only, chemical formulas are external files not considered here 
-            if self.paragraph == None:
-                self.paragraph = ''
-            self.paragraph += self.accumulated
-        elif name == 'rs':
-            self.annotation["text"] = self.accumulated
-            self.annotation["end"] = self.currentOffset + len(self.accumulated)
-            if self.annotations == None:
-                self.annotations = []
-            self.annotations.append(self.annotation)
-        elif name == 'title':
-            if self.document == None:
-                self.corpus['title'] = self.accumulated
-            else:
-                self.document['title'] = self.accumulated
-        elif name == 'resp':
-            self.resp["resp"] = self.accumulated
-        elif name == 'name':
-            self.resp["name"] = self.accumulated
-        elif name == 'respStmt':
-            if self.resps == None:
-                self.resps = []
-            if self.resp != None:
-                self.resps.append(self.resp)
-            self.resp = None
-        elif name =='teiCorpus':
-            if self.resps != None and len(self.resps)>0:
-                self.corpus["respStmt"] = self.resps
-                self.corpus.move_to_end('respStmt', last=False)
-            self.corpus.move_to_end('title', last=False)
+    def _end_math(self, name):
+        self._append_paragraph(self.accumulated)
+
+    def _end_rs(self, name):
+        # the annotated text is part of the paragraph (or section title) text
+        if self.in_head_section:
+            self._append_section(self.accumulated)
         else:
-            if self.skip:
-                self.currentOffset -= len(self.accumulated)
-                self.skip = False
-        # print("endElement '" + name + "'")
+            self._append_paragraph(self.accumulated)
+        if self.current_reference is not None:
+            self.current_reference_text.append(self.accumulated)
+        self.annotation["text"] = self.accumulated
+        self.annotation["end"] = self.currentOffset + len(self.accumulated)
+        if self.annotations == None:
+            self.annotations = []
+        self.annotations.append(self.annotation)
 
-        if name == 'item' or name == 'label':
-            self.currentOffset += len(self.accumulated) + 1
+    def _end_title(self, name):
+        if self.document == None:
+            self.corpus['title'] = self.accumulated
         else:
-            self.currentOffset += len(self.accumulated)
+            self.document['title'] = self.accumulated
 
-        self.accumulated = ''
+    def _end_resp(self, name):
+        self.resp["resp"] = self.accumulated
+
+    def _end_name(self, name):
+        self.resp["name"] = self.accumulated
+
+    def _end_resp_stmt(self, name):
+        if self.resps == None:
+            self.resps = []
+        if self.resp != None:
+            self.resps.append(self.resp)
+        self.resp = None
+
+    def _end_tei_corpus(self, name):
+        if self.resps != None and len(self.resps)>0:
+            self.corpus["respStmt"] = self.resps
+            self.corpus.move_to_end('respStmt', last=False)
+        self.corpus.move_to_end('title', last=False)
+
+    def _end_skipped(self, name):
+        if self.skip:
+            self.currentOffset -= len(self.accumulated)
+            self.skip = False
 
     def characters(self, content):
-        self.accumulated += content
+        # expat can deliver a text node in many pieces, they are only joined at the next element event
+        self.chunks.append(content)
+
+    def _flush_characters(self):
+        self.accumulated = ''.join(self.chunks)
+        # emptied in place, a parser backend may append to this list directly
+        self.chunks.clear()
+
+    def _add_paragraph(self, local_paragraph):
+        # add a non empty paragraph to the current document and validate its offsets if requested
+        if not _is_not_empty(local_paragraph['text']):
+            return
+        if self.abstract:
+            paragraphs = self.document["abstract"]
+            prefix = 'a'
+        elif self.document != None and "body_text" in self.document:
+            paragraphs = self.document["body_text"]
+            prefix = 'b'
+        else:
+            return
+        paragraphs.append(local_paragraph)
+        if self.validator is not None:
+            # same paragraph id as add_paragraph_ids()
+            self.validator.check_paragraph(local_paragraph, self.document.get("id"), prefix + str(len(paragraphs) - 1))
+        if self.statistics is not None:
+            self.statistics.add_paragraph(local_paragraph, "abstract" if self.abstract else 
+                                          "footnote" if self.is_footnote else "body")
+
+    def _append_paragraph(self, text):
+        if self.paragraph is None:
+            self.paragraph = TextBuffer()
+        self.paragraph.append(text)
+
+    def _append_section(self, text):
+        if self.section is None:
+            self.section = TextBuffer()
+        self.section.append(text)
 
     def getCorpus(self):
         return self.corpus
 
     def clear(self):  # clear the accumulator for re-use
         self.accumulated = ""
+        self.chunks.clear()
+
+class SpanValidator(object):
+    """
+    Validation of the span offsets of the converted paragraphs: the text of ref_spans and rs 
+    annotations must match the paragraph text at their offsets, list_spans and formula_spans must 
+    be within the paragraph. Level "full" checks every paragraph, level "sampled" one paragraph 
+    out of sample_rate. Checked spans and mismatches are counted per span type, and the first 
+    mismatches are kept for the report. 
+    """
+
+    LEVELS = ("off", "sampled", "full")
+    SPAN_TYPES = ("ref_spans", "annotations", "list_spans", "formula_spans")
+
+    def __init__(self, level="full", sample_rate=100, max_reported=1000):
+        if level not in SpanValidator.LEVELS:
+            raise ValueError("unknown validation level: " + level)
+        self.level = level
+        self.sample_rate = sample_rate if level == "sampled" else 1
+        self.max_reported = max_reported
+        self.paragraphs = 0
+        self.checked_paragraphs = 0
+        self.checked = OrderedDict((span_type, 0) for span_type in SpanValidator.SPAN_TYPES)
+        self.mismatches = OrderedDict((span_type, 0) for span_type in SpanValidator.SPAN_TYPES)
+        self.reported = []
+        # paragraphs seen before this validator, by the one it was forked from
+        self.sample_offset = 0
+
+    def check_paragraph(self, local_paragraph, document_id=None, paragraph_id=None):
+        self.paragraphs += 1
+        if (self.sample_offset + self.paragraphs - 1) % self.sample_rate != 0:
+            return
+        self.checked_paragraphs += 1
+        text = local_paragraph['text']
+        for span_type in SpanValidator.SPAN_TYPES:
+            if span_type not in local_paragraph:
+                continue
+            spans = local_paragraph[span_type]
+            self.checked[span_type] += len(spans)
+            for span in spans:
+                start = span.get("start")
+                end = span.get("end")
+                if start is None or end is None or not 0 <= start <= end <= len(text):
+                    self._mismatch(span_type, span, None, document_id, paragraph_id)
+                elif "text" in span and text[start:end] != span["text"]:
+                    self._mismatch(span_type, span, text[start:end], document_id, paragraph_id)
+
+    def _mismatch(self, span_type, span, found, document_id, paragraph_id):
+        self.mismatches[span_type] += 1
+        if len(self.reported) < self.max_reported:
+            mismatch = OrderedDict()
+            mismatch["document"] = document_id
+            mismatch["paragraph"] = paragraph_id
+            mismatch["span_type"] = span_type
+            mismatch["start"] = span.get("start")
+            mismatch["end"] = span.get("end")
+            mismatch["expected"] = span.get("text")
+            mismatch["found"] = found
+            self.reported.append(mismatch)
+
+    def check_document(self, document):
+        # check the paragraphs of a converted document, in the order in which the handler adds them
+        for key, prefix in (("abstract", "a"), ("body_text", "b")):
+            for i, paragraph in enumerate(document.get(key) or []):
+                self.check_paragraph(paragraph, document.get("id"), prefix + str(i))
+
+    def fork(self):
+        # empty validator going on with the sampling of this one, its counts are kept by merging it back
+        validator = SpanValidator(self.level, sample_rate=self.sample_rate, max_reported=self.max_reported)
+        validator.sample_offset = self.sample_offset + self.paragraphs
+        return validator
+
+    def merge(self, other):
+        # add the counts of another validator, for instance from a parallel worker
+        self.paragraphs += other.paragraphs
+        self.checked_paragraphs += other.checked_paragraphs
+        for span_type in SpanValidator.SPAN_TYPES:
+            self.checked[span_type] += other.checked[span_type]
+            self.mismatches[span_type] += other.mismatches[span_type]
+        self.reported.extend(other.reported[:max(0, self.max_reported - len(self.reported))])
+
+    def report(self):
+        report = OrderedDict()
+        report["level"] = self.level
+        report["sample_rate"] = self.sample_rate
+        report["paragraphs"] = self.paragraphs
+        report["checked_paragraphs"] = self.checked_paragraphs
+        report["checked_spans"] = self.checked
+        report["mismatches"] = self.mismatches
+        report["reported_mismatches"] = self.reported
+        return report
+
+    def summary(self):
+        return "validation (" + self.level + "): " + str(self.checked_paragraphs) + " paragraphs checked, " + \
+               str(sum(self.checked.values())) + " spans, " + str(sum(self.mismatches.values())) + " mismatches " + \
+               "(" + ", ".join(span_type + ": " + str(count) for span_type, count in self.mismatches.items()) + ")"
+
+    def save(self, report_file):
+        with open(report_file, 'w') as f:
+            json.dump(self.report(), f, indent=4)
+
+def create_validator(level="off", sample_rate=100):
+    # no validator at all for level "off", so that the handler does not pay any check
+    if level == "off":
+        return None
+    return SpanValidator(level, sample_rate=sample_rate)
+
+class CorpusStatistics(object):
+    """
+    Counters collected by the handler during the conversion: documents per subtype, paragraphs, 
+    whitespace-separated tokens, characters and <rs> annotations per zone (abstract, body, 
+    footnote), and <rs> mentions per type and subtype, with and without corresp link. With 
+    per_document, the counters of each document are kept as well. Statistics of parallel workers 
+    or of separate splits are combined with merge(), a saved report is read back with load(). 
+    """
+
+    ZONES = ("abstract", "body", "footnote")
+    FIELDS = ("paragraphs", "tokens", "characters", "annotations")
+
+    def __init__(self, per_document=False):
+        self.per_document = per_document
+        self.documents = 0
+        self.subtypes = OrderedDict()
+        self.zones = OrderedDict((zone, OrderedDict((field, 0) for field in CorpusStatistics.FIELDS)) 
+                                 for zone in CorpusStatistics.ZONES)
+        self.rs_types = OrderedDict()
+        self.document_counts = []
+        self.current = None
+
+    def add_paragraph(self, local_paragraph, zone):
+        text = local_paragraph['text']
+        tokens = len(text.split())
+        annotations = local_paragraph.get("annotations", ())
+        counts = self.zones[zone]
+        counts["paragraphs"] += 1
+        counts["tokens"] += tokens
+        counts["characters"] += len(text)
+        counts["annotations"] += len(annotations)
+        with_corresp = 0
+        for annotation in annotations:
+            rs_type = annotation.get("type", "none")
+            rs_counts = self.rs_types.get(rs_type)
+            if rs_counts is None:
+                rs_counts = self.rs_types[rs_type] = _rs_counts()
+            rs_counts["total"] += 1
+            if "corresp" in annotation:
+                rs_counts["with_corresp"] += 1
+                with_corresp += 1
+            else:
+                rs_counts["without_corresp"] += 1
+            if "subtype" in annotation:
+                subtypes = rs_counts["subtypes"]
+                subtypes[annotation["subtype"]] = subtypes.get(annotation["subtype"], 0) + 1
+
+        if self.per_document:
+            if self.current is None:
+                self.current = OrderedDict((field, 0) for field in CorpusStatistics.FIELDS)
+                self.current["with_corresp"] = 0
+                self.current["footnotes"] = 0
+                self.current["rs_types"] = OrderedDict()
+            self.current["paragraphs"] += 1
+            self.current["tokens"] += tokens
+            self.current["characters"] += len(text)
+            self.current["annotations"] += len(annotations)
+            self.current["with_corresp"] += with_corresp
+            if zone == "footnote":
+                self.current["footnotes"] += 1
+            for annotation in annotations:
+                rs_type = annotation.get("type", "none")
+                self.current["rs_types"][rs_type] = self.current["rs_types"].get(rs_type, 0) + 1
+
+    def add_document(self, document):
+        # called at the end of each document, after its paragraphs
+        self.documents += 1
+        subtype = document.get("subtype", "none")
+        self.subtypes[subtype] = self.subtypes.get(subtype, 0) + 1
+        if self.per_document:
+            counts = OrderedDict([("id", document.get("id")), ("subtype", subtype)])
+            if self.current is not None:
+                counts.update(self.current)
+            else:
+                counts.update((field, 0) for field in CorpusStatistics.FIELDS + ("with_corresp", "footnotes"))
+                counts["rs_types"] = OrderedDict()
+            self.document_counts.append(counts)
+        self.current = None
+
+    def merge(self, other):
+        # add the counts of other statistics, from a parallel worker or another split
+        self.documents += other.documents
+        for subtype, count in other.subtypes.items():
+            self.subtypes[subtype] = self.subtypes.get(subtype, 0) + count
+        for zone in CorpusStatistics.ZONES:
+            for field in CorpusStatistics.FIELDS:
+                self.zones[zone][field] += other.zones[zone][field]
+        for rs_type, other_counts in other.rs_types.items():
+            rs_counts = self.rs_types.get(rs_type)
+            if rs_counts is None:
+                rs_counts = self.rs_types[rs_type] = _rs_counts()
+            for key in ("total", "with_corresp", "without_corresp"):
+                rs_counts[key] += other_counts[key]
+            for subtype, count in other_counts["subtypes"].items():
+                rs_counts["subtypes"][subtype] = rs_counts["subtypes"].get(subtype, 0) + count
+        if self.per_document:
+            self.document_counts.extend(other.document_counts)
+
+    def report(self):
+        report = OrderedDict()
+        report["documents"] = self.documents
+        report["document_subtypes"] = self.subtypes
+        report["zones"] = self.zones
+        report["total"] = OrderedDict((field, sum(counts[field] for counts in self.zones.values())) 
+                                      for field in CorpusStatistics.FIELDS)
+        report["rs_types"] = self.rs_types
+        if self.per_document:
+            report["per_document"] = self.document_counts
+        return report
+
+    @staticmethod
+    def load(report_file):
+        # statistics saved as JSON, for merging the statistics of several runs
+        with open(report_file) as f:
+            report = json.load(f, object_pairs_hook=OrderedDict)
+        statistics = CorpusStatistics(per_document="per_document" in report)
+        statistics.documents = report["documents"]
+        statistics.subtypes = report["document_subtypes"]
+        statistics.zones = report["zones"]
+        statistics.rs_types = report["rs_types"]
+        statistics.document_counts = report.get("per_document", [])
+        return statistics
+
+    def rows(self):
+        # flat (counter, value) rows of the corpus level counters
+        rows = [("documents", self.documents)]
+        rows.extend(("document_subtypes." + subtype, count) for subtype, count in self.subtypes.items())
+        for zone, counts in self.zones.items():
+            rows.extend(("zones." + zone + "." + field, count) for field, count in counts.items())
+        for rs_type, counts in self.rs_types.items():
+            for key in ("total", "with_corresp", "without_corresp"):
+                rows.append(("rs_types." + rs_type + "." + key, counts[key]))
+            rows.extend(("rs_types." + rs_type + ".subtypes." + subtype, count) 
+                        for subtype, count in counts["subtypes"].items())
+        return rows
+
+    def summary(self):
+        total = self.report()["total"]
+        return "statistics: " + str(self.documents) + " documents, " + str(total["paragraphs"]) + " paragraphs, " + \
+               str(total["tokens"]) + " tokens, " + str(total["annotations"]) + " rs annotations " + \
+               "(" + ", ".join(rs_type + ": " + str(counts["total"]) for rs_type, counts in self.rs_types.items()) + ")"
+
+    def save(self, statistics_file):
+        """
+        Write the statistics as JSON, or as CSV (counter, value) if the file name ends with .csv
+        """
+        if statistics_file.endswith(".csv"):
+            with open(statistics_file, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(("counter", "value"))
+                writer.writerows(self.rows())
+        else:
+            with open(statistics_file, 'w') as f:
+                json.dump(self.report(), f, indent=4)
+
+    def save_per_document(self, csv_file):
+        # one row per document, with a column per rs type
+        rs_types = []
+        for counts in self.document_counts:
+            rs_types.extend(rs_type for rs_type in counts["rs_types"] if rs_type not in rs_types)
+        fields = ["id", "subtype"] + list(CorpusStatistics.FIELDS) + ["with_corresp", "footnotes"]
+        with open(csv_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(fields + ["rs." + rs_type for rs_type in rs_types])
+            for counts in self.document_counts:
+                writer.writerow([counts[field] for field in fields] + 
+                                [counts["rs_types"].get(rs_type, 0) for rs_type in rs_types])
+
+def _rs_counts():
+    return OrderedDict([("total", 0), ("with_corresp", 0), ("without_corresp", 0), ("subtypes", OrderedDict())])
+
+class ConversionProfiler(object):
+    """
+    Opt-in instrumentation of a conversion: number of handler callbacks and time per element 
+    name, time per phase (parse, handler, ids, serialize, write), and progress in documents and 
+    bytes read. The time of a phase nested in another one, like the writing of a streamed document 
+    within the handler of </TEI>, is only counted in the inner phase. Without a profiler, the 
+    conversion does not go through any of this. 
+    """
+
+    PHASES = ("parse", "handler", "ids", "serialize", "write")
+
+    def __init__(self, progress_interval=5.0):
+        self.phases = OrderedDict((phase, 0.0) for phase in ConversionProfiler.PHASES)
+        # element name -> [callbacks, seconds], text under #text
+        self.elements = {}
+        self.documents = 0
+        self.bytes_read = 0
+        # total time recorded in the phases, to subtract the nested phases from the enclosing one
+        self.recorded = 0.0
+        self.progress_interval = progress_interval
+        self.start = time.perf_counter()
+        self.last_progress = self.start
+
+    def instrument(self, handler):
+        """
+        Wrap the callbacks of a handler, to be done before creating its parser
+        """
+        start_element = handler.startElement
+        end_element = handler.endElement
+        characters = handler.characters
+
+        def timed_start_element(name, attrs):
+            recorded = self.recorded
+            start = time.perf_counter()
+            start_element(name, attrs)
+            self._add_element(name, time.perf_counter() - start - (self.recorded - recorded))
+
+        def timed_end_element(name):
+            recorded = self.recorded
+            start = time.perf_counter()
+            end_element(name)
+            self._add_element(name, time.perf_counter() - start - (self.recorded - recorded))
+            if name == 'TEI' or name == 'tei':
+                self.add_documents(1)
+
+        def timed_characters(content):
+            start = time.perf_counter()
+            characters(content)
+            self._add_element("#text", time.perf_counter() - start)
+
+        handler.startElement = timed_start_element
+        handler.endElement = timed_end_element
+        handler.characters = timed_characters
+        return handler
+
+    def _add_element(self, name, seconds):
+        timing = self.elements.get(name)
+        if timing is None:
+            timing = self.elements[name] = [0, 0.0]
+        timing[0] += 1
+        timing[1] += seconds
+        self.add_time("handler", seconds)
+
+    def add_time(self, phase, seconds):
+        self.phases[phase] += seconds
+        self.recorded += seconds
+
+    def timed(self, phase, function, *args, **kwargs):
+        # call the function and add its time, minus the nested phases, to the phase
+        recorded = self.recorded
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.add_time(phase, time.perf_counter() - start - (self.recorded - recorded))
+        return result
+
+    def add_documents(self, count):
+        self.documents += count
+        self._progress()
+
+    def add_bytes(self, count):
+        self.bytes_read += count
+        self._progress()
+
+    def _progress(self):
+        now = time.perf_counter()
+        if self.progress_interval is not None and now - self.last_progress >= self.progress_interval:
+            self.last_progress = now
+            print(self.progress())
+
+    def progress(self):
+        runtime = max(time.perf_counter() - self.start, 1e-9)
+        return "progress: %d documents, %.1f MB read, %.1f documents/s, %.2f MB/s" % (
+            self.documents, self.bytes_read / (1024 * 1024), self.documents / runtime, 
+            self.bytes_read / (1024 * 1024) / runtime)
+
+    def merge(self, other):
+        # add the counts of another profiler, for instance from a batch worker
+        for phase in ConversionProfiler.PHASES:
+            self.phases[phase] += other.phases[phase]
+        for name, (calls, seconds) in other.elements.items():
+            timing = self.elements.setdefault(name, [0, 0.0])
+            timing[0] += calls
+            timing[1] += seconds
+        self.documents += other.documents
+        self.bytes_read += other.bytes_read
+        self.recorded += other.recorded
+
+    def report(self):
+        report = OrderedDict()
+        report["documents"] = self.documents
+        report["bytes_read"] = self.bytes_read
+        report["phases"] = OrderedDict((phase, round(seconds, 4)) for phase, seconds in self.phases.items())
+        report["elements"] = OrderedDict()
+        for name, (calls, seconds) in sorted(self.elements.items(), key=lambda item: -item[1][1]):
+            report["elements"][name] = OrderedDict([("calls", calls), ("seconds", round(seconds, 4)), 
+                                                    ("microseconds_per_call", round(seconds * 1000000 / calls, 3))])
+        return report
+
+    def summary(self):
+        lines = [self.progress()]
+        total = sum(self.phases.values())
+        lines.append("%-16s %10s %7s" % ("phase", "seconds", "%"))
+        for phase, seconds in self.phases.items():
+            lines.append("%-16s %10.3f %6.1f%%" % (phase, seconds, seconds * 100.0 / total if total > 0 else 0.0))
+        lines.append("%-16s %10s %10s %10s" % ("element", "calls", "seconds", "us/call"))
+        for name, timing in self.report()["elements"].items():
+            lines.append("%-16s %10d %10.3f %10.2f" % (name, timing["calls"], timing["seconds"], 
+                                                        timing["microseconds_per_call"]))
+        return "\n".join(lines)
+
+class ConversionCache(object):
+    """
+    Content-addressed cache of convert_tei_string(), keyed by a hash of the input bytes, of the 
+    options changing the output and of the converter version, so that a modified converter never 
+    returns a stale conversion. The in-memory tier is a LRU bounded by the size of the cached 
+    strings, the optional disk tier keeps one file per entry under cache_dir/tei2json-cache/<version>/ 
+    and the entries of other converter versions are removed when the cache is opened. Only the 
+    tei2json-cache directory belongs to the cache, cache_dir can be a shared directory. 
+    """
+
+    def __init__(self, max_size=64*1024*1024, cache_dir=None, version=None):
+        self.max_size = max_size
+        self.version = version if version is not None else converter_version()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.counts = OrderedDict([("hits", 0), ("memory_hits", 0), ("disk_hits", 0), ("misses", 0), ("evictions", 0)])
+        self.cache_dir = None
+        if cache_dir is not None:
+            versions_dir = os.path.join(cache_dir, CACHE_DIRECTORY)
+            self.cache_dir = os.path.join(versions_dir, self.version)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for name in os.listdir(versions_dir):
+                if name != self.version and os.path.isdir(os.path.join(versions_dir, name)):
+                    shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+
+    def key(self, data, options):
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr(sorted(options.items())).encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.counts["hits"] += 1
+                self.counts["memory_hits"] += 1
+                return value
+        if self.cache_dir is not None:
+            try:
+                with open(self._entry_file(key), encoding='utf-8') as f:
+                    value = f.read()
+            except OSError:
+                value = None
+            if value is not None:
+                self._add(key, value)
+                with self.lock:
+                    self.counts["hits"] += 1
+                    self.counts["disk_hits"] += 1
+                return value
+        with self.lock:
+            self.counts["misses"] += 1
+        return None
+
+    def put(self, key, value):
+        self._add(key, value)
+        if self.cache_dir is not None:
+            entry_file = self._entry_file(key)
+            temporary_file = None
+            try:
+                os.makedirs(os.path.dirname(entry_file), exist_ok=True)
+                # written aside under a unique name and renamed, a concurrent reader never sees a partial 
+                # entry and concurrent writers of the same entry do not share their temporary file
+                descriptor, temporary_file = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(entry_file))
+                with open(descriptor, 'w', encoding='utf-8') as f:
+                    f.write(value)
+                os.replace(temporary_file, entry_file)
+            except OSError as e:
+                # the entry stays in the memory tier, the disk tier is only an optimization
+                print("warning: the conversion cache entry", entry_file, "could not be written:", e)
+                if temporary_file is not None and os.path.exists(temporary_file):
+                    os.remove(temporary_file)
+
+    def _add(self, key, value):
+        size = sys.getsizeof(value)
+        if size > self.max_size:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size -= sys.getsizeof(self.entries.pop(key))
+            self.entries[key] = value
+            self.size += size
+            while self.size > self.max_size:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= sys.getsizeof(evicted)
+                self.counts["evictions"] += 1
+
+    def _entry_file(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def clear(self):
+        # empty the memory tier, the disk tier is kept
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            stats = OrderedDict(self.counts)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+            stats["entries"] = len(self.entries)
+            stats["size"] = self.size
+            stats["max_size"] = self.max_size
+            stats["version"] = self.version
+            return stats
+
+_converter_version = None
+
+def converter_version():
+    """
+    Version of the converter used by the conversion cache: a hash of the converter source, which 
+    changes with any modification of the conversion code
+    """
+    global _converter_version
+    if _converter_version is None:
+        _converter_version = _file_hash(os.path.abspath(__file__))[:16]
+    return _converter_version
+
+class SaxBackend(object):
+    """
+    Parser backend using the xml.sax expat reader, the reference behaviour
+    """
+
+    name = "sax"
+
+    def __init__(self, handler):
+        self.parser = make_parser()
+        self.parser.setContentHandler(handler)
+
+    def feed(self, data):
+        self.parser.feed(data)
+
+    def close(self):
+        self.parser.close()
+
+class ExpatBackend(object):
+    """
+    Parser backend driving the handler directly from pyexpat, without the xml.sax layer: the 
+    handler methods are the expat callbacks and get the attributes as a plain dict. With 
+    buffer_text, expat delivers a text node in a few large pieces instead of one per line or entity. 
+    """
+
+    name = "expat"
+
+    # maximum size of the text pieces delivered by expat when buffer_text is set
+    buffer_size = 1024*1024
+
+    def __init__(self, handler):
+        self.parser = xml.parsers.expat.ParserCreate()
+        self.parser.buffer_text = True
+        self.parser.buffer_size = self.buffer_size
+        # expat attributes are a plain dict, used as is by the handler
+        self.parser.StartElementHandler = handler.startElement
+        self.parser.EndElementHandler = handler.endElement
+        if "characters" in vars(handler):
+            # instrumented by a ConversionProfiler
+            self.parser.CharacterDataHandler = handler.characters
+        else:
+            # same as handler.characters(), without a Python call per text node
+            self.parser.CharacterDataHandler = handler.chunks.append
+
+    def feed(self, data):
+        self.parser.Parse(data, False)
+
+    def close(self):
+        self.parser.Parse(b'', True)
+
+class LxmlBackend(object):
+    """
+    Parser backend replaying the events of the lxml pull parser (the incremental form of 
+    lxml.etree.iterparse) as SAX events. The text of an element, or the tail text following it, is 
+    only complete at the next event, so it is passed to characters() just before that event. Each 
+    <TEI> element is cleared once converted, with its previous siblings, to keep the tree small. 
+    """
+
+    name = "lxml"
+
+    def __init__(self, handler):
+        if etree is None:
+            raise ImportError("the lxml package is required for the lxml parser backend, install it with: pip install lxml")
+        self.handler = handler
+        self.parser = etree.XMLPullParser(events=("start", "end", "comment", "pi"), huge_tree=True)
+        # element whose text (or tail) has still to be delivered
+        self.pending = None
+        self.pending_tail = False
+        self.pending_tei = False
+        # qualified names as reported by the SAX reader without namespace processing, by (tag, prefix)
+        self.names = {}
+        # depth of the current element, None before the root element
+        self.depth = None
+
+    def feed(self, data):
+        self.parser.feed(data)
+        self._replay()
+
+    def close(self):
+        try:
+            self.parser.close()
+        except etree.XMLSyntaxError:
+            # libxml2 also reports validity errors ignored by expat, like invalid or duplicated xml:id 
+            # values, only at the end: well-formedness errors are raised by feed(), except for an 
+            # incomplete document
+            if self.depth != 0:
+                raise
+        self._replay()
+        if self.pending is not None:
+            self._flush_text()
+
+    def _replay(self):
+        handler = self.handler
+        for event, element in self.parser.read_events():
+            if self.pending is not None:
+                self._flush_text()
+            if event == "start":
+                handler.startElement(self._name(element), self._attributes(element))
+                self.pending_tail = False
+                self.depth = (self.depth or 0) + 1
+            elif event == "end":
+                self.depth -= 1
+                name = self._name(element)
+                handler.endElement(name)
+                self.pending_tail = True
+                self.pending_tei = (name == 'TEI' or name == 'tei')
+            else:
+                # comment or processing instruction, only the text following it is content
+                self.pending_tail = True
+            self.pending = element
+
+    def _flush_text(self):
+        element = self.pending
+        text = element.tail if self.pending_tail else element.text
+        if text:
+            self.handler.characters(text)
+        if self.pending_tei:
+            element.clear()
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+            self.pending_tei = False
+        self.pending = None
+
+    def _name(self, element):
+        tag = element.tag
+        if tag[0] != '{':
+            return tag
+        key = (tag, element.prefix)
+        name = self.names.get(key)
+        if name is None:
+            local_name = tag[tag.index('}')+1:]
+            name = key[1] + ':' + local_name if key[1] else local_name
+            self.names[key] = name
+        return name
+
+    def _attributes(self, element):
+        attrs = {}
+        for key, value in element.attrib.items():
+            if key[0] == '{':
+                namespace, local_name = key[1:].split('}', 1)
+                if namespace == XML_NAMESPACE:
+                    key = 'xml:' + local_name
+                else:
+                    prefixes = [prefix for prefix, uri in element.nsmap.items() if uri == namespace and prefix]
+                    key = prefixes[0] + ':' + local_name if prefixes else local_name
+            attrs[key] = value
+        return attrs
+
+# parser backends in order of preference for "auto", as measured by benchmark_backends.py: expat and sax parse 
+# at the same speed, the time being spent in the handler, but expat has the lower peak memory when streaming; 
+# replaying the lxml events in Python costs more than the tree building saves
+PARSER_BACKENDS = OrderedDict([("expat", ExpatBackend), ("sax", SaxBackend), ("lxml", LxmlBackend)])
+DEFAULT_BACKEND = "auto"
+
+def available_backends():
+    return [name for name in PARSER_BACKENDS if name != "lxml" or etree is not None]
+
+def create_parser(handler, backend=DEFAULT_BACKEND):
+    """
+    Parser driving the given handler with the selected backend, "auto" being the first one 
+    available in PARSER_BACKENDS. All the backends produce the same events for the handler, so the same output. 
+    The parser is fed with bytes and closed at the end of the input. 
+    """
+    if backend == "auto":
+        backend = available_backends()[0]
+    if backend not in PARSER_BACKENDS:
+        raise ValueError("unknown parser backend: " + backend)
+    return PARSER_BACKENDS[backend](handler)
+
+def parse_tei(tei_file, handler, backend=DEFAULT_BACKEND, chunk_size=1024*1024, profiler=None):
+    """
+    Parse a TEI file, given by path or as a binary file object, with the handler, optionally 
+    instrumented by a ConversionProfiler
+    """
+    if profiler is not None:
+        profiler.instrument(handler)
+    parser = create_parser(handler, backend)
+    with open(tei_file, 'rb') if isinstance(tei_file, str) else contextlib.nullcontext(tei_file) as tei:
+        while True:
+            chunk = tei.read(chunk_size)
+            if not chunk:
+                break
+            if profiler is not None:
+                profiler.add_bytes(len(chunk))
+                profiler.timed("parse", parser.feed, chunk)
+            else:
+                parser.feed(chunk)
+    if profiler is not None:
+        profiler.timed("parse", parser.close)
+    else:
+        parser.close()
+
+def _untimed(phase, function, *args, **kwargs):
+    # stand-in for ConversionProfiler.timed() when profiling is disabled
+    return function(*args, **kwargs)
+
+class _TimedOutput(object):
+    """
+    Output file wrapper adding the time of the writes to the "write" phase of a profiler
+    """
+
+    def __init__(self, outfile, profiler):
+        self.outfile = outfile
+        self.profiler = profiler
+
+    def write(self, data):
+        return self.profiler.timed("write", self.outfile.write, data)
+
+    def __getattr__(self, name):
+        return getattr(self.outfile, name)
 
 def _is_not_empty(string):
     if string == None:
@@ -431,33 +1370,692 @@ def _is_not_empty(string):
     string = string.strip(' \n\r\t')
     return (len(string) != 0)
 
-def convert_tei_string(stringXml):
+def convert_tei_string(stringXml, backend=DEFAULT_BACKEND, cache=None):
+    """
+    Convert a TEI string (or bytes) into an indented JSON string. With a ConversionCache, an input 
+    already converted is returned from the cache without parsing. 
+    """
+    data = stringXml.encode('utf-8') if isinstance(stringXml, str) else stringXml
+    if cache is not None:
+        # the backends give the same output, only the output options are part of the key
+        key = cache.key(data, {"indent": 4})
+        result = cache.get(key)
+        if result is not None:
+            return result
     # as we have XML mixed content, we need a real XML parser...
-    parser = make_parser()
     handler = TEIContentHandler()
-    parser.setContentHandler(handler)
-    parser.parseString(stringXml)
+    parser = create_parser(handler, backend)
+    parser.feed(data)
+    parser.close()
     corpus = handler.getCorpus()
-    return json.dumps(corpus, indent=4)
+    result = json.dumps(corpus, indent=4)
+    if cache is not None:
+        cache.put(key, result)
+    return result
+
+def convert_tei_file(tei_file, output_path=None, workers=1, output_format="json", compression=None, index=False, 
+                     observers=None, validator=None, backend=DEFAULT_BACKEND, profiler=None, error_dir=None, 
+                     resume=False, statistics=None):
+    """
+    Convert a TEI corpus file into the given output format. The observers are objects with an 
+    add_document(document) method, called with each converted document in corpus order, for 
+    computing additional outputs in the same pass. The optional SpanValidator checks the span 
+    offsets of the paragraphs during the parse. The backend is the XML parser used, see 
+    PARSER_BACKENDS. The optional ConversionProfiler records where the time goes, the optional 
+    CorpusStatistics collects counters of the converted documents. 
+
+    With an error_dir, the conversion is resilient: a <TEI> document which fails is quarantined 
+    in error_dir and the conversion goes on with the next one (see iter_tei_documents_resilient). 
+    """
+    if output_format in STREAMING_FORMATS:
+        return convert_tei_file_streaming(tei_file, output_path, workers=workers, output_format=output_format, 
+                                          compression=compression, index=index, observers=observers, 
+                                          validator=validator, backend=backend, profiler=profiler, 
+                                          error_dir=error_dir, resume=resume, statistics=statistics)
+    check_output_format(output_format, compression)
+    if index:
+        raise ValueError("the index is only available for an uncompressed jsonl output")
+    if resume:
+        raise ValueError("resuming a conversion is only available for an uncompressed streaming output")
 
-def convert_tei_file(tei_file, output_path=None):
-    # as we have XML mixed content, we need a real XML parser...
-    parser = make_parser()
-    handler = TEIContentHandler()
-    parser.setContentHandler(handler)
     print(tei_file)
-    parser.parse(tei_file)
-    corpus = handler.getCorpus()
+    if error_dir is not None:
+        _warn_resilient_options(workers, profiler)
+        corpus = _parse_tei_file_resilient(tei_file, error_dir, validator=validator, backend=backend, 
+                                           statistics=statistics)
+    elif workers > 1:
+        corpus = _parse_tei_file_parallel(tei_file, workers, validator=validator, backend=backend, profiler=profiler, 
+                                          statistics=statistics)
+    else:
+        # as we have XML mixed content, we need a real XML parser...
+        handler = TEIContentHandler(validator=validator, statistics=statistics)
+        parse_tei(tei_file, handler, backend=backend, profiler=profiler)
+        corpus = handler.getCorpus()
+
+    if observers:
+        for document in corpus["documents"]:
+            for observer in observers:
+                observer.add_document(document)
+
+    timed = profiler.timed if profiler is not None else _untimed
+    timed("ids", add_paragraph_ids, corpus)
+
+    output_file = _output_file(tei_file, output_path, output_extension(output_format, compression))
+    print(output_file)
+    write_converted_corpus(corpus, output_file, output_format=output_format, compression=compression, profiler=profiler)
+    if validator is not None:
+        print(validator.summary())
+    if statistics is not None:
+        print(statistics.summary())
+    if profiler is not None:
+        print(profiler.summary())
+
+def write_converted_corpus(corpus, output_file, output_format="json", compression=None, profiler=None):
+    """
+    Write an already converted corpus in the given format, for the streaming formats 
+    only the documents are written
+    """
+    check_output_format(output_format, compression)
+    timed = profiler.timed if profiler is not None else _untimed
+    if output_format in STREAMING_FORMATS:
+        encode_document = document_encoder(output_format)
+        with open_output(output_file, compression) as outfile:
+            for document in corpus["documents"]:
+                timed("write", outfile.write, timed("serialize", encode_document, document))
+        return
+
+    with io.TextIOWrapper(open_output(output_file, compression), encoding='utf-8') as outfile:
+        # json.dump writes while serializing, the writes are timed separately
+        output = _TimedOutput(outfile, profiler) if profiler is not None else outfile
+        if output_format == "compact":
+            timed("serialize", json.dump, corpus, output, separators=(',', ':'))
+        else:
+            timed("serialize", json.dump, corpus, output, indent=4)
+
+def convert_tei_file_streaming(tei_file, output_path=None, workers=1, output_format="jsonl", compression=None, 
+                               index=False, observers=None, validator=None, backend=DEFAULT_BACKEND, profiler=None, 
+                               error_dir=None, resume=False, statistics=None):
+    """
+    Convert a TEI corpus file into JSON Lines (one document per line), or a sequence of MessagePack 
+    or CBOR documents. Each document is written as soon as its closing </TEI> is parsed, so memory 
+    depends on the largest document and not on the size of the corpus. Corpus-level metadata 
+    (title, respStmt) is not part of the output. 
+
+    With index, an uncompressed JSON Lines output gets a sidecar index file with the byte offsets 
+    of every document and paragraph (see corpus_index.py for reading it). 
+
+    With an error_dir, the conversion is resilient, see convert_tei_file_resilient(). 
+    """
+    if error_dir is not None:
+        if index:
+            raise ValueError("the index is not available in resilient mode")
+        _warn_resilient_options(workers, profiler)
+        return convert_tei_file_resilient(tei_file, error_dir, output_path, output_format=output_format, 
+                                          compression=compression, resume=resume, observers=observers, 
+                                          validator=validator, backend=backend, statistics=statistics)
+    if resume:
+        raise ValueError("resuming a conversion requires an error directory (resilient mode)")
+    check_output_format(output_format, compression)
+    if output_format not in STREAMING_FORMATS:
+        raise ValueError("not a streaming output format: " + output_format)
+    if index and (output_format != "jsonl" or compression is not None):
+        raise ValueError("the index is only available for an uncompressed jsonl output")
+    encode_document = document_encoder(output_format)
+
+    output_file = _output_file(tei_file, output_path, output_extension(output_format, compression))
+    print(tei_file)
+    print(output_file)
+    index_writer = CorpusIndexWriter() if index else None
+    timed = profiler.timed if profiler is not None else _untimed
+    with open_output(output_file, compression) as outfile:
+        def write_document(document):
+            timed("ids", add_paragraph_ids, document)
+            if observers:
+                for observer in observers:
+                    observer.add_document(document)
+            if index_writer is not None:
+                line = timed("serialize", index_writer.add_document, document)
+            else:
+                line = timed("serialize", encode_document, document)
+            timed("write", outfile.write, line)
+
+        ranges = scan_tei_documents(tei_file) if workers > 1 else []
+        if len(ranges) > 1:
+            for documents, _ in _map_tei_ranges(tei_file, ranges, workers, validator=validator, backend=backend, 
+                                                profiler=profiler, statistics=statistics):
+                for document in documents:
+                    write_document(document)
+        else:
+            handler = TEIContentHandler(document_sink=write_document, validator=validator, statistics=statistics)
+            parse_tei(tei_file, handler, backend=backend, profiler=profiler)
+
+    if index_writer is not None:
+        print(output_file + INDEX_EXTENSION)
+        index_writer.save(output_file + INDEX_EXTENSION)
+    if validator is not None:
+        print(validator.summary())
+    if statistics is not None:
+        print(statistics.summary())
+    if profiler is not None:
+        print(profiler.summary())
+
+class CorpusIndexWriter(object):
+    """
+    Build the index of a JSON Lines output while it is written: byte offset and length of each 
+    document line, document position by id and by idno value (DOI, PMC, etc.), and offset and 
+    length of each paragraph relatively to its document line
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.documents = []
+        self.ids = OrderedDict()
+        self.idnos = OrderedDict()
+        self.paragraphs = []
+
+    def add_document(self, document):
+        """
+        Encode the document as a JSON line (same bytes as json.dumps) and index it, return the line
+        """
+        position = len(self.documents)
+        line, paragraphs = _encode_json_line(document)
+        self.documents.append([self.offset, len(line)])
+        self.paragraphs.append(paragraphs)
+        if "id" in document:
+            self.ids[document["id"]] = position
+        for key, value in document.items():
+            # other string fields are idno captured in endElement('idno')
+            if key not in DOCUMENT_FIELDS and isinstance(value, str):
+                if key not in self.idnos:
+                    self.idnos[key] = OrderedDict()
+                self.idnos[key][value] = position
+        self.offset += len(line)
+        return line
+
+    def save(self, index_file):
+        index = OrderedDict()
+        index["documents"] = self.documents
+        index["ids"] = self.ids
+        index["idno"] = self.idnos
+        index["paragraphs"] = self.paragraphs
+        with open(index_file, 'w') as f:
+            json.dump(index, f)
+
+def _encode_json_line(document):
+    """
+    Serialize a document exactly like json.dumps() followed by a new line, while recording the 
+    position and length of the abstract and body paragraphs in the line. json.dumps escapes 
+    non-ASCII characters, so character positions are byte positions. 
+    """
+    parts = ['{']
+    paragraphs = OrderedDict()
+    position = 1
+    for i, (key, value) in enumerate(document.items()):
+        if i > 0:
+            parts.append(', ')
+            position += 2
+        encoded_key = json.dumps(key) + ': '
+        parts.append(encoded_key)
+        position += len(encoded_key)
+        if (key == "abstract" or key == "body_text") and isinstance(value, list):
+            parts.append('[')
+            position += 1
+            for j, paragraph in enumerate(value):
+                if j > 0:
+                    parts.append(', ')
+                    position += 2
+                encoded_paragraph = json.dumps(paragraph)
+                if "id" in paragraph:
+                    paragraphs[paragraph["id"]] = [position, len(encoded_paragraph)]
+                parts.append(encoded_paragraph)
+                position += len(encoded_paragraph)
+            parts.append(']')
+            position += 1
+        else:
+            encoded_value = json.dumps(value)
+            parts.append(encoded_value)
+            position += len(encoded_value)
+    parts.append('}\n')
+    return ''.join(parts).encode('utf-8'), paragraphs
+
+def iter_tei_documents(tei_file, chunk_size=1024*1024, validator=None, backend=DEFAULT_BACKEND, statistics=None):
+    """
+    Generator over the converted documents of a TEI corpus file, documents are yielded 
+    while the file is still being parsed
+    """
+    documents = deque()
+    handler = TEIContentHandler(document_sink=documents.append, validator=validator, statistics=statistics)
+    parser = create_parser(handler, backend)
+    with open(tei_file, 'rb') as tei:
+        while True:
+            chunk = tei.read(chunk_size)
+            if not chunk:
+                break
+            parser.feed(chunk)
+            while documents:
+                yield documents.popleft()
+    parser.close()
+    while documents:
+        yield documents.popleft()
+
+def iter_converted_documents(input_file):
+    """
+    Generator over the documents of a converted file, the format and compression are given 
+    by the file extension (for instance .jsonl, .msgpack.zst or .json.gz)
+    """
+    compression = None
+    name = input_file
+    for compression_name, extension in COMPRESSIONS.items():
+        if name.endswith(extension):
+            compression = compression_name
+            name = name[:-len(extension)]
+    with open_input(input_file, compression) as infile:
+        if name.endswith(".jsonl"):
+            for line in infile:
+                if line.strip():
+                    yield json.loads(line, object_pairs_hook=OrderedDict)
+        elif name.endswith(".msgpack"):
+            _check_module(msgpack, "msgpack")
+            for document in msgpack.Unpacker(infile, raw=False):
+                yield document
+        elif name.endswith(".cbor"):
+            _check_module(cbor2, "cbor2")
+            decoder = cbor2.CBORDecoder(infile)
+            while True:
+                try:
+                    yield decoder.decode()
+                except cbor2.CBORDecodeEOF:
+                    break
+        else:
+            corpus = json.load(infile, object_pairs_hook=OrderedDict)
+            for document in corpus["documents"] if "documents" in corpus else []:
+                yield document
+
+def document_encoder(output_format):
+    if output_format == "jsonl":
+        return lambda document: json.dumps(document).encode('utf-8') + b'\n'
+    elif output_format == "msgpack":
+        return msgpack.packb
+    elif output_format == "cbor":
+        return cbor2.dumps
+
+def output_extension(output_format, compression=None):
+    return OUTPUT_FORMATS[output_format] + (COMPRESSIONS[compression] if compression is not None else '')
+
+def check_output_format(output_format, compression=None):
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError("unknown output format: " + output_format)
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError("unknown compression: " + compression)
+    if output_format == "msgpack":
+        _check_module(msgpack, "msgpack")
+    elif output_format == "cbor":
+        _check_module(cbor2, "cbor2")
+    if compression == "zstd":
+        _check_module(zstandard, "zstandard")
+
+def _check_module(module, name):
+    if module is None:
+        raise ImportError("the " + name + " package is required for this format, install it with: pip install " + name)
+
+def open_output(output_file, compression=None):
+    # binary output stream, compressed or not
+    if compression == "gzip":
+        return gzip.open(output_file, 'wb')
+    elif compression == "zstd":
+        return zstandard.open(output_file, 'wb')
+    return open(output_file, 'wb')
+
+def open_input(input_file, compression=None):
+    # decompressed streams are buffered for line iteration and the many small reads of the binary decoders
+    if compression == "gzip":
+        return io.BufferedReader(gzip.open(input_file, 'rb'), buffer_size=1024*1024)
+    elif compression == "zstd":
+        _check_module(zstandard, "zstandard")
+        return io.BufferedReader(zstandard.open(input_file, 'rb'), buffer_size=1024*1024)
+    return open(input_file, 'rb')
+
+def scan_tei_documents(tei_file):
+    """
+    Fast byte-level scan of a teiCorpus file returning the (start, end) byte offsets of every 
+    <TEI> document, without XML parsing. Mark-up in comments or CDATA sections is not expected. 
+    """
+    if os.path.getsize(tei_file) == 0:
+        return []
+    with open(tei_file, 'rb') as tei:
+        with mmap.mmap(tei.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return list(iter_tei_ranges(data))
+
+def iter_tei_ranges(data):
+    """
+    Generator over the (start, end) byte offsets of the <TEI> documents in the bytes (or mmap) of 
+    a teiCorpus file, as scan_tei_documents(), yielding each document as soon as its end is found
+    """
+    position = 0
+    while True:
+        start_match = TEI_START_PATTERN.search(data, position)
+        if start_match is None:
+            return
+        end_match = TEI_END_PATTERN.search(data, start_match.end())
+        if end_match is None:
+            return
+        yield start_match.start(), end_match.end()
+        position = end_match.end()
+
+def tei_prolog(prefix):
+    """
+    Prolog of a teiCorpus file, given the bytes before its first <TEI> document: the XML declaration 
+    with the encoding, and the document type declaration whose internal subset declares the entities 
+    used in the documents. It is repeated before each document parsed separately. 
+    """
+    return TEI_PROLOG_PATTERN.match(prefix).group(0)
+
+def read_tei_prolog(tei_file, start):
+    # prolog of a teiCorpus file whose first <TEI> document starts at the given byte offset
+    with open(tei_file, 'rb') as tei:
+        return tei_prolog(tei.read(start))
+
+def parse_tei_fragment(prolog, fragment, backend=DEFAULT_BACKEND, validator=None, statistics=None):
+    """
+    Convert a <TEI> document of a teiCorpus file parsed on its own, given as the bytes of the 
+    element, after the prolog of the corpus (see tei_prolog()). Return the converted documents and 
+    the respStmt found in the fragment. The parse has its own handler, so an error leaves no state 
+    behind except in the optional validator and statistics. 
+    """
+    documents = []
+    handler = TEIContentHandler(document_sink=documents.append, validator=validator, statistics=statistics)
+    parser = create_parser(handler, backend)
+    parser.feed(prolog)
+    parser.feed(fragment)
+    parser.close()
+    return documents, handler.resps or []
+
+def _parse_tei_file_parallel(tei_file, workers, validator=None, backend=DEFAULT_BACKEND, profiler=None, statistics=None):
+    """
+    Parse a teiCorpus file with a pool of processes, each <TEI> document being converted 
+    separately. The corpus header is parsed in the main process and the documents are merged 
+    in their original order, so the result is identical to the one of a single parse.
+    """
+    ranges = scan_tei_documents(tei_file)
+    handler = TEIContentHandler(validator=validator, statistics=statistics)
+    if len(ranges) < 2:
+        parse_tei(tei_file, handler, backend=backend, profiler=profiler)
+        return handler.getCorpus()
+
+    with open(tei_file, 'rb') as tei:
+        prefix = tei.read(ranges[0][0])
+        tei.seek(ranges[-1][1])
+        suffix = tei.read()
+
+    # corpus header, then the documents converted by the workers, then the end of the corpus
+    parser = create_parser(handler, backend)
+    parser.feed(prefix)
+    for documents, resps in _map_tei_ranges(tei_file, ranges, workers, validator=validator, backend=backend, 
+                                            profiler=profiler, statistics=statistics):
+        handler.corpus["documents"].extend(documents)
+        if resps:
+            if handler.resps == None:
+                handler.resps = []
+            handler.resps.extend(resps)
+    parser.feed(suffix)
+    parser.close()
+    return handler.getCorpus()
+
+def _map_tei_ranges(tei_file, ranges, workers, validator=None, backend=DEFAULT_BACKEND, profiler=None, statistics=None):
+    """
+    Convert the documents at the given byte ranges with a pool of worker processes, yield the 
+    converted documents (and the respStmt found in them) batch by batch in the original order. 
+    The validation counts and statistics of the workers are merged into validator and statistics. With a profiler, the 
+    time waiting for the workers is counted as parse time, the handler runs in the workers. 
+
+    A sampled validation depends on the position of the paragraphs in the whole corpus, unknown to the workers, so the 
+    documents are then checked here in corpus order, giving the same counts as a serial conversion. 
+    """
+    prolog = read_tei_prolog(tei_file, ranges[0][0])
+    batch_size = max(1, len(ranges) // (workers * 8))
+    sampled = validator is not None and validator.sample_rate > 1
+    validation = (validator.level, validator.sample_rate) if validator is not None and not sampled else None
+    per_document = statistics.per_document if statistics is not None else None
+    tasks = [(tei_file, prolog, ranges[i:i+batch_size], validation, backend, per_document) 
+             for i in range(0, len(ranges), batch_size)]
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.imap(_convert_tei_ranges, tasks)
+        for task in tasks:
+            if profiler is not None:
+                documents, resps, worker_validator, worker_statistics = profiler.timed("parse", next, results)
+                profiler.add_bytes(sum(end - start for start, end in task[2]))
+                profiler.add_documents(len(documents))
+            else:
+                documents, resps, worker_validator, worker_statistics = next(results)
+            if worker_validator is not None:
+                validator.merge(worker_validator)
+            elif sampled:
+                for document in documents:
+                    validator.check_document(document)
+            if worker_statistics is not None:
+                statistics.merge(worker_statistics)
+            yield documents, resps
+
+def _convert_tei_ranges(task):
+    # worker side: parse each document fragment separately
+    tei_file, prolog, ranges, validation, backend, per_document = task
+    documents = []
+    resps = []
+    validator = SpanValidator(validation[0], sample_rate=validation[1]) if validation is not None else None
+    statistics = CorpusStatistics(per_document) if per_document is not None else None
+    with open(tei_file, 'rb') as tei:
+        for start, end in ranges:
+            tei.seek(start)
+            fragment_documents, fragment_resps = parse_tei_fragment(prolog, tei.read(end - start), backend=backend, 
+                                                                    validator=validator, statistics=statistics)
+            documents.extend(fragment_documents)
+            resps.extend(fragment_resps)
+    return documents, resps, validator, statistics
+
+def iter_tei_documents_resilient(tei_file, error_dir, start_offset=0, validator=None, backend=DEFAULT_BACKEND, 
+                                 statistics=None):
+    """
+    Generator over the <TEI> documents of a teiCorpus file, each one parsed separately, yielding 
+    (index, end offset, documents, respStmt found in the document) with empty lists for a document 
+    which failed. A failing document is quarantined in error_dir: its fragment as 
+    <file>.<index>.tei.xml, and the exception with its byte offset as <file>.<index>.error.json. 
+    Its validation counts and statistics are dropped with it. Documents starting before 
+    start_offset are skipped, for resuming an interrupted conversion. 
+    """
+    ranges = scan_tei_documents(tei_file)
+    if not ranges:
+        return
+    with open(tei_file, 'rb') as tei:
+        prolog = tei_prolog(tei.read(ranges[0][0]))
+        for index, (start, end) in enumerate(ranges):
+            if start < start_offset:
+                continue
+            tei.seek(start)
+            fragment = tei.read(end - start)
+            document_validator = validator.fork() if validator is not None else None
+            document_statistics = CorpusStatistics(statistics.per_document) if statistics is not None else None
+            try:
+                documents, resps = parse_tei_fragment(prolog, fragment, backend=backend, validator=document_validator, 
+                                                      statistics=document_statistics)
+            except Exception as e:
+                _quarantine(error_dir, tei_file, index, start, end, prolog + fragment, e)
+                documents, resps = [], []
+            else:
+                # the counts of a failed document are dropped with it
+                if validator is not None:
+                    validator.merge(document_validator)
+                if statistics is not None:
+                    statistics.merge(document_statistics)
+            yield index, end, documents, resps
+
+def _warn_resilient_options(workers, profiler):
+    # the documents are parsed one by one in the main process, without the parse instrumentation
+    if workers > 1:
+        print("warning: the resilient mode converts the documents of a file one by one, the workers are not used")
+    if profiler is not None:
+        print("warning: the resilient mode does not profile the parse of the documents")
+
+def _quarantine(error_dir, tei_file, index, start, end, fragment, exception):
+    os.makedirs(error_dir, exist_ok=True)
+    name = os.path.join(error_dir, "%s.%d" % (tei_file_stem(tei_file), index))
+    with open(name + ".tei.xml", 'wb') as f:
+        f.write(fragment)
+    error = OrderedDict()
+    error["tei_file"] = tei_file
+    error["index"] = index
+    error["offset"] = start
+    error["end"] = end
+    error["exception"] = type(exception).__name__
+    error["message"] = str(exception)
+    error["traceback"] = traceback.format_exception(type(exception), exception, exception.__traceback__)
+    with open(name + ".error.json", 'w') as f:
+        json.dump(error, f, indent=4)
+    print("document", index, "at byte offset", start, "failed, quarantined in", name + ".tei.xml:", exception)
+
+def _parse_tei_file_resilient(tei_file, error_dir, validator=None, backend=DEFAULT_BACKEND, statistics=None):
+    # corpus header and end parsed as in _parse_tei_file_parallel, the documents one by one
+    ranges = scan_tei_documents(tei_file)
+    handler = TEIContentHandler(validator=validator)
+    with open(tei_file, 'rb') as tei:
+        prefix = tei.read(ranges[0][0]) if ranges else tei.read()
+        tei.seek(ranges[-1][1] if ranges else len(prefix))
+        suffix = tei.read()
+    parser = create_parser(handler, backend)
+    parser.feed(prefix)
+    failed = 0
+    for _, _, documents, resps in iter_tei_documents_resilient(tei_file, error_dir, validator=validator, 
+                                                               backend=backend, statistics=statistics):
+        failed += 0 if documents else 1
+        handler.corpus["documents"].extend(documents)
+        if resps:
+            if handler.resps == None:
+                handler.resps = []
+            handler.resps.extend(resps)
+    parser.feed(suffix)
+    parser.close()
+    print("documents converted:", len(handler.corpus["documents"]), "failed:", failed)
+    return handler.getCorpus()
+
+def convert_tei_file_resilient(tei_file, error_dir, output_path=None, output_format="jsonl", compression=None, 
+                               resume=False, observers=None, validator=None, backend=DEFAULT_BACKEND, 
+                               checkpoint_interval=100, statistics=None):
+    """
+    Convert a TEI corpus file into a streaming format, quarantining the documents which fail in 
+    error_dir instead of aborting. Every checkpoint_interval documents, the output is flushed and a 
+    checkpoint next to it records the byte offset of the last completed document and the size of 
+    the output. With resume, an interrupted conversion of the same input goes on from there, the 
+    output being truncated to its size at the checkpoint; this needs an uncompressed output. The 
+    checkpoint is removed once the conversion is complete. Return the numbers of converted and 
+    failed documents. When resuming, observers and statistics only see the remaining documents. 
+    """
+    check_output_format(output_format, compression)
+    if output_format not in STREAMING_FORMATS:
+        raise ValueError("not a streaming output format: " + output_format)
+    if resume and compression is not None:
+        raise ValueError("resuming a conversion is only available for an uncompressed streaming output")
+    encode_document = document_encoder(output_format)
+
+    output_file = _output_file(tei_file, output_path, output_extension(output_format, compression))
+    checkpoint_file = output_file + CHECKPOINT_EXTENSION
+    print(tei_file)
+    print(output_file)
+
+    stat = os.stat(tei_file)
+    state = OrderedDict([("tei_file", ntpath.basename(tei_file)), ("size", stat.st_size), ("mtime", stat.st_mtime), 
+                         ("output_format", output_format)])
+    checkpoint = _load_checkpoint(checkpoint_file) if resume else None
+    if checkpoint is not None and any(checkpoint.get(key) != value for key, value in state.items()):
+        print("the input or the output format changed since the checkpoint, converting from the start")
+        checkpoint = None
+
+    if checkpoint is not None and os.path.isfile(output_file):
+        # the documents written after the checkpoint are written again
+        with open(output_file, 'r+b') as outfile:
+            outfile.truncate(checkpoint["output_size"])
+        outfile = open(output_file, 'ab')
+        converted, failed, start_offset = checkpoint["documents"], checkpoint["failed"], checkpoint["offset"]
+        print("resuming after", converted + failed, "documents, at byte offset", start_offset)
+    else:
+        outfile = open_output(output_file, compression)
+        converted, failed, start_offset = 0, 0, 0
+
+    completed = False
+    # offset, counts and output size after the last completed document, updated together: an interrupt 
+    # in the middle of a document leaves them consistent with each other
+    last_state = (start_offset, converted, failed, outfile.tell() if compression is None else 0)
+    try:
+        since_checkpoint = 0
+        for index, end, documents, _ in iter_tei_documents_resilient(tei_file, error_dir, start_offset=start_offset, 
+                                                                     validator=validator, backend=backend, 
+                                                                     statistics=statistics):
+            if not documents:
+                failed += 1
+            for document in documents:
+                add_paragraph_ids(document)
+                if observers:
+                    for observer in observers:
+                        observer.add_document(document)
+                outfile.write(encode_document(document))
+                converted += 1
+            if compression is None:
+                last_state = (end, converted, failed, outfile.tell())
+            since_checkpoint += 1
+            if since_checkpoint >= checkpoint_interval and compression is None:
+                since_checkpoint = 0
+                outfile.flush()
+                _save_checkpoint(checkpoint_file, state, *last_state)
+        completed = True
+    finally:
+        if not completed and compression is None:
+            # interrupted: the output is consistent up to the last completed document, a partly written 
+            # one is truncated when resuming
+            outfile.flush()
+            _save_checkpoint(checkpoint_file, state, *last_state)
+        outfile.close()
+    if completed and os.path.isfile(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    print("documents converted:", converted, "failed:", failed)
+    if validator is not None:
+        print(validator.summary())
+    if statistics is not None:
+        print(statistics.summary())
+    return converted, failed
+
+def _load_checkpoint(checkpoint_file):
+    if not os.path.isfile(checkpoint_file):
+        return None
+    with open(checkpoint_file) as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
 
-    add_paragraph_ids(corpus)
+def _save_checkpoint(checkpoint_file, state, offset, converted, failed, output_size):
+    checkpoint = OrderedDict(state)
+    checkpoint["offset"] = offset
+    checkpoint["documents"] = converted
+    checkpoint["failed"] = failed
+    checkpoint["output_size"] = output_size
+    with open(checkpoint_file + ".tmp", 'w') as f:
+        json.dump(checkpoint, f, indent=4)
+    os.replace(checkpoint_file + ".tmp", checkpoint_file)
 
+def tei_file_stem(tei_file):
+    # file name without the directory and the .tei.xml or .xml extension
+    stem = ntpath.basename(tei_file)
+    for extension in (".tei.xml", ".xml"):
+        if stem.endswith(extension):
+            return stem[:-len(extension)]
+    return stem
+
+def _output_file(tei_file, output_path, extension):
+    if tei_file.endswith(".tei.xml"):
+        output_file = tei_file.replace(".tei.xml", extension)
+    else:
+        # never overwrite an input file not following the .tei.xml naming
+        output_file = os.path.splitext(tei_file)[0] + extension
     if output_path is None:
-        output_file = tei_file.replace(".tei.xml", ".json")
+        return output_file
     else:
-        output_file = os.path.join(output_path, ntpath.basename(tei_file).replace(".tei.xml", ".json"))
-    print(output_file)
-    with open(output_file, 'w') as outfile:
-        json.dump(corpus, outfile, indent=4)
+        return os.path.join(output_path, ntpath.basename(output_file))
 
 def add_paragraph_ids(document):
     id = 0
@@ -472,13 +2070,156 @@ def add_paragraph_ids(document):
 
     return document
 
-def convert_batch_tei_files(path_to_tei_files, output_path=None):
-    for file in os.listdir(path_to_tei_files):
+def convert_batch_tei_files(path_to_tei_files, output_path=None, stream=False, workers=1, incremental=False, 
+                            output_format="json", compression=None, index=False, validation="off", sample_rate=100, 
+                            validation_report=None, backend=DEFAULT_BACKEND, profile=False, error_dir=None, 
+                            resume=False, statistics=None):
+    """
+    Convert all the .xml files of a directory. With several workers, the files are converted in 
+    parallel by a pool of processes. In incremental mode, a manifest in the output directory records 
+    size, modification time and content hash of each converted input, with the converter version 
+    and the output options, and files unchanged since their last conversion by the same converter 
+    with the same options, and with an existing output, are skipped. The validation counts of all 
+    the converted files are merged into a single report, and so are the profiles with profile and 
+    the counters of each file into statistics, a CorpusStatistics. With an error_dir, each file is converted in resilient mode (see convert_tei_file_resilient). 
+    """
+    if output_path is None:
+        output_path = path_to_tei_files
+    if stream:
+        output_format = "jsonl"
+    check_output_format(output_format, compression)
+    extension = output_extension(output_format, compression)
+    manifest = _load_manifest(output_path) if incremental else {}
+    options = _conversion_options(output_format, compression, index)
+
+    tei_files = []
+    skipped = 0
+    for file in sorted(os.listdir(path_to_tei_files)):
         if file.endswith(".xml"):
-            if output_path is None:
-                convert_tei_file(os.path.join(path_to_tei_files, file), path_to_tei_files)
+            tei_file = os.path.join(path_to_tei_files, file)
+            output_file = _output_file(tei_file, output_path, extension)
+            if incremental and _is_up_to_date(manifest.get(file), tei_file, output_file, options) and \
+                    (not index or os.path.isfile(output_file + INDEX_EXTENSION)):
+                skipped += 1
             else:
-                convert_tei_file(os.path.join(path_to_tei_files, file), output_path)
+                tei_files.append(tei_file)
+
+    # files are converted in parallel, except if there is a single one, then its documents are
+    parallel_files = workers > 1 and len(tei_files) > 1
+    file_workers = 1 if parallel_files else workers
+    tasks = [(tei_file, output_path, file_workers, output_format, compression, index, validation, sample_rate, backend, 
+              profile, error_dir, resume, statistics.per_document if statistics is not None else None) 
+             for tei_file in tei_files]
+    validator = create_validator(validation, sample_rate)
+    profiler = ConversionProfiler(progress_interval=None) if profile else None
+
+    converted = 0
+    failed = 0
+    converted_bytes = 0
+    start = time.time()
+    pool = multiprocessing.Pool(workers) if parallel_files else None
+    try:
+        results = pool.imap_unordered(_convert_batch_file, tasks) if pool is not None else map(_convert_batch_file, tasks)
+        for tei_file, entry, error, file_validator, file_profiler, file_statistics in results:
+            if error is not None:
+                print("conversion of", tei_file, "failed:", error)
+                failed += 1
+            else:
+                converted += 1
+                converted_bytes += entry["size"]
+                manifest[ntpath.basename(tei_file)] = entry
+                if file_validator is not None:
+                    validator.merge(file_validator)
+                if file_profiler is not None:
+                    profiler.merge(file_profiler)
+                if file_statistics is not None:
+                    statistics.merge(file_statistics)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if incremental:
+            _save_manifest(output_path, manifest)
+    runtime = time.time() - start
+
+    print("files converted:", converted, "skipped:", skipped, "failed:", failed)
+    print("total runtime: %.2f seconds, %.2f MB/s" % (runtime, (converted_bytes / (1024 * 1024)) / runtime if runtime > 0 else 0))
+    if validator is not None:
+        print(validator.summary())
+        if validation_report is not None:
+            validator.save(validation_report)
+    if profiler is not None:
+        print(profiler.summary())
+    if statistics is not None:
+        print(statistics.summary())
+    return converted, skipped, failed
+
+def _convert_batch_file(task):
+    tei_file, output_path, workers, output_format, compression, index, validation, sample_rate, backend, profile, \
+        error_dir, resume, per_document = task
+    # input state is taken before the conversion, a file modified meanwhile will be converted again next time
+    entry = _file_state(tei_file)
+    validator = create_validator(validation, sample_rate)
+    profiler = ConversionProfiler(progress_interval=None) if profile else None
+    statistics = CorpusStatistics(per_document) if per_document is not None else None
+    try:
+        convert_tei_file(tei_file, output_path, workers=workers, output_format=output_format, compression=compression, 
+                         index=index, validator=validator, backend=backend, profiler=profiler, error_dir=error_dir, 
+                         resume=resume, statistics=statistics)
+    except Exception as e:
+        return tei_file, None, str(e), None, None, None
+    output_file = _output_file(tei_file, output_path, output_extension(output_format, compression))
+    entry["output"] = ntpath.basename(output_file)
+    entry["output_mtime"] = os.path.getmtime(output_file)
+    entry["conversion"] = _conversion_options(output_format, compression, index)
+    return tei_file, entry, None, validator, profiler, statistics
+
+def _conversion_options(output_format, compression, index):
+    # what an output depends on besides its input, a change of converter or of options converts again
+    return OrderedDict([("version", converter_version()), ("output_format", output_format), 
+                        ("compression", compression), ("index", index)])
+
+def _file_state(path):
+    stat = os.stat(path)
+    return OrderedDict([("size", stat.st_size), ("mtime", stat.st_mtime), ("sha1", _file_hash(path))])
+
+def _file_hash(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024*1024), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def _is_up_to_date(entry, tei_file, output_file, options):
+    if entry is None or entry.get("output") != ntpath.basename(output_file):
+        return False
+    if entry.get("conversion") != options:
+        return False
+    if not os.path.isfile(output_file) or os.path.getmtime(output_file) != entry.get("output_mtime"):
+        return False
+    stat = os.stat(tei_file)
+    if stat.st_size != entry["size"]:
+        return False
+    if stat.st_mtime == entry["mtime"]:
+        return True
+    # touched but possibly not modified, the content hash decides
+    if _file_hash(tei_file) == entry["sha1"]:
+        entry["mtime"] = stat.st_mtime
+        return True
+    return False
+
+def _load_manifest(output_path):
+    manifest_file = os.path.join(output_path, MANIFEST_FILE)
+    if not os.path.isfile(manifest_file):
+        return {}
+    with open(manifest_file) as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
+
+def _save_manifest(output_path, manifest):
+    manifest_file = os.path.join(output_path, MANIFEST_FILE)
+    with open(manifest_file + ".tmp", 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(manifest_file + ".tmp", manifest_file)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -488,11 +2229,64 @@ if __name__ == "__main__":
     parser.add_argument("--output", type=str,
                         help="path to an output directory where to write the converted TEI XML file, "
                              "default is the same directory as the input file")
+    parser.add_argument("--stream", action="store_true",
+                        help="write documents one per line in JSON Lines format as soon as they are parsed, "
+                             "with bounded memory usage, same as --format jsonl")
+    parser.add_argument("--format", type=str, default="json", choices=list(OUTPUT_FORMATS.keys()),
+                        help="output format: indented JSON (default), compact JSON, JSON Lines, or a sequence of "
+                             "MessagePack or CBOR documents (requires msgpack or cbor2), the three last ones are streamed")
+    parser.add_argument("--compress", type=str, choices=list(COMPRESSIONS.keys()),
+                        help="compress the output with gzip or zstd (requires zstandard)")
+    parser.add_argument("--index", action="store_true",
+                        help="with the jsonl format, also write a sidecar index of the document and paragraph offsets "
+                             "for random access (see corpus_index.py)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes converting the documents of a teiCorpus file, or the files of a "
+                             "directory, in parallel, default is 1")
+    parser.add_argument("--incremental", action="store_true",
+                        help="with --tei-corpus, skip the files unchanged since their last conversion, based on a "
+                             "manifest written in the output directory")
+    parser.add_argument("--validation", type=str, default="sampled", choices=list(SpanValidator.LEVELS),
+                        help="validation of the span offsets against the paragraph texts: off, sampled (one paragraph "
+                             "out of --sample-rate, default) or full")
+    parser.add_argument("--sample-rate", type=int, default=100,
+                        help="with --validation sampled, one paragraph out of this number is checked, default is 100")
+    parser.add_argument("--validation-report", type=str,
+                        help="path to a JSON file where to write the validation counts and mismatches")
+    parser.add_argument("--backend", type=str, default=DEFAULT_BACKEND, choices=["auto"] + list(PARSER_BACKENDS.keys()),
+                        help="XML parser backend: expat, lxml (requires lxml) or sax, all giving the same output, "
+                             "default is auto, expat")
+    parser.add_argument("--profile", action="store_true",
+                        help="show the progress and print the number of handler callbacks and the time per element and "
+                             "per phase (parse, handler, ids, serialize, write) at the end of the conversion")
+    parser.add_argument("--error-dir", type=str,
+                        help="resilient mode: the <TEI> documents which fail to convert are written in this directory "
+                             "with their error and byte offset, and the conversion goes on with the next document")
+    parser.add_argument("--resume", action="store_true",
+                        help="with --error-dir and an uncompressed streaming format, resume an interrupted conversion "
+                             "from its last checkpoint")
+    parser.add_argument("--statistics", type=str,
+                        help="path to a JSON file, or a CSV file with a .csv extension, where to write the counts of "
+                             "documents, paragraphs, tokens, characters and rs annotations per type, subtype and zone")
 
     args = parser.parse_args()
     tei_file = args.tei_file
     tei_corpus_path = args.tei_corpus
     output_path = args.output
+    output_format = "jsonl" if args.stream else args.format
+    compression = args.compress
+    index = args.index
+    workers = args.workers
+    incremental = args.incremental
+    validation = args.validation
+    sample_rate = args.sample_rate
+    validation_report = args.validation_report
+    backend = args.backend
+    profile = args.profile
+    error_dir = args.error_dir
+    resume = args.resume
+    statistics_file = args.statistics
+    statistics = CorpusStatistics() if statistics_file is not None else None
 
     # check path and call methods
     if tei_file is not None:
@@ -500,14 +2294,28 @@ if __name__ == "__main__":
             print("the path to the TEI XML file is not valid: ", tei_file)
             exit(-1)
         else:
-            convert_tei_file(tei_file, output_path)
+            validator = create_validator(validation, sample_rate)
+            profiler = ConversionProfiler() if profile else None
+            convert_tei_file(tei_file, output_path, workers=workers, output_format=output_format, compression=compression, 
+                             index=index, validator=validator, backend=backend, profiler=profiler, 
+                             error_dir=error_dir, resume=resume, statistics=statistics)
+            if validator is not None and validation_report is not None:
+                validator.save(validation_report)
+            if statistics is not None:
+                statistics.save(statistics_file)
             exit(1)
     elif tei_corpus_path is not None:
         if not os.path.isdir(tei_corpus_path):
             print("the path to the directory of TEI files is not valid: ", tei_corpus_path)
             exit(-1)
         else:
-            convert_batch_tei_files(tei_corpus_path, output_path=output_path)
+            convert_batch_tei_files(tei_corpus_path, output_path=output_path, workers=workers, 
+                                    incremental=incremental, output_format=output_format, compression=compression, 
+                                    index=index, validation=validation, sample_rate=sample_rate, 
+                                    validation_report=validation_report, backend=backend, profile=profile, 
+                                    error_dir=error_dir, resume=resume, statistics=statistics)
+            if statistics is not None:
+                statistics.save(statistics_file)
             exit(1)
     else:
         print("The supplied arguments were not sufficient. ")
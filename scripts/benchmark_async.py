@@ -0,0 +1,101 @@
+"""
+    Load test of the asyncio interface: many concurrent convert() requests of single documents,
+    as an ingestion service would receive them, with a pool of threads or of processes. For each
+    level of concurrency, the throughput, the latency of the requests and the largest delay of the
+    event loop (a heartbeat task which should run every 10 ms) are reported.
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from TEI2LossyJSON import scan_tei_documents
+from synthetic_tei import generate_tei_corpus
+from tei2json_async import AsyncConverter
+
+HEARTBEAT_INTERVAL = 0.01
+
+def load_requests(tei_file):
+    # each document wrapped in the corpus header and end, one request body per document
+    ranges = scan_tei_documents(tei_file)
+    with open(tei_file, 'rb') as tei:
+        data = tei.read()
+    header = data[:ranges[0][0]]
+    end = data[ranges[-1][1]:]
+    return [header + data[start:end_offset] + end for start, end_offset in ranges]
+
+async def _heartbeat(lags, stop):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + HEARTBEAT_INTERVAL
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        lags.append(loop.time() - expected)
+
+async def run_load(converter, requests, concurrency, total):
+    """
+    Send `total` requests, at most `concurrency` of them at the same time
+    """
+    latencies = []
+    lags = []
+    stop = asyncio.Event()
+    clients = asyncio.Semaphore(concurrency)
+
+    async def request(body):
+        async with clients:
+            start = time.perf_counter()
+            await converter.convert(body)
+            latencies.append(time.perf_counter() - start)
+
+    heartbeat = asyncio.create_task(_heartbeat(lags, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(request(requests[i % len(requests)]) for i in range(total)))
+    runtime = time.perf_counter() - start
+    stop.set()
+    await heartbeat
+
+    latencies.sort()
+    return (total / runtime, _percentile(latencies, 50), _percentile(latencies, 95), _percentile(latencies, 99),
+            max(lags) if lags else 0.0)
+
+def _percentile(values, percentile):
+    return values[min(len(values) - 1, int(len(values) * percentile / 100))]
+
+async def main(requests, levels, total, workers):
+    print("%-8s %8s %10s %10s %10s %10s %14s" % ("pool", "clients", "req/s", "p50 (ms)", "p95 (ms)", "p99 (ms)",
+                                                   "loop lag (ms)"))
+    for processes in (False, True):
+        async with AsyncConverter(workers=workers, processes=processes) as converter:
+            # warm-up, the processes are started on first use
+            await asyncio.gather(*(converter.convert(body) for body in requests[:workers * 2]))
+            for concurrency in levels:
+                throughput, p50, p95, p99, lag = await run_load(converter, requests, concurrency, total)
+                print("%-8s %8d %10.1f %10.1f %10.1f %10.1f %14.1f" % ("process" if processes else "thread",
+                      concurrency, throughput, p50 * 1000, p95 * 1000, p99 * 1000, lag * 1000))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load test of the asyncio conversion interface with concurrent single document requests")
+    parser.add_argument("--tei-file", type=str, help="teiCorpus file whose documents are the requests, default is a generated one")
+    parser.add_argument("--documents", type=int, default=200, help="number of documents of the generated corpus")
+    parser.add_argument("--requests", type=int, default=1000, help="number of requests per level of concurrency")
+    parser.add_argument("--concurrency", type=str, default="1,8,64,256",
+                        help="comma-separated numbers of concurrent clients")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="size of the thread and process pools")
+
+    args = parser.parse_args()
+
+    work_path = tempfile.mkdtemp()
+    try:
+        tei_file = args.tei_file
+        if tei_file is None:
+            tei_file = generate_tei_corpus(os.path.join(work_path, "synthetic.tei.xml"), documents=args.documents)
+        requests = load_requests(tei_file)
+    finally:
+        shutil.rmtree(work_path)
+
+    print(len(requests), "distinct requests, %.1f KB on average" % (sum(len(body) for body in requests) / len(requests) / 1024))
+    levels = [int(level) for level in args.concurrency.split(",")]
+    asyncio.run(main(requests, levels, args.requests, args.workers))
@@ -0,0 +1,69 @@
+"""
+    Benchmark of the XML parser backends of the converter: parse time and peak memory of each
+    backend available in the environment, and check that all the backends give the same output
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from TEI2LossyJSON import TEIContentHandler, available_backends, parse_tei
+from synthetic_tei import generate_tei_corpus
+
+def run_backend(task):
+    # run in a fresh process, so that the peak memory is the one of this backend only
+    tei_file, backend, repeat = task
+    times = []
+    for _ in range(repeat):
+        handler = TEIContentHandler()
+        start = time.perf_counter()
+        parse_tei(tei_file, handler, backend=backend)
+        times.append(time.perf_counter() - start)
+    output = json.dumps(handler.getCorpus())
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return min(times), peak_memory, output
+
+def run_streaming_backend(task):
+    # documents are dropped once converted, the memory left is the one of the parser
+    tei_file, backend = task
+    handler = TEIContentHandler(document_sink=lambda document: None)
+    start = time.perf_counter()
+    parse_tei(tei_file, handler, backend=backend)
+    runtime = time.perf_counter() - start
+    return runtime, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the parse time and memory of the XML parser backends on a teiCorpus file")
+    parser.add_argument("--tei-file", type=str, help="teiCorpus file to parse, default is a generated one")
+    parser.add_argument("--documents", type=int, default=500, help="number of documents of the generated corpus")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs per backend, the best time is kept")
+
+    args = parser.parse_args()
+
+    work_path = tempfile.mkdtemp()
+    try:
+        tei_file = args.tei_file
+        if tei_file is None:
+            tei_file = generate_tei_corpus(os.path.join(work_path, "synthetic.tei.xml"), documents=args.documents)
+        size = os.path.getsize(tei_file) / (1024 * 1024)
+        print("corpus:", tei_file, "- %.1f MB" % size)
+
+        reference = None
+        print("%-8s %10s %10s %14s %16s %10s" % ("backend", "parse (s)", "MB/s", "peak (MB)", "stream peak (MB)", "output"))
+        for backend in available_backends():
+            with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+                runtime, peak_memory, output = pool.apply(run_backend, ((tei_file, backend, args.repeat),))
+            with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+                _, stream_peak_memory = pool.apply(run_streaming_backend, ((tei_file, backend),))
+            if reference is None:
+                reference = output
+            print("%-8s %10.3f %10.2f %14.1f %16.1f %10s" % (backend, runtime, size / runtime, peak_memory,
+                                                            stream_peak_memory, "same" if output == reference else "DIFFERENT"))
+    finally:
+        shutil.rmtree(work_path)
@@ -0,0 +1,160 @@
+"""
+    Benchmark of the converter on a synthetic teiCorpus (or a given corpus file): documents/s,
+    MB/s and peak memory of convert_tei_string() and convert_tei_file(), and time spent in the
+    handler per element type. The results are written in a JSON file, which can be compared with
+    the results of a previous run to spot regressions.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import OrderedDict
+
+from TEI2LossyJSON import (ConversionProfiler, TEIContentHandler, convert_tei_file, convert_tei_string, parse_tei,
+                           scan_tei_documents, DEFAULT_BACKEND)
+from synthetic_tei import generate_tei_corpus
+
+# throughput metrics compared between two runs, higher is better except for the memory
+COMPARED_METRICS = ("documents_per_second", "mb_per_second", "peak_rss_mb")
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_convert_string(tei_file, backend):
+    with open(tei_file, encoding='utf-8') as f:
+        tei_string = f.read()
+    start = time.perf_counter()
+    convert_tei_string(tei_string, backend=backend)
+    return time.perf_counter() - start, _peak_rss_mb()
+
+def run_convert_file(tei_file, backend, output_format):
+    output_path = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            convert_tei_file(tei_file, output_path, output_format=output_format, backend=backend)
+        return time.perf_counter() - start, _peak_rss_mb()
+    finally:
+        shutil.rmtree(output_path)
+
+def run_profile(tei_file, backend):
+    profiler = ConversionProfiler(progress_interval=None)
+    parse_tei(tei_file, TEIContentHandler(document_sink=lambda document: None), backend=backend, profiler=profiler)
+    return profiler.report()
+
+def _run_isolated(function, *args):
+    # each run in a fresh process, so that the peak memory is the one of this run only
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(function, args)
+
+def run_benchmark(tei_file, backend=DEFAULT_BACKEND, repeat=3):
+    """
+    Run the benchmarks on a corpus file, the best time of the repeated runs is kept
+    """
+    documents = len(scan_tei_documents(tei_file))
+    size_mb = os.path.getsize(tei_file) / (1024 * 1024)
+
+    runs = OrderedDict()
+    scenarios = OrderedDict([("convert_tei_string", (run_convert_string, tei_file, backend)),
+                             ("convert_tei_file", (run_convert_file, tei_file, backend, "json")),
+                             ("convert_tei_file_streaming", (run_convert_file, tei_file, backend, "jsonl"))])
+    for name, scenario in scenarios.items():
+        results = [_run_isolated(*scenario) for _ in range(repeat)]
+        seconds = min(result[0] for result in results)
+        runs[name] = OrderedDict([("seconds", round(seconds, 4)),
+                                  ("documents_per_second", round(documents / seconds, 2)),
+                                  ("mb_per_second", round(size_mb / seconds, 2)),
+                                  ("peak_rss_mb", round(max(result[1] for result in results), 1))])
+
+    profile = _run_isolated(run_profile, tei_file, backend)
+
+    results = OrderedDict()
+    results["commit"] = _git_commit()
+    results["date"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    results["python"] = platform.python_version()
+    results["backend"] = backend
+    results["corpus"] = OrderedDict([("file", os.path.basename(tei_file)), ("documents", documents),
+                                     ("mb", round(size_mb, 2))])
+    results["runs"] = runs
+    results["phases"] = profile["phases"]
+    results["elements"] = profile["elements"]
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(previous, results):
+    """
+    Print the relative change of the throughput metrics against a previous results file
+    """
+    print("compared with", previous.get("commit"), "of", previous.get("date"))
+    if previous.get("corpus") != results["corpus"]:
+        print("warning: the corpus differs from the one of the previous results")
+    print("%-28s %-22s %12s %12s %9s" % ("run", "metric", "previous", "current", "change"))
+    for name, metrics in results["runs"].items():
+        if name not in previous.get("runs", {}):
+            continue
+        for metric in COMPARED_METRICS:
+            old_value = previous["runs"][name][metric]
+            new_value = metrics[metric]
+            change = (new_value - old_value) * 100.0 / old_value if old_value else 0.0
+            print("%-28s %-22s %12.2f %12.2f %+8.1f%%" % (name, metric, old_value, new_value, change))
+
+def print_results(results):
+    corpus = results["corpus"]
+    print("corpus:", corpus["file"], "-", corpus["documents"], "documents, %.1f MB" % corpus["mb"])
+    print("%-28s %10s %10s %10s %12s" % ("run", "seconds", "docs/s", "MB/s", "peak (MB)"))
+    for name, metrics in results["runs"].items():
+        print("%-28s %10.3f %10.1f %10.2f %12.1f" % (name, metrics["seconds"], metrics["documents_per_second"],
+                                                    metrics["mb_per_second"], metrics["peak_rss_mb"]))
+    print("%-28s %10s" % ("phase (profiled run)", "seconds"))
+    for phase, seconds in results["phases"].items():
+        print("%-28s %10.3f" % (phase, seconds))
+    print("%-28s %10s %10s %10s" % ("element", "calls", "seconds", "us/call"))
+    for name, timing in results["elements"].items():
+        print("%-28s %10d %10.3f %10.2f" % (name, timing["calls"], timing["seconds"], timing["microseconds_per_call"]))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the converter on a synthetic teiCorpus and write the results in a JSON file")
+    parser.add_argument("--tei-file", type=str, help="use this teiCorpus file instead of a generated one")
+    parser.add_argument("--documents", type=int, default=500, help="number of documents of the generated corpus")
+    parser.add_argument("--grobid", action="store_true", help="generate GROBID-style sections and formulas")
+    parser.add_argument("--backend", type=str, default=DEFAULT_BACKEND, help="XML parser backend, default is auto")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs per benchmark, the best time is kept")
+    parser.add_argument("--output", type=str, help="path to the JSON file where to write the results")
+    parser.add_argument("--compare", type=str, help="path to the JSON results of a previous run to compare with")
+
+    args = parser.parse_args()
+
+    work_path = tempfile.mkdtemp()
+    try:
+        tei_file = args.tei_file
+        if tei_file is None:
+            tei_file = generate_tei_corpus(os.path.join(work_path, "synthetic.tei.xml"), documents=args.documents,
+                                           grobid=args.grobid, figures=1 if args.grobid else 0)
+        results = run_benchmark(tei_file, backend=args.backend, repeat=args.repeat)
+    finally:
+        shutil.rmtree(work_path)
+
+    print_results(results)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare_results(json.load(f, object_pairs_hook=OrderedDict), results)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+        print("results written in", args.output)
@@ -0,0 +1,74 @@
+"""
+    Benchmark of the output formats of the converter on a generated corpus: write time,
+    read time and size for each format and compression available in the environment
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from xml.sax import make_parser
+
+import TEI2LossyJSON
+from TEI2LossyJSON import (TEIContentHandler, add_paragraph_ids, iter_converted_documents, write_converted_corpus,
+                           OUTPUT_FORMATS, COMPRESSIONS)
+from synthetic_tei import generate_tei_corpus
+
+def available_formats():
+    formats = [output_format for output_format in OUTPUT_FORMATS
+               if not (output_format == "msgpack" and TEI2LossyJSON.msgpack is None)
+               and not (output_format == "cbor" and TEI2LossyJSON.cbor2 is None)]
+    compressions = [None, "gzip"] + (["zstd"] if TEI2LossyJSON.zstandard is not None else [])
+    return formats, compressions
+
+def load_corpus(tei_file):
+    parser = make_parser()
+    handler = TEIContentHandler()
+    parser.setContentHandler(handler)
+    with contextlib.redirect_stdout(io.StringIO()):
+        parser.parse(tei_file)
+    corpus = handler.getCorpus()
+    for document in corpus["documents"]:
+        add_paragraph_ids(document)
+    return corpus
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare write time, read time and size of the converter output formats on a generated corpus")
+    parser.add_argument("--documents", type=int, default=500, help="number of documents of the generated corpus")
+    parser.add_argument("--tei-file", type=str, help="use this teiCorpus file instead of a generated one")
+
+    args = parser.parse_args()
+
+    work_path = tempfile.mkdtemp()
+    try:
+        tei_file = args.tei_file
+        if tei_file is None:
+            tei_file = generate_tei_corpus(os.path.join(work_path, "synthetic.tei.xml"), documents=args.documents)
+        corpus = load_corpus(tei_file)
+        print("corpus:", tei_file, "-", len(corpus["documents"]), "documents,",
+              "%.1f MB" % (os.path.getsize(tei_file) / (1024 * 1024)))
+
+        formats, compressions = available_formats()
+        print("%-10s %-6s %10s %10s %10s" % ("format", "comp.", "write (s)", "read (s)", "size (MB)"))
+        for output_format in formats:
+            for compression in compressions:
+                output_file = os.path.join(work_path, "corpus" + OUTPUT_FORMATS[output_format] +
+                                           (COMPRESSIONS[compression] if compression is not None else ''))
+                start = time.perf_counter()
+                write_converted_corpus(corpus, output_file, output_format=output_format, compression=compression)
+                write_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                documents = sum(1 for _ in iter_converted_documents(output_file))
+                read_time = time.perf_counter() - start
+                assert documents == len(corpus["documents"])
+
+                print("%-10s %-6s %10.3f %10.3f %10.2f" % (output_format, compression or "-", write_time, read_time,
+                                                          os.path.getsize(output_file) / (1024 * 1024)))
+                os.remove(output_file)
+    finally:
+        shutil.rmtree(work_path)
@@ -0,0 +1,59 @@
+"""
+    Benchmark of the parallel conversion of a teiCorpus file: convert the corpus with an
+    increasing number of worker processes, check that the JSON output is identical to the
+    serial conversion and report the speedup
+"""
+
+import argparse
+import contextlib
+import filecmp
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from TEI2LossyJSON import convert_tei_file, _output_file
+
+def time_conversion(tei_file, output_path, workers):
+    start = time.perf_counter()
+    # the converter reports the processed files on stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        convert_tei_file(tei_file, output_path, workers=workers)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the parallel conversion of a teiCorpus file with different numbers of workers")
+    parser.add_argument("--tei-file", type=str, required=True, help="path to a teiCorpus file (.tei.xml)")
+    parser.add_argument("--workers", type=str, default="1,2,4,8,16",
+                        help="comma-separated numbers of worker processes to benchmark")
+
+    args = parser.parse_args()
+    tei_file = args.tei_file
+    if not os.path.isfile(tei_file):
+        print("the path to the TEI XML file is not valid: ", tei_file)
+        exit(-1)
+    worker_counts = [int(workers) for workers in args.workers.split(",")]
+
+    output_root = tempfile.mkdtemp()
+    try:
+        # reference output with the serial conversion
+        reference_path = os.path.join(output_root, "serial")
+        os.makedirs(reference_path)
+        serial_time = time_conversion(tei_file, reference_path, 1)
+        reference_file = _output_file(tei_file, reference_path, ".json")
+
+        size_mb = os.path.getsize(tei_file) / (1024 * 1024)
+        print("%8s %10s %10s %8s %10s" % ("workers", "seconds", "MB/s", "speedup", "identical"))
+        for workers in worker_counts:
+            output_path = os.path.join(output_root, "workers-" + str(workers))
+            os.makedirs(output_path)
+            elapsed = serial_time if workers == 1 else time_conversion(tei_file, output_path, workers)
+            if workers == 1:
+                identical = True
+            else:
+                identical = filecmp.cmp(reference_file, _output_file(tei_file, output_path, ".json"), shallow=False)
+            print("%8d %10.2f %10.2f %8.2f %10s" % (workers, elapsed, size_mb / elapsed, serial_time / elapsed, identical))
+    finally:
+        shutil.rmtree(output_root)
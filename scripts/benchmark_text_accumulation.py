@@ -0,0 +1,66 @@
+"""
+    Micro-benchmark of the text accumulation of TEIContentHandler: convert synthetic
+    paragraphs of increasing size and report the conversion time per character, which
+    is expected to remain stable (linear conversion time) when the paragraph grows
+"""
+
+import argparse
+import io
+import time
+from xml.sax import make_parser
+
+from TEI2LossyJSON import TEIContentHandler
+
+# entities and inline mark-up split the text nodes into many SAX chunks, like in real articles
+SEGMENT = 'The data were analyzed with statistical software &amp; custom scripts. '
+INLINE = '<hi rend="italic">in vitro</hi> '
+
+def synthetic_paragraph_corpus(paragraph_size, inline_every=20):
+    """
+    Return a TEI corpus (bytes) with one document containing one paragraph of around
+    paragraph_size characters
+    """
+    pieces = []
+    size = 0
+    i = 0
+    while size < paragraph_size:
+        pieces.append(SEGMENT)
+        size += len(SEGMENT) - 4
+        i += 1
+        if i % inline_every == 0:
+            pieces.append(INLINE)
+            size += len('in vitro ')
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<teiCorpus><teiHeader><fileDesc><titleStmt><title>benchmark</title></titleStmt></fileDesc></teiHeader>'
+            '<TEI><teiHeader><fileDesc xml:id="bench"/></teiHeader><text><body><div><p>'
+            + ''.join(pieces) +
+            '</p></div></body></text></TEI></teiCorpus>').encode('utf-8')
+
+def time_conversion(tei_bytes, repeat=3):
+    best = None
+    for _ in range(repeat):
+        parser = make_parser()
+        handler = TEIContentHandler()
+        parser.setContentHandler(handler)
+        start = time.perf_counter()
+        parser.parse(io.BytesIO(tei_bytes))
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    paragraph = handler.getCorpus()["documents"][0]["body_text"][0]["text"]
+    return best, len(paragraph)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark TEIContentHandler text accumulation on synthetic paragraphs of increasing size")
+    parser.add_argument("--sizes", type=str, default="10000,100000,1000000",
+                        help="comma-separated paragraph sizes in characters")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs per size, the best time is reported")
+
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    print("%12s %12s %16s" % ("characters", "seconds", "ns per character"))
+    for size in sizes:
+        elapsed, length = time_conversion(synthetic_paragraph_corpus(size), repeat=args.repeat)
+        print("%12d %12.4f %16.1f" % (length, elapsed, elapsed * 1e9 / length))
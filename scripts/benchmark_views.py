@@ -0,0 +1,104 @@
+"""
+    Benchmark of the lazy corpus views against the JSON dicts: time and peak memory of loading a
+    converted corpus and iterating over all its annotations (type and text of each one), with the
+    JSON output loaded with json.load and with the memory-mapped columnar layout of corpus_view.py
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+from collections import Counter, OrderedDict
+
+from TEI2LossyJSON import TEIContentHandler, parse_tei
+from corpus_view import CorpusView, write_corpus_view
+from synthetic_tei import generate_tei_corpus
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_json(json_file):
+    start = time.perf_counter()
+    with open(json_file, encoding='utf-8') as f:
+        corpus = json.load(f, object_pairs_hook=OrderedDict)
+    types = Counter()
+    characters = 0
+    for document in corpus["documents"]:
+        for key in ("abstract", "body_text"):
+            for paragraph in document.get(key, []):
+                for annotation in paragraph.get("annotations", []):
+                    types[annotation.get("type")] += 1
+                    characters += len(annotation["text"])
+    return time.perf_counter() - start, _peak_rss_mb(), dict(types), characters
+
+def run_view(view_file):
+    start = time.perf_counter()
+    types = Counter()
+    characters = 0
+    with CorpusView(view_file) as corpus:
+        for annotation in corpus.annotations():
+            types[annotation.type] += 1
+            characters += len(annotation.text)
+    return time.perf_counter() - start, _peak_rss_mb(), dict(types), characters
+
+def run_view_columns(view_file):
+    # the same counts computed on the columns directly, without view objects
+    start = time.perf_counter()
+    with CorpusView(view_file) as corpus:
+        types = Counter(corpus.label(label) for label in corpus.annotation_type)
+        starts = corpus.annotation_byte_start
+        ends = corpus.annotation_byte_end
+        characters = sum(len(str(corpus.text[starts[i]:ends[i]], 'utf-8')) for i in range(len(starts)))
+    return time.perf_counter() - start, _peak_rss_mb(), dict(types), characters
+
+def _run_isolated(function, *args):
+    # each run in a fresh process, so that the peak memory is the one of this run only
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(function, args)
+
+def _baseline_rss_mb():
+    return _peak_rss_mb()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare iterating over all annotations with json.load and with the lazy columnar corpus view")
+    parser.add_argument("--tei-file", type=str, help="teiCorpus file to use, default is a generated one")
+    parser.add_argument("--documents", type=int, default=2000, help="number of documents of the generated corpus")
+
+    args = parser.parse_args()
+
+    work_path = tempfile.mkdtemp()
+    try:
+        tei_file = args.tei_file
+        if tei_file is None:
+            tei_file = generate_tei_corpus(os.path.join(work_path, "synthetic.tei.xml"), documents=args.documents)
+        handler = TEIContentHandler()
+        parse_tei(tei_file, handler)
+        corpus = handler.getCorpus()
+        json_file = os.path.join(work_path, "corpus.json")
+        with open(json_file, 'w') as f:
+            json.dump(corpus, f, indent=4)
+        view_file = os.path.join(work_path, "corpus.tcol")
+        write_corpus_view(corpus["documents"], view_file)
+        corpus = handler = None
+
+        print("corpus:", tei_file)
+        print("JSON: %.1f MB, columnar view: %.1f MB" % (os.path.getsize(json_file) / (1024 * 1024),
+                                                          os.path.getsize(view_file) / (1024 * 1024)))
+        baseline = _run_isolated(_baseline_rss_mb)
+        print("%-22s %10s %14s %10s" % ("run", "seconds", "memory (MB)", "result"))
+        reference = None
+        for name, function, path in (("json.load + dicts", run_json, json_file),
+                                     ("CorpusView objects", run_view, view_file),
+                                     ("CorpusView columns", run_view_columns, view_file)):
+            runtime, peak_memory, types, characters = _run_isolated(function, path)
+            if reference is None:
+                reference = (types, characters)
+            print("%-22s %10.3f %14.1f %10s" % (name, runtime, peak_memory - baseline,
+                                                 "same" if (types, characters) == reference else "DIFFERENT"))
+    finally:
+        shutil.rmtree(work_path)
@@ -0,0 +1,211 @@
+"""
+    Export a TEI corpus as token-level BIO sequences for NER training, computed in the same
+    pass as the conversion. Tokens, labels and character-to-token maps are written as packed
+    NumPy arrays in shards of .npy files, which are loaded as memory maps.
+"""
+
+import argparse
+import json
+import os
+import re
+from array import array
+from collections import OrderedDict
+
+from TEI2LossyJSON import convert_tei_file, iter_tei_documents, OUTPUT_FORMATS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]', re.UNICODE)
+
+# file of the label vocabulary, shared by all the shards
+LABELS_FILE = "labels.json"
+
+class BIOShardWriter(object):
+    """
+    Tokenize the paragraphs of each converted document and label the tokens with the <rs>
+    annotations in BIO scheme, the label being the annotation type with its subtype if any
+    (for instance B-software.environment, I-version). Each shard directory contains:
+
+        text.npy                    UTF-8 bytes of the paragraph texts, concatenated
+        text_offsets.npy            byte offset of each paragraph text in text.npy (+ end)
+        token_offsets.npy           index of the first token of each paragraph (+ end)
+        token_starts.npy/ends.npy   character offsets of the tokens in their paragraph
+        labels.npy                  label id of each token, see labels.json
+        char_offsets.npy            index of the first character of each paragraph in char_to_token.npy (+ end)
+        char_to_token.npy           token index in the paragraph of each character, -1 for spaces
+        documents.npy/paragraphs.npy  document id and paragraph id of each paragraph
+    """
+
+    def __init__(self, output_path, shard_size=10000, annotated_only=False):
+        if numpy is None:
+            raise ImportError("the numpy package is required for the BIO export, install it with: pip install numpy")
+        self.output_path = output_path
+        self.shard_size = shard_size
+        self.annotated_only = annotated_only
+        self.labels = OrderedDict([("O", 0)])
+        self.shards = 0
+        self.counts = OrderedDict([("paragraphs", 0), ("tokens", 0), ("annotations", 0), ("misaligned", 0)])
+        self._new_shard()
+
+    def _new_shard(self):
+        self.text = bytearray()
+        self.text_offsets = array('q', [0])
+        self.token_offsets = array('q', [0])
+        self.token_starts = array('i')
+        self.token_ends = array('i')
+        self.token_labels = array('h')
+        self.char_offsets = array('q', [0])
+        self.char_to_token = array('i')
+        self.documents = []
+        self.paragraphs = []
+
+    def add_document(self, document):
+        for prefix, key in (('a', "abstract"), ('b', "body_text")):
+            for i, paragraph in enumerate(document.get(key, [])):
+                if self.annotated_only and not paragraph.get("annotations"):
+                    continue
+                # same paragraph ids as add_paragraph_ids()
+                self._add_paragraph(document.get("id"), prefix + str(i), paragraph)
+
+    def _add_paragraph(self, document_id, paragraph_id, paragraph):
+        text = paragraph["text"]
+        first_token = len(self.token_starts)
+        char_to_token = array('i', [-1]) * len(text)
+        for n, match in enumerate(TOKEN_PATTERN.finditer(text)):
+            start, end = match.span()
+            self.token_starts.append(start)
+            self.token_ends.append(end)
+            char_to_token[start:end] = array('i', [n]) * (end - start)
+        token_count = len(self.token_starts) - first_token
+        labels = array('h', [0]) * token_count
+
+        for annotation in paragraph.get("annotations", []):
+            self.counts["annotations"] += 1
+            start, end = annotation["start"], annotation["end"]
+            tokens = sorted(set(token for token in char_to_token[start:end] if token != -1))
+            if not tokens:
+                self.counts["misaligned"] += 1
+                continue
+            if self.token_starts[first_token + tokens[0]] != start or self.token_ends[first_token + tokens[-1]] != end:
+                # annotation boundary inside a token, the overlapping tokens are labelled
+                self.counts["misaligned"] += 1
+            label = annotation.get("type", "unknown")
+            if annotation.get("subtype") is not None:
+                label += "." + annotation["subtype"]
+            for j, token in enumerate(tokens):
+                if labels[token] == 0:
+                    labels[token] = self._label_id(("B-" if j == 0 else "I-") + label)
+
+        self.token_labels.extend(labels)
+        self.token_offsets.append(len(self.token_starts))
+        self.text.extend(text.encode('utf-8'))
+        self.text_offsets.append(len(self.text))
+        self.char_to_token.extend(char_to_token)
+        self.char_offsets.append(len(self.char_to_token))
+        self.documents.append(document_id or '')
+        self.paragraphs.append(paragraph_id)
+        self.counts["paragraphs"] += 1
+        self.counts["tokens"] += token_count
+        if len(self.paragraphs) >= self.shard_size:
+            self.flush()
+
+    def _label_id(self, label):
+        if label not in self.labels:
+            self.labels[label] = len(self.labels)
+        return self.labels[label]
+
+    def flush(self):
+        if not self.paragraphs:
+            return
+        shard_path = os.path.join(self.output_path, "shard-%05d" % self.shards)
+        os.makedirs(shard_path, exist_ok=True)
+        arrays = OrderedDict([
+            ("text", numpy.frombuffer(bytes(self.text), dtype=numpy.uint8)),
+            ("text_offsets", numpy.frombuffer(self.text_offsets, dtype=numpy.int64)),
+            ("token_offsets", numpy.frombuffer(self.token_offsets, dtype=numpy.int64)),
+            ("token_starts", numpy.frombuffer(self.token_starts, dtype=numpy.int32)),
+            ("token_ends", numpy.frombuffer(self.token_ends, dtype=numpy.int32)),
+            ("labels", numpy.frombuffer(self.token_labels, dtype=numpy.int16)),
+            ("char_offsets", numpy.frombuffer(self.char_offsets, dtype=numpy.int64)),
+            ("char_to_token", numpy.frombuffer(self.char_to_token, dtype=numpy.int32)),
+            ("documents", numpy.array(self.documents, dtype=str)),
+            ("paragraphs", numpy.array(self.paragraphs, dtype=str))])
+        for name, values in arrays.items():
+            numpy.save(os.path.join(shard_path, name + ".npy"), values)
+        self.shards += 1
+        self._new_shard()
+
+    def close(self):
+        self.flush()
+        with open(os.path.join(self.output_path, LABELS_FILE), 'w') as f:
+            json.dump(OrderedDict([("labels", list(self.labels.keys())), ("counts", self.counts)]), f, indent=4)
+
+class BIOShard(object):
+    """
+    Memory-mapped view on a shard written by BIOShardWriter
+    """
+
+    def __init__(self, shard_path):
+        self.arrays = {}
+        for file in os.listdir(shard_path):
+            if file.endswith(".npy"):
+                self.arrays[file[:-4]] = numpy.load(os.path.join(shard_path, file), mmap_mode='r')
+        with open(os.path.join(os.path.dirname(os.path.abspath(shard_path)), LABELS_FILE)) as f:
+            self.label_names = json.load(f)["labels"]
+
+    def __len__(self):
+        return len(self.arrays["paragraphs"])
+
+    def text(self, i):
+        start, end = self.arrays["text_offsets"][i], self.arrays["text_offsets"][i+1]
+        return self.arrays["text"][start:end].tobytes().decode('utf-8')
+
+    def sequence(self, i):
+        """
+        Tokens and BIO labels of the paragraph i
+        """
+        text = self.text(i)
+        first, last = self.arrays["token_offsets"][i], self.arrays["token_offsets"][i+1]
+        starts = self.arrays["token_starts"][first:last]
+        ends = self.arrays["token_ends"][first:last]
+        tokens = [text[start:end] for start, end in zip(starts, ends)]
+        labels = [self.label_names[label] for label in self.arrays["labels"][first:last]]
+        return tokens, labels
+
+    def char_to_token(self, i):
+        start, end = self.arrays["char_offsets"][i], self.arrays["char_offsets"][i+1]
+        return self.arrays["char_to_token"][start:end]
+
+def load_shards(output_path):
+    return [BIOShard(os.path.join(output_path, shard)) for shard in sorted(os.listdir(output_path))
+            if shard.startswith("shard-")]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export a TEI corpus file as BIO token sequences in NumPy shards for NER training")
+    parser.add_argument("--tei-file", type=str, required=True, help="path to a teiCorpus file (.tei.xml)")
+    parser.add_argument("--output", type=str, required=True, help="path to the output directory of the shards")
+    parser.add_argument("--shard-size", type=int, default=10000, help="number of paragraphs per shard")
+    parser.add_argument("--annotated-only", action="store_true", help="only export the paragraphs with annotations")
+    parser.add_argument("--format", type=str, choices=list(OUTPUT_FORMATS.keys()),
+                        help="also write the converted corpus in this format in the output directory, in the same pass")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes for the conversion, default is 1")
+
+    args = parser.parse_args()
+    if not os.path.isfile(args.tei_file):
+        print("the path to the TEI XML file is not valid: ", args.tei_file)
+        exit(-1)
+    os.makedirs(args.output, exist_ok=True)
+
+    writer = BIOShardWriter(args.output, shard_size=args.shard_size, annotated_only=args.annotated_only)
+    if args.format is not None:
+        convert_tei_file(args.tei_file, args.output, workers=args.workers, output_format=args.format, observers=[writer])
+    else:
+        for document in iter_tei_documents(args.tei_file):
+            writer.add_document(document)
+    writer.close()
+    print(writer.shards, "shards written in", args.output)
+    print(", ".join(key + ": " + str(value) for key, value in writer.counts.items()))
@@ -0,0 +1,427 @@
+"""
+    Differences between two releases of the corpus at document, paragraph and <rs> annotation
+    level, and a compact patch which updates a converted corpus of the old release into the new
+    one without shipping the whole corpus again.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from TEI2LossyJSON import (add_paragraph_ids, iter_converted_documents, iter_tei_documents, write_converted_corpus,
+                           document_encoder, open_input, open_output, COMPRESSIONS, OUTPUT_FORMATS,
+                           STREAMING_FORMATS)
+
+PATCH_VERSION = 2
+
+# versions of the patch files which can be applied, version 1 has no order operation
+SUPPORTED_PATCH_VERSIONS = (1, 2)
+
+# keys of a document holding paragraphs, compared paragraph by paragraph
+PARAGRAPH_LISTS = ("abstract", "body_text")
+
+class CorpusDiff(object):
+    """
+    Compare two corpora streamed side by side. Documents are matched by their fileDesc/@xml:id,
+    paragraphs of matched documents by the hash of their text: a paragraph with the same text but
+    other spans is changed, a paragraph whose text changed is removed and added. Documents are
+    only kept in memory until their counterpart is found, so memory depends on the number of
+    reordered, added or removed documents and not on the size of the corpora.
+
+    Each difference is passed to the patch writer, if any, as soon as it is known. The keys of the
+    documents are kept, and if the new release has its documents in another order than the one of
+    the patched corpus (the old order, added documents at the end), an order operation listing the
+    keys of the new release ends the patch.
+    """
+
+    COUNTS = ("documents", "paragraphs", "annotations")
+
+    def __init__(self, patch_writer=None):
+        self.patch_writer = patch_writer
+        self.counts = OrderedDict((level, OrderedDict([("added", 0), ("removed", 0), ("changed", 0), ("unchanged", 0)]))
+                                  for level in CorpusDiff.COUNTS)
+
+    def compare(self, old_documents, new_documents):
+        pending_old = OrderedDict()
+        pending_new = OrderedDict()
+        old_keys = []
+        new_keys = []
+        for old, new in _zip_longest(_keyed(old_documents), _keyed(new_documents)):
+            if old is not None:
+                old_keys.append(old[0])
+                if old[0] in pending_new:
+                    self._compare_documents(old[0], old[1], pending_new.pop(old[0]))
+                else:
+                    pending_old[old[0]] = old[1]
+            if new is not None:
+                new_keys.append(new[0])
+                if new[0] in pending_old:
+                    self._compare_documents(new[0], pending_old.pop(new[0]), new[1])
+                else:
+                    pending_new[new[0]] = new[1]
+
+        for key, document in pending_old.items():
+            self.counts["documents"]["removed"] += 1
+            self._count_paragraphs(document, "removed")
+            self._write(OrderedDict([("op", "remove"), ("id", key)]))
+        for key, document in pending_new.items():
+            self.counts["documents"]["added"] += 1
+            self._count_paragraphs(document, "added")
+            self._write(OrderedDict([("op", "add"), ("id", key), ("document", _without_ids(document))]))
+
+        kept = set(new_keys)
+        patched_keys = [key for key in old_keys if key in kept] + list(pending_new)
+        if patched_keys != new_keys:
+            self._write(OrderedDict([("op", "order"), ("ids", new_keys)]))
+
+    def _compare_documents(self, key, old, new):
+        operation = diff_documents(old, new, self.counts)
+        if operation is None:
+            self.counts["documents"]["unchanged"] += 1
+            return
+        self.counts["documents"]["changed"] += 1
+        operation["id"] = key
+        operation.move_to_end("id", last=False)
+        operation.move_to_end("op", last=False)
+        self._write(operation)
+
+    def _count_paragraphs(self, document, status):
+        for key in PARAGRAPH_LISTS:
+            for paragraph in document.get(key) or []:
+                self.counts["paragraphs"][status] += 1
+                self.counts["annotations"][status] += len(paragraph.get("annotations", []))
+
+    def _write(self, operation):
+        if self.patch_writer is not None:
+            self.patch_writer.write(operation)
+
+    def report(self):
+        return OrderedDict((level, counts) for level, counts in self.counts.items())
+
+def diff_documents(old, new, counts):
+    """
+    Update operation turning the old document into the new one, None if they are identical. The
+    paragraph lists are given as entries: the index of an unchanged old paragraph, an old paragraph
+    with the fields to set and unset, or a new paragraph.
+    """
+    operation = OrderedDict([("op", "update"), ("base", document_hash(old))])
+    fields = OrderedDict()
+    unset = []
+    for key, value in new.items():
+        if key not in PARAGRAPH_LISTS and old.get(key) != value:
+            fields[key] = value
+    for key in old:
+        if key not in new:
+            unset.append(key)
+    if fields:
+        operation["fields"] = fields
+    if unset:
+        operation["unset"] = unset
+
+    for key in PARAGRAPH_LISTS:
+        if key not in new:
+            continue
+        old_paragraphs = old.get(key) or []
+        entries = _diff_paragraphs(old_paragraphs, new[key], counts)
+        if key not in old or entries != list(range(len(old_paragraphs))):
+            operation[key] = entries
+    if len(operation) == 2:
+        return None
+    return operation
+
+def _diff_paragraphs(old_paragraphs, new_paragraphs, counts):
+    old_positions = {}
+    for i, paragraph in enumerate(old_paragraphs):
+        old_positions.setdefault(paragraph_hash(paragraph), []).append(i)
+
+    entries = []
+    used = set()
+    for paragraph in new_paragraphs:
+        positions = old_positions.get(paragraph_hash(paragraph))
+        if not positions:
+            counts["paragraphs"]["added"] += 1
+            counts["annotations"]["added"] += len(paragraph.get("annotations", []))
+            entries.append(OrderedDict([("paragraph", _without_id(paragraph))]))
+            continue
+        i = positions.pop(0)
+        used.add(i)
+        old_paragraph = _without_id(old_paragraphs[i])
+        new_paragraph = _without_id(paragraph)
+        if old_paragraph == new_paragraph:
+            counts["paragraphs"]["unchanged"] += 1
+            counts["annotations"]["unchanged"] += len(paragraph.get("annotations", []))
+            entries.append(i)
+            continue
+        counts["paragraphs"]["changed"] += 1
+        _diff_annotations(old_paragraph.get("annotations", []), new_paragraph.get("annotations", []), counts)
+        entry = OrderedDict([("from", i)])
+        fields = OrderedDict((key, value) for key, value in new_paragraph.items() if old_paragraph.get(key) != value)
+        if fields:
+            entry["set"] = fields
+        unset = [key for key in old_paragraph if key not in new_paragraph]
+        if unset:
+            entry["unset"] = unset
+        entries.append(entry)
+
+    for i, paragraph in enumerate(old_paragraphs):
+        if i not in used:
+            counts["paragraphs"]["removed"] += 1
+            counts["annotations"]["removed"] += len(paragraph.get("annotations", []))
+    return entries
+
+def _diff_annotations(old_annotations, new_annotations, counts):
+    # annotations are matched by offsets, a matched annotation with other attributes is changed
+    old_spans = OrderedDict(((annotation.get("start"), annotation.get("end")), annotation) for annotation in old_annotations)
+    for annotation in new_annotations:
+        old_annotation = old_spans.pop((annotation.get("start"), annotation.get("end")), None)
+        if old_annotation is None:
+            counts["annotations"]["added"] += 1
+        elif old_annotation != annotation:
+            counts["annotations"]["changed"] += 1
+        else:
+            counts["annotations"]["unchanged"] += 1
+    counts["annotations"]["removed"] += len(old_spans)
+
+def paragraph_hash(paragraph):
+    return hashlib.sha1(paragraph["text"].encode('utf-8')).hexdigest()[:16]
+
+def document_hash(document):
+    # content hash of a document, independent of the key order and of the paragraph ids
+    content = json.dumps(_without_ids(document), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
+
+def _without_id(paragraph):
+    # paragraph ids (a0, b12, ...) depend on the position and are not part of the content
+    if "id" not in paragraph:
+        return paragraph
+    return OrderedDict((key, value) for key, value in paragraph.items() if key != "id")
+
+def _without_ids(document):
+    result = OrderedDict(document)
+    for key in PARAGRAPH_LISTS:
+        if key in result and result[key] is not None:
+            result[key] = [_without_id(paragraph) for paragraph in result[key]]
+    return result
+
+def _keyed(documents):
+    # documents with their key: the fileDesc/@xml:id, or the title without id, made unique
+    seen = {}
+    for document in documents:
+        key = document.get("id") or "title:" + str(document.get("title"))
+        if key in seen:
+            seen[key] += 1
+            key = key + "#" + str(seen[key])
+        else:
+            seen[key] = 0
+        yield key, document
+
+def _zip_longest(first, second):
+    # like itertools.zip_longest, documents are read alternately from both corpora
+    sentinel = object()
+    while True:
+        first_item = next(first, sentinel)
+        second_item = next(second, sentinel)
+        if first_item is sentinel and second_item is sentinel:
+            return
+        yield (None if first_item is sentinel else first_item), (None if second_item is sentinel else second_item)
+
+def iter_corpus_documents(corpus_file):
+    # a TEI corpus is converted on the fly, a converted one is read in its format
+    if corpus_file.endswith(".xml"):
+        return iter_tei_documents(corpus_file)
+    return iter_converted_documents(corpus_file)
+
+class PatchWriter(object):
+    """
+    Patch file in JSON Lines: a header line, then one operation per added, removed or changed
+    document. Compressed with gzip or zstd if the file name ends with .gz or .zst.
+    """
+
+    def __init__(self, patch_file, old_name=None, new_name=None):
+        self.output = open_output(patch_file, _compression(patch_file))
+        self.operations = 0
+        header = OrderedDict([("patch", "tei2json"), ("version", PATCH_VERSION), ("old", old_name), ("new", new_name)])
+        self.output.write(json.dumps(header).encode('utf-8') + b'\n')
+
+    def write(self, operation):
+        self.output.write(json.dumps(operation, separators=(',', ':')).encode('utf-8') + b'\n')
+        self.operations += 1
+
+    def close(self):
+        self.output.close()
+
+def _compression(file_name):
+    for compression, extension in COMPRESSIONS.items():
+        if file_name.endswith(extension):
+            return compression
+    return None
+
+def read_patch(patch_file):
+    """
+    Operations of a patch file by document key, in the order of the patch, and the keys of the
+    documents of the new release in their order, None if the patch keeps the order of the corpus
+    """
+    with open_input(patch_file, _compression(patch_file)) as f:
+        header = json.loads(f.readline())
+        if header.get("patch") != "tei2json" or header.get("version") not in SUPPORTED_PATCH_VERSIONS:
+            raise ValueError("not a supported patch file: " + patch_file)
+        operations = OrderedDict()
+        order = None
+        for line in f:
+            if line.strip():
+                operation = json.loads(line, object_pairs_hook=OrderedDict)
+                if operation["op"] == "order":
+                    order = operation["ids"]
+                else:
+                    operations[operation["id"]] = operation
+    return operations, order
+
+def apply_operation(document, operation):
+    """
+    Apply an update operation to a document of the old release, checked against the base hash
+    """
+    if document_hash(document) != operation["base"]:
+        raise ValueError("the document " + str(operation["id"]) + " differs from the one the patch was made from")
+    with_ids = any("id" in paragraph for key in PARAGRAPH_LISTS for paragraph in document.get(key) or [])
+    result = OrderedDict((key, value) for key, value in document.items() if key not in operation.get("unset", []))
+    for key, value in operation.get("fields", {}).items():
+        result[key] = value
+    for key in PARAGRAPH_LISTS:
+        if key not in operation:
+            continue
+        old_paragraphs = [_without_id(paragraph) for paragraph in document.get(key) or []]
+        paragraphs = []
+        for entry in operation[key]:
+            if isinstance(entry, int):
+                paragraphs.append(old_paragraphs[entry])
+            elif "paragraph" in entry:
+                paragraphs.append(entry["paragraph"])
+            else:
+                paragraph = OrderedDict((name, value) for name, value in old_paragraphs[entry["from"]].items()
+                                        if name not in entry.get("unset", []))
+                paragraph.update(entry.get("set", {}))
+                paragraphs.append(paragraph)
+        result[key] = paragraphs
+    if with_ids:
+        add_paragraph_ids(result)
+    return result
+
+def apply_patch(json_file, patch_file, output_file):
+    """
+    Update a converted corpus of the old release with a patch, the output format is given by the
+    output file extension. Documents are streamed for the streaming formats, in the order of the
+    new release: a document coming before its turn is kept until the documents preceding it are
+    written. A JSON corpus written in a JSON format is read once, its documents being released as
+    they are patched. Return the number of written documents.
+    """
+    operations, order = read_patch(patch_file)
+    name = output_file
+    compression = _compression(output_file)
+    if compression is not None:
+        name = name[:-len(COMPRESSIONS[compression])]
+    output_format = next((output_format for output_format, extension in OUTPUT_FORMATS.items()
+                          if name.endswith(extension) and output_format != "compact"), "json")
+
+    corpus = OrderedDict()
+    documents = None
+    if output_format not in STREAMING_FORMATS and \
+            (json_file.endswith(".json") or json_file.endswith(".json.gz") or json_file.endswith(".json.zst")):
+        # corpus metadata of the JSON format, the documents are taken from the loaded corpus
+        with open_input(json_file, _compression(json_file)) as f:
+            corpus = json.load(f, object_pairs_hook=OrderedDict)
+        documents = _consume(corpus.pop("documents", []))
+
+    def patched_documents():
+        with_ids = False
+        for key, document in _keyed(documents if documents is not None else iter_converted_documents(json_file)):
+            with_ids = with_ids or any("id" in paragraph for paragraph in document.get("body_text") or [])
+            operation = operations.get(key)
+            if operation is None:
+                yield key, document
+            elif operation["op"] == "update":
+                yield key, apply_operation(document, operation)
+            elif operation["op"] == "add":
+                raise ValueError("the document " + key + " added by the patch is already in the corpus")
+        for key, operation in operations.items():
+            if operation["op"] == "add":
+                document = operation["document"]
+                yield key, add_paragraph_ids(document) if with_ids else document
+
+    def ordered_documents():
+        if order is None:
+            for _, document in patched_documents():
+                yield document
+            return
+        pending = {}
+        position = 0
+        for key, document in patched_documents():
+            pending[key] = document
+            while position < len(order) and order[position] in pending:
+                yield pending.pop(order[position])
+                position += 1
+        if pending or position < len(order):
+            raise ValueError("the documents of the corpus do not match the order of the patch")
+
+    written = 0
+    if output_format in STREAMING_FORMATS:
+        encode_document = document_encoder(output_format)
+        with open_output(output_file, compression) as output:
+            for document in ordered_documents():
+                output.write(encode_document(document))
+                written += 1
+    else:
+        corpus["documents"] = list(ordered_documents())
+        written = len(corpus["documents"])
+        write_converted_corpus(corpus, output_file, output_format=output_format, compression=compression)
+    return written
+
+def _consume(documents):
+    # documents of a list in order, each one dropped from the list once yielded
+    documents.reverse()
+    while documents:
+        yield documents.pop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare two releases of the corpus and write a patch, or apply a patch to a converted corpus")
+    parser.add_argument("--old", type=str, help="old release, a teiCorpus file (.xml) or a converted corpus")
+    parser.add_argument("--new", type=str, help="new release, a teiCorpus file (.xml) or a converted corpus")
+    parser.add_argument("--patch", type=str, required=True,
+                        help="patch file to write when comparing, or to apply with --apply (.jsonl, possibly .gz or .zst)")
+    parser.add_argument("--report", type=str, help="path to a JSON file where to write the counts of differences")
+    parser.add_argument("--apply", type=str, help="converted corpus of the old release to update with the patch")
+    parser.add_argument("--output", type=str, help="with --apply, path to the updated corpus, in the format of its extension")
+
+    args = parser.parse_args()
+    if args.apply is not None:
+        if args.output is None:
+            print("--apply requires an --output file")
+            exit(-1)
+        try:
+            written = apply_patch(args.apply, args.patch, args.output)
+        except ValueError as e:
+            print("the patch cannot be applied:", e)
+            exit(-1)
+        print(written, "documents written in", args.output)
+    elif args.old is not None and args.new is not None:
+        for corpus_file in (args.old, args.new):
+            if not os.path.isfile(corpus_file):
+                print("the path to the corpus file is not valid: ", corpus_file)
+                exit(-1)
+        patch_writer = PatchWriter(args.patch, os.path.basename(args.old), os.path.basename(args.new))
+        diff = CorpusDiff(patch_writer)
+        try:
+            diff.compare(iter_corpus_documents(args.old), iter_corpus_documents(args.new))
+        finally:
+            patch_writer.close()
+        for level, counts in diff.report().items():
+            print(level + ":", ", ".join(status + ": " + str(count) for status, count in counts.items()))
+        print(patch_writer.operations, "operations written in", args.patch)
+        if args.report is not None:
+            with open(args.report, 'w') as f:
+                json.dump(diff.report(), f, indent=4)
+    else:
+        print("The supplied arguments were not sufficient. ")
+        parser.print_help()
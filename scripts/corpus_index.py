@@ -0,0 +1,99 @@
+"""
+    Random access to the documents and paragraphs of a JSON Lines output of TEI2LossyJSON.py
+    written with the --index option, without loading the rest of the corpus
+"""
+
+import argparse
+import json
+import mmap
+from collections import OrderedDict
+
+from TEI2LossyJSON import INDEX_EXTENSION
+
+class IndexedCorpus(object):
+    """
+    Memory-mapped JSON Lines corpus with its sidecar index. Documents are retrieved by position,
+    by id or by idno value (DOI, PMC, PMID, etc.), paragraphs by document and paragraph id
+    (a0, b12, ...). Only the requested document or paragraph is decoded.
+    """
+
+    def __init__(self, jsonl_file, index_file=None):
+        if index_file is None:
+            index_file = jsonl_file + INDEX_EXTENSION
+        with open(index_file) as f:
+            index = json.load(f)
+        self.offsets = index["documents"]
+        self.ids = index["ids"]
+        self.idnos = index["idno"]
+        self.paragraphs = index["paragraphs"]
+        self.file = open(jsonl_file, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets else b''
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def document_at(self, position):
+        offset, length = self.offsets[position]
+        return json.loads(self.data[offset:offset+length], object_pairs_hook=OrderedDict)
+
+    def position(self, key, idno_type=None):
+        """
+        Position of a document given its id or an idno value, None if not found. Without idno_type,
+        the id is tried first and then all the idno types.
+        """
+        if idno_type is not None:
+            return self.idnos.get(idno_type, {}).get(key)
+        if key in self.ids:
+            return self.ids[key]
+        for values in self.idnos.values():
+            if key in values:
+                return values[key]
+        return None
+
+    def get_document(self, key, idno_type=None):
+        position = self.position(key, idno_type)
+        if position is None:
+            return None
+        return self.document_at(position)
+
+    def get_paragraph(self, key, paragraph_id, idno_type=None):
+        """
+        Paragraph of a document given the document key (id or idno value) and the paragraph id
+        """
+        position = self.position(key, idno_type)
+        if position is None or paragraph_id not in self.paragraphs[position]:
+            return None
+        start, length = self.paragraphs[position][paragraph_id]
+        offset = self.offsets[position][0] + start
+        return json.loads(self.data[offset:offset+length], object_pairs_hook=OrderedDict)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Retrieve a document or a paragraph from an indexed JSON Lines corpus")
+    parser.add_argument("--jsonl-file", type=str, required=True,
+                        help="path to a JSON Lines output of TEI2LossyJSON.py written with --index")
+    parser.add_argument("--key", type=str, required=True, help="document id or idno value (DOI, PMC, etc.)")
+    parser.add_argument("--idno-type", type=str, help="restrict the key to this idno type")
+    parser.add_argument("--paragraph", type=str, help="paragraph id to retrieve, for instance a0 or b12")
+
+    args = parser.parse_args()
+    with IndexedCorpus(args.jsonl_file) as corpus:
+        if args.paragraph is not None:
+            result = corpus.get_paragraph(args.key, args.paragraph, idno_type=args.idno_type)
+        else:
+            result = corpus.get_document(args.key, idno_type=args.idno_type)
+    if result is None:
+        print("not found:", args.key, args.paragraph or "")
+        exit(-1)
+    print(json.dumps(result, indent=4))
@@ -0,0 +1,79 @@
+"""
+    Statistics of teiCorpus files without writing a conversion (the converter collects the same
+    counters with --statistics), and merge of statistics saved by separate runs, for instance of
+    the holdout and working splits. The rs counts are printed as the table of the README.
+"""
+
+import argparse
+import os
+
+from TEI2LossyJSON import CorpusStatistics, TEIContentHandler, parse_tei, DEFAULT_BACKEND
+
+def collect_statistics(tei_files, per_document=False, backend=DEFAULT_BACKEND):
+    statistics = CorpusStatistics(per_document=per_document)
+    for tei_file in tei_files:
+        # documents are counted then dropped
+        parse_tei(tei_file, TEIContentHandler(document_sink=lambda document: None, statistics=statistics), backend=backend)
+    return statistics
+
+def merge_statistics(statistics_files):
+    statistics = None
+    for statistics_file in statistics_files:
+        other = CorpusStatistics.load(statistics_file)
+        if statistics is None:
+            statistics = CorpusStatistics(per_document=other.per_document)
+        statistics.merge(other)
+    return statistics
+
+def print_table(statistics):
+    print("| %-28s | %10s |" % ("", "count"))
+    print("|%s|%s|" % ("-" * 30, "-" * 12))
+    print("| %-28s | %10s |" % ("number of documents", format(statistics.documents, ",")))
+    for subtype, count in statistics.subtypes.items():
+        print("| %-28s | %10s |" % ("- " + subtype, format(count, ",")))
+    for rs_type, counts in statistics.rs_types.items():
+        print("|%s|%s|" % ("-" * 30, "-" * 12))
+        print("| %-28s | %10s |" % (rs_type + " (total)", format(counts["total"], ",")))
+        for subtype, count in counts["subtypes"].items():
+            print("| %-28s | %10s |" % ("- " + subtype, format(count, ",")))
+        print("| %-28s | %10s |" % ("- with corresp", format(counts["with_corresp"], ",")))
+    print("|%s|%s|" % ("-" * 30, "-" * 12))
+    for zone, counts in statistics.zones.items():
+        print("| %-28s | %10s |" % (zone + " paragraphs", format(counts["paragraphs"], ",")))
+        print("| %-28s | %10s |" % (zone + " tokens", format(counts["tokens"], ",")))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Count documents, paragraphs, tokens and rs annotations of teiCorpus files, or merge saved statistics")
+    parser.add_argument("--tei-file", type=str, nargs="+", help="teiCorpus files to count, counted together")
+    parser.add_argument("--merge", type=str, nargs="+", help="statistics JSON files to merge, for instance of several splits")
+    parser.add_argument("--output", type=str, help="path to a JSON file, or a CSV file with a .csv extension, where to "
+                                                   "write the statistics")
+    parser.add_argument("--per-document", type=str, help="path to a CSV file where to write the counts of each document")
+    parser.add_argument("--backend", type=str, default=DEFAULT_BACKEND, help="XML parser backend, default is auto")
+
+    args = parser.parse_args()
+    if args.tei_file is not None:
+        for tei_file in args.tei_file:
+            if not os.path.isfile(tei_file):
+                print("the path to the TEI XML file is not valid: ", tei_file)
+                exit(-1)
+        statistics = collect_statistics(args.tei_file, per_document=args.per_document is not None, backend=args.backend)
+    elif args.merge is not None:
+        statistics = merge_statistics(args.merge)
+    else:
+        print("The supplied arguments were not sufficient. ")
+        parser.print_help()
+        exit(-1)
+
+    print(statistics.summary())
+    print_table(statistics)
+    if args.output is not None:
+        statistics.save(args.output)
+        print("statistics written in", args.output)
+    if args.per_document is not None:
+        if not statistics.per_document:
+            print("per document counts are not available in the merged statistics")
+        else:
+            statistics.save_per_document(args.per_document)
+            print("per document counts written in", args.per_document)
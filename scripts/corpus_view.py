@@ -0,0 +1,498 @@
+"""
+    Compact columnar layout of a converted corpus and lazy read access to it: the paragraph texts
+    are stored in a single UTF-8 buffer, paragraphs, spans and annotations as integer columns,
+    and the whole file is memory-mapped. Documents, paragraphs and annotations are returned as
+    small views which decode their text or attributes only when they are accessed, so iterating
+    over all the annotations of the corpus does not create a dict per paragraph or span.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from array import array
+from collections import OrderedDict
+
+from TEI2LossyJSON import iter_converted_documents, iter_tei_documents
+
+MAGIC = b"TEI2JCOL"
+VERSION = 1
+VIEW_EXTENSION = ".tcol"
+
+# kinds of the spans other than the annotations, in the order of the paragraph keys
+SPAN_KINDS = ("ref_spans", "list_spans", "formula_spans")
+# attributes of the <rs> annotations, in the order of the converter, short labels are decoded
+# once when the file is opened, the other strings (ids, corresp, sections) on access
+LABEL_ATTRIBUTES = ("type", "subtype", "resp", "cert")
+STRING_ATTRIBUTES = ("id", "corresp")
+ANNOTATION_ATTRIBUTES = ("type", "subtype", "id", "corresp", "resp", "cert")
+
+# name and type code (see the array module) of the columns
+COLUMNS = OrderedDict([
+    ("document_metadata", "q"),      # offsets of the JSON metadata of each document, documents + 1
+    ("document_paragraphs", "q"),    # first paragraph of each document, documents + 1
+    ("document_abstract", "i"),      # number of abstract paragraphs, -1 without abstract
+    ("document_body", "b"),          # 1 if the document has a body_text
+    ("paragraph_text", "q"),         # byte offsets of the paragraph texts in the text buffer, paragraphs + 1
+    ("paragraph_section", "i"),      # string of the section title, -1 without section
+    ("paragraph_spans", "q"),        # first span of each paragraph, paragraphs + 1
+    ("paragraph_annotations", "q"),  # first annotation of each paragraph, paragraphs + 1
+    ("span_kind", "b"),
+    ("span_type", "i"),
+    ("span_start", "i"),
+    ("span_end", "i"),
+    ("annotation_paragraph", "i"),
+    ("annotation_start", "i"),
+    ("annotation_end", "i"),
+    ("annotation_byte_start", "q"),  # absolute offsets of the annotated text in the text buffer
+    ("annotation_byte_end", "q"),
+] + [("annotation_" + attribute, "i") for attribute in ANNOTATION_ATTRIBUTES] + [
+    ("string_offsets", "q"),
+])
+
+class CorpusViewWriter(object):
+    """
+    Write documents in the columnar layout. The integer columns are kept in arrays, the texts,
+    document metadata and strings go to temporary files, so memory does not hold any Python
+    object per paragraph or annotation. The file is assembled by close().
+    """
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.work_path = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_file)))
+        self.text = open(os.path.join(self.work_path, "text"), 'wb')
+        self.metadata = open(os.path.join(self.work_path, "metadata"), 'wb')
+        self.strings = open(os.path.join(self.work_path, "strings"), 'wb')
+        self.columns = OrderedDict((name, array(typecode)) for name, typecode in COLUMNS.items())
+        for name in ("document_metadata", "document_paragraphs", "paragraph_text", "paragraph_spans",
+                     "paragraph_annotations", "string_offsets"):
+            self.columns[name].append(0)
+        self.labels = OrderedDict()
+        self.string_ids = {}
+        self.text_offset = 0
+        self.metadata_offset = 0
+        self.string_offset = 0
+        self.paragraph_ids = None
+
+    def add_document(self, document):
+        columns = self.columns
+        metadata = OrderedDict((key, value) for key, value in document.items() if key not in ("abstract", "body_text"))
+        data = json.dumps(metadata, separators=(',', ':')).encode('utf-8')
+        self.metadata.write(data)
+        self.metadata_offset += len(data)
+        columns["document_metadata"].append(self.metadata_offset)
+
+        abstract = document.get("abstract")
+        body = document.get("body_text")
+        columns["document_abstract"].append(len(abstract) if abstract is not None else -1)
+        columns["document_body"].append(1 if body is not None else 0)
+        for paragraph in (abstract or []) + (body or []):
+            self._add_paragraph(paragraph)
+        columns["document_paragraphs"].append(len(columns["paragraph_section"]))
+
+    def _add_paragraph(self, paragraph):
+        columns = self.columns
+        if self.paragraph_ids is None:
+            self.paragraph_ids = "id" in paragraph
+        paragraph_index = len(columns["paragraph_section"])
+        text = paragraph["text"]
+        data = text.encode('utf-8')
+        ascii_text = len(data) == len(text)
+        self.text.write(data)
+        start_offset = self.text_offset
+        self.text_offset += len(data)
+        columns["paragraph_text"].append(self.text_offset)
+        columns["paragraph_section"].append(self._string(paragraph["section"]) if "section" in paragraph else -1)
+
+        for kind, span_kind in enumerate(SPAN_KINDS):
+            for span in paragraph.get(span_kind, []):
+                columns["span_kind"].append(kind)
+                columns["span_type"].append(self._label(span["type"]) if "type" in span else -1)
+                columns["span_start"].append(span["start"])
+                columns["span_end"].append(span["end"])
+        columns["paragraph_spans"].append(len(columns["span_kind"]))
+
+        for annotation in paragraph.get("annotations", []):
+            start = annotation["start"]
+            end = annotation["end"]
+            columns["annotation_paragraph"].append(paragraph_index)
+            columns["annotation_start"].append(start)
+            columns["annotation_end"].append(end)
+            if ascii_text:
+                columns["annotation_byte_start"].append(start_offset + start)
+                columns["annotation_byte_end"].append(start_offset + end)
+            else:
+                byte_start = start_offset + len(text[:start].encode('utf-8'))
+                columns["annotation_byte_start"].append(byte_start)
+                columns["annotation_byte_end"].append(byte_start + len(text[start:end].encode('utf-8')))
+            for attribute in LABEL_ATTRIBUTES:
+                value = annotation.get(attribute)
+                columns["annotation_" + attribute].append(self._label(value) if value is not None else -1)
+            for attribute in STRING_ATTRIBUTES:
+                value = annotation.get(attribute)
+                columns["annotation_" + attribute].append(self._string(value) if value is not None else -1)
+        columns["paragraph_annotations"].append(len(columns["annotation_paragraph"]))
+
+    def _label(self, value):
+        label = self.labels.get(value)
+        if label is None:
+            label = self.labels[value] = len(self.labels)
+        return label
+
+    def _string(self, value):
+        # repeated strings (mostly section titles) are stored once
+        string_id = self.string_ids.get(value)
+        if string_id is None:
+            data = value.encode('utf-8')
+            self.strings.write(data)
+            self.string_offset += len(data)
+            string_id = self.string_ids[value] = len(self.columns["string_offsets"]) - 1
+            self.columns["string_offsets"].append(self.string_offset)
+        return string_id
+
+    def close(self):
+        try:
+            for temporary in (self.text, self.metadata, self.strings):
+                temporary.close()
+            self.string_ids = None
+            header = OrderedDict()
+            header["documents"] = len(self.columns["document_abstract"])
+            header["paragraph_ids"] = bool(self.paragraph_ids)
+            header["labels"] = list(self.labels)
+            header["columns"] = OrderedDict()
+            # columns then buffers, each one aligned on 8 bytes
+            offset = 0
+            blocks = []
+            for name, column in self.columns.items():
+                header["columns"][name] = [offset, column.typecode, len(column)]
+                blocks.append(column)
+                offset = _aligned(offset + len(column) * column.itemsize)
+            for name in ("text", "metadata", "strings"):
+                size = os.path.getsize(os.path.join(self.work_path, name))
+                header["columns"][name] = [offset, "B", size]
+                blocks.append(name)
+                offset = _aligned(offset + size)
+
+            header_data = json.dumps(header, separators=(',', ':')).encode('utf-8')
+            start = _aligned(len(MAGIC) + 8 + len(header_data))
+            with open(self.output_file, 'wb') as output:
+                output.write(MAGIC + struct.pack("<II", VERSION, len(header_data)) + header_data)
+                output.write(b'\0' * (start - output.tell()))
+                for block in blocks:
+                    if isinstance(block, array):
+                        block.tofile(output)
+                    else:
+                        with open(os.path.join(self.work_path, block), 'rb') as f:
+                            shutil.copyfileobj(f, output, 1024*1024)
+                    output.write(b'\0' * (_aligned(output.tell() - start) - (output.tell() - start)))
+        finally:
+            shutil.rmtree(self.work_path, ignore_errors=True)
+
+def _aligned(offset):
+    return (offset + 7) & ~7
+
+def write_corpus_view(documents, output_file):
+    """
+    Write an iterable of converted documents in the columnar layout, return the number of documents
+    """
+    writer = CorpusViewWriter(output_file)
+    try:
+        for document in documents:
+            writer.add_document(document)
+    finally:
+        writer.close()
+    return len(writer.columns["document_abstract"])
+
+class CorpusView(object):
+    """
+    Memory-mapped columnar corpus. The columns are memoryviews over the file, no data is read
+    before it is accessed. Documents are retrieved by position, paragraphs() and annotations()
+    iterate over the whole corpus.
+    """
+
+    def __init__(self, view_file):
+        self.file = open(view_file, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError("not a corpus view file: " + view_file)
+        version, header_length = struct.unpack("<II", self.data[len(MAGIC):len(MAGIC) + 8])
+        if version != VERSION:
+            raise ValueError("unsupported corpus view version: " + str(version))
+        header = json.loads(self.data[len(MAGIC) + 8:len(MAGIC) + 8 + header_length])
+        start = _aligned(len(MAGIC) + 8 + header_length)
+        self.documents = header["documents"]
+        self.paragraph_ids = header["paragraph_ids"]
+        self.labels = header["labels"]
+        self.buffer = memoryview(self.data)
+        self.columns = {}
+        for name, (offset, typecode, count) in header["columns"].items():
+            size = count * array(typecode).itemsize
+            column = self.buffer[start + offset:start + offset + size]
+            self.columns[name] = column.cast(typecode) if typecode != "B" else column
+        for name, column in self.columns.items():
+            setattr(self, name, column)
+
+    def __len__(self):
+        return self.documents
+
+    def __getitem__(self, position):
+        if not -self.documents <= position < self.documents:
+            raise IndexError("document position out of range")
+        return Document(self, position % self.documents)
+
+    def __iter__(self):
+        for position in range(self.documents):
+            yield Document(self, position)
+
+    def paragraphs(self):
+        for index in range(len(self.paragraph_section)):
+            yield Paragraph(self, index)
+
+    def annotations(self):
+        for index in range(len(self.annotation_paragraph)):
+            yield Annotation(self, index)
+
+    def string(self, string_id):
+        if string_id < 0:
+            return None
+        return str(self.strings[self.string_offsets[string_id]:self.string_offsets[string_id + 1]], 'utf-8')
+
+    def label(self, label_id):
+        return self.labels[label_id] if label_id >= 0 else None
+
+    def close(self):
+        # the memoryviews must be released before the map can be closed
+        for column in self.columns.values():
+            column.release()
+        self.columns = {}
+        self.buffer.release()
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class Document(object):
+    __slots__ = ("corpus", "index")
+
+    def __init__(self, corpus, index):
+        self.corpus = corpus
+        self.index = index
+
+    @property
+    def metadata(self):
+        # id, lang, title, idno values, etc.
+        offsets = self.corpus.document_metadata
+        return json.loads(str(self.corpus.metadata[offsets[self.index]:offsets[self.index + 1]], 'utf-8'),
+                          object_pairs_hook=OrderedDict)
+
+    @property
+    def id(self):
+        return self.metadata.get("id")
+
+    def _paragraph_range(self):
+        start = self.corpus.document_paragraphs[self.index]
+        abstract = max(self.corpus.document_abstract[self.index], 0)
+        return start, start + abstract, self.corpus.document_paragraphs[self.index + 1]
+
+    @property
+    def abstract(self):
+        start, body, _ = self._paragraph_range()
+        return [Paragraph(self.corpus, index) for index in range(start, body)]
+
+    @property
+    def body_text(self):
+        _, body, end = self._paragraph_range()
+        return [Paragraph(self.corpus, index) for index in range(body, end)]
+
+    @property
+    def paragraphs(self):
+        start, _, end = self._paragraph_range()
+        return [Paragraph(self.corpus, index) for index in range(start, end)]
+
+    def annotations(self):
+        start, _, end = self._paragraph_range()
+        annotations = self.corpus.paragraph_annotations
+        for index in range(annotations[start], annotations[end]):
+            yield Annotation(self.corpus, index)
+
+    def to_dict(self):
+        document = self.metadata
+        if self.corpus.document_abstract[self.index] >= 0:
+            document["abstract"] = [paragraph.to_dict() for paragraph in self.abstract]
+        if self.corpus.document_body[self.index]:
+            document["body_text"] = [paragraph.to_dict() for paragraph in self.body_text]
+        return document
+
+class Paragraph(object):
+    __slots__ = ("corpus", "index")
+
+    def __init__(self, corpus, index):
+        self.corpus = corpus
+        self.index = index
+
+    @property
+    def text(self):
+        offsets = self.corpus.paragraph_text
+        return str(self.corpus.text[offsets[self.index]:offsets[self.index + 1]], 'utf-8')
+
+    @property
+    def section(self):
+        return self.corpus.string(self.corpus.paragraph_section[self.index])
+
+    @property
+    def document(self):
+        # position of the paragraph in the document_paragraphs column
+        paragraphs = self.corpus.document_paragraphs
+        low, high = 0, self.corpus.documents - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if paragraphs[middle] <= self.index:
+                low = middle
+            else:
+                high = middle - 1
+        return Document(self.corpus, low)
+
+    @property
+    def id(self):
+        # same paragraph id as add_paragraph_ids()
+        document = self.document
+        start, body, _ = document._paragraph_range()
+        if self.index < body:
+            return "a" + str(self.index - start)
+        return "b" + str(self.index - body)
+
+    def annotations(self):
+        annotations = self.corpus.paragraph_annotations
+        for index in range(annotations[self.index], annotations[self.index + 1]):
+            yield Annotation(self.corpus, index)
+
+    def spans(self, kind):
+        """
+        Spans of a kind (ref_spans, list_spans or formula_spans) as dicts
+        """
+        corpus = self.corpus
+        span_kind = SPAN_KINDS.index(kind)
+        spans = []
+        text = None
+        for index in range(corpus.paragraph_spans[self.index], corpus.paragraph_spans[self.index + 1]):
+            if corpus.span_kind[index] != span_kind:
+                continue
+            span = OrderedDict()
+            start, end = corpus.span_start[index], corpus.span_end[index]
+            if kind == "ref_spans":
+                if text is None:
+                    text = self.text
+                span["type"] = corpus.label(corpus.span_type[index])
+                span["start"] = start
+                span["text"] = text[start:end]
+            elif kind == "list_spans":
+                span["start"] = start
+                span["type"] = corpus.label(corpus.span_type[index])
+            else:
+                span["start"] = start
+            span["end"] = end
+            spans.append(span)
+        return spans
+
+    def to_dict(self):
+        paragraph = OrderedDict()
+        section = self.section
+        if section is not None:
+            paragraph["section"] = section
+        paragraph["text"] = self.text
+        for kind in SPAN_KINDS:
+            spans = self.spans(kind)
+            if spans:
+                paragraph[kind] = spans
+        annotations = [annotation.to_dict() for annotation in self.annotations()]
+        if annotations:
+            paragraph["annotations"] = annotations
+        if self.corpus.paragraph_ids:
+            paragraph["id"] = self.id
+        return paragraph
+
+class Annotation(object):
+    __slots__ = ("corpus", "index")
+
+    def __init__(self, corpus, index):
+        self.corpus = corpus
+        self.index = index
+
+    @property
+    def start(self):
+        return self.corpus.annotation_start[self.index]
+
+    @property
+    def end(self):
+        return self.corpus.annotation_end[self.index]
+
+    @property
+    def text(self):
+        # only the annotated bytes are decoded, not the paragraph
+        corpus = self.corpus
+        return str(corpus.text[corpus.annotation_byte_start[self.index]:corpus.annotation_byte_end[self.index]], 'utf-8')
+
+    @property
+    def type(self):
+        return self.corpus.label(self.corpus.annotation_type[self.index])
+
+    @property
+    def subtype(self):
+        return self.corpus.label(self.corpus.annotation_subtype[self.index])
+
+    @property
+    def id(self):
+        return self.corpus.string(self.corpus.annotation_id[self.index])
+
+    @property
+    def corresp(self):
+        return self.corpus.string(self.corpus.annotation_corresp[self.index])
+
+    @property
+    def resp(self):
+        return self.corpus.label(self.corpus.annotation_resp[self.index])
+
+    @property
+    def cert(self):
+        return self.corpus.label(self.corpus.annotation_cert[self.index])
+
+    @property
+    def paragraph(self):
+        return Paragraph(self.corpus, self.corpus.annotation_paragraph[self.index])
+
+    def to_dict(self):
+        annotation = OrderedDict()
+        annotation["start"] = self.start
+        for attribute in ANNOTATION_ATTRIBUTES:
+            value = getattr(self, attribute)
+            if value is not None:
+                annotation[attribute] = value
+        annotation["text"] = self.text
+        annotation["end"] = self.end
+        return annotation
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write a converted corpus, or a teiCorpus file, in the columnar layout read by CorpusView")
+    parser.add_argument("--input", type=str, required=True,
+                        help="converted corpus (.json, .jsonl, .msgpack, .cbor, possibly compressed) or teiCorpus file (.xml)")
+    parser.add_argument("--output", type=str, help="path to the columnar file, default is the input file with " + VIEW_EXTENSION)
+
+    args = parser.parse_args()
+    if not os.path.isfile(args.input):
+        print("the path to the input file is not valid: ", args.input)
+        exit(-1)
+    output_file = args.output
+    if output_file is None:
+        directory, name = os.path.split(args.input)
+        output_file = os.path.join(directory, name.split(".")[0] + VIEW_EXTENSION)
+    documents = iter_tei_documents(args.input) if args.input.endswith(".xml") else iter_converted_documents(args.input)
+    written = write_corpus_view(documents, output_file)
+    print(written, "documents written in", output_file, "- %.1f MB" % (os.path.getsize(output_file) / (1024 * 1024)))
@@ -0,0 +1,343 @@
+"""
+    Regenerate a teiCorpus file from the JSON output of TEI2LossyJSON.py, re-inserting the <rs>,
+    <ref>, <formula> and <list> markup at the offsets of the converted spans. Converting the
+    result again gives back the same JSON, which is checked with --verify.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from xml.sax.saxutils import XMLGenerator
+
+from TEI2LossyJSON import (add_paragraph_ids, iter_converted_documents, iter_tei_documents, open_input, COMPRESSIONS,
+                           DOCUMENT_FIELDS)
+
+# rank of the elements for spans with the same offsets, the outer one first: an <rs> is put in a
+# <ref> and not the opposite, so that both get their full text at conversion
+SPAN_RANKS = {"list": 0, "item": 1, "label": 1, "ref": 2, "rs": 3, "formula": 4}
+
+# attributes of an <rs> element, by key of the converted annotation
+RS_ATTRIBUTES = (("type", "type"), ("subtype", "subtype"), ("id", "xml:id"), ("corresp", "corresp"),
+                 ("resp", "resp"), ("cert", "cert"))
+
+# number of differences reported in details by verify_round_trip(), the counts are always complete
+MAX_REPORTED_DIFFERENCES = 100
+
+class TEICorpusWriter(object):
+    """
+    Incremental teiCorpus writer: documents are written one by one as they are read, so memory
+    does not depend on the size of the corpus. Each paragraph is rebuilt in a single sweep over
+    its text, the spans being sorted once by offsets and nested with a stack. Spans which cannot
+    be nested in the others, or list spans without their separators, are not re-inserted and are
+    counted in skipped_spans.
+    """
+
+    def __init__(self, output, title=None, resps=None):
+        self.writer = XMLGenerator(output, encoding='utf-8', short_empty_elements=True)
+        self.documents = 0
+        self.skipped_spans = 0
+        self.writer.startDocument()
+        self.writer.startElement("teiCorpus", {"xmlns": "http://www.tei-c.org/ns/1.0"})
+        self._newline()
+        # the converter expects a corpus title
+        self.writer.startElement("teiHeader", {})
+        self.writer.startElement("fileDesc", {})
+        self.writer.startElement("titleStmt", {})
+        self._element("title", title or '')
+        for resp in resps or []:
+            self.writer.startElement("respStmt", {"xml:id": resp["id"]} if "id" in resp else {})
+            if "resp" in resp:
+                self._element("resp", resp["resp"])
+            if "name" in resp:
+                self._element("name", resp["name"])
+            self.writer.endElement("respStmt")
+        self.writer.endElement("titleStmt")
+        self.writer.endElement("fileDesc")
+        self.writer.endElement("teiHeader")
+        self._newline()
+
+    def add_document(self, document):
+        writer = self.writer
+        attrs = OrderedDict()
+        attrs["xml:lang"] = document.get("lang", "en")
+        for key in ("type", "subtype"):
+            if key in document:
+                attrs[key] = document[key]
+        writer.startElement("TEI", attrs)
+
+        writer.startElement("teiHeader", {})
+        writer.startElement("fileDesc", {"xml:id": document["id"]} if "id" in document else {})
+        writer.startElement("titleStmt", {})
+        if "title" in document:
+            self._element("title", document["title"], {"level": "a", "type": "main"})
+        writer.endElement("titleStmt")
+        writer.startElement("sourceDesc", {})
+        writer.startElement("bibl", {})
+        for key, value in document.items():
+            # the other string fields are the idno of the document (DOI, PMC, PMID, etc.)
+            if key not in DOCUMENT_FIELDS and isinstance(value, str):
+                self._element("idno", value, {"type": key})
+        writer.endElement("bibl")
+        writer.endElement("sourceDesc")
+        writer.endElement("fileDesc")
+        writer.endElement("teiHeader")
+        self._newline()
+
+        writer.startElement("text", {})
+        if "abstract" in document:
+            writer.startElement("front", {})
+            writer.startElement("abstract", {})
+            self._write_paragraphs(document["abstract"])
+            writer.endElement("abstract")
+            writer.endElement("front")
+            self._newline()
+        if "body_text" in document:
+            writer.startElement("body", {})
+            self._newline()
+            self._write_paragraphs(document["body_text"])
+            writer.endElement("body")
+        writer.endElement("text")
+        writer.endElement("TEI")
+        self._newline()
+        self.documents += 1
+
+    def close(self):
+        self.writer.endElement("teiCorpus")
+        self._newline()
+        self.writer.endDocument()
+
+    def _write_paragraphs(self, paragraphs):
+        # a section title is a paragraph without section followed by the paragraphs of this section,
+        # the paragraphs of the same section are grouped in a <div> starting with the <head>
+        section = None
+        in_div = False
+        for i, paragraph in enumerate(paragraphs):
+            next_section = paragraphs[i+1].get("section") if i + 1 < len(paragraphs) else None
+            if "section" not in paragraph and next_section is not None and next_section == paragraph["text"]:
+                if in_div:
+                    self.writer.endElement("div")
+                    self._newline()
+                self.writer.startElement("div", {})
+                self._write_paragraph("head", paragraph)
+                section = paragraph["text"]
+                in_div = True
+                continue
+            if paragraph.get("section") != section or ("section" not in paragraph and in_div):
+                if in_div:
+                    self.writer.endElement("div")
+                    self._newline()
+                in_div = "section" in paragraph
+                section = paragraph.get("section")
+                if in_div:
+                    # section title without paragraph of its own (empty text)
+                    self.writer.startElement("div", {})
+                    self._element("head", section)
+                    self._newline()
+            self._write_paragraph("p", paragraph)
+        if in_div:
+            self.writer.endElement("div")
+            self._newline()
+
+    def _write_paragraph(self, name, paragraph):
+        text = paragraph["text"]
+        spans, implied = self._paragraph_spans(paragraph)
+        writer = self.writer
+        writer.startElement(name, {})
+        position = 0
+        stack = []
+        for start, end, element, attrs in spans:
+            while stack and stack[-1][1] <= start:
+                position = self._close_span(text, position, stack.pop(), implied)
+            if stack and end > stack[-1][1]:
+                # overlapping spans cannot be nested in XML
+                self.skipped_spans += 1
+                continue
+            position = self._write_text(text, position, start, implied)
+            writer.startElement(element, attrs)
+            stack.append((start, end, element))
+        while stack:
+            position = self._close_span(text, position, stack.pop(), implied)
+        self._write_text(text, position, len(text), implied)
+        writer.endElement(name)
+        self._newline()
+
+    def _close_span(self, text, position, span, implied):
+        position = self._write_text(text, position, span[1], implied)
+        self.writer.endElement(span[2])
+        return position
+
+    def _write_text(self, text, position, end, implied):
+        # the implied characters are produced by the converter from the list mark-up
+        if end <= position:
+            return position
+        for offset in implied:
+            if position <= offset < end:
+                if offset > position:
+                    self.writer.characters(text[position:offset])
+                position = offset + 1
+        if end > position:
+            self.writer.characters(text[position:end])
+        return end
+
+    def _paragraph_spans(self, paragraph):
+        """
+        Spans of a paragraph as (start, end, element name, attributes) sorted once by start offset,
+        outer spans first, and the offsets of the characters implied by the list mark-up
+        """
+        text = paragraph["text"]
+        spans = []
+        implied = []
+        for span in paragraph.get("ref_spans", []):
+            spans.append((span["start"], span["end"], "ref", {"type": span["type"]} if "type" in span else {}))
+        for span in paragraph.get("annotations", []):
+            attrs = OrderedDict((name, span[key]) for key, name in RS_ATTRIBUTES if key in span)
+            spans.append((span["start"], span["end"], "rs", attrs))
+        for span in paragraph.get("formula_spans", []):
+            spans.append((span["start"], span["end"], "formula", {}))
+
+        items = paragraph.get("list_spans", [])
+        if items:
+            # <list> adds a new line before the first item, </item> a new line and </label> a space after it
+            separators = [(item["end"], '\n' if item.get("type") == 'item' else ' ') for item in items]
+            first = items[0]["start"] - 1
+            if first >= 0 and text[first] == '\n' and all(text[offset:offset+1] == separator
+                                                          for offset, separator in separators):
+                spans.append((first, items[-1]["end"] + 1, "list", {}))
+                implied.append(first)
+                for item, (offset, _) in zip(items, separators):
+                    spans.append((item["start"], item["end"] + 1, item.get("type", "item"), {}))
+                    implied.append(offset)
+            else:
+                self.skipped_spans += len(items)
+
+        spans.sort(key=lambda span: (span[0], -span[1], SPAN_RANKS[span[2]]))
+        implied.sort()
+        return spans, implied
+
+    def _element(self, name, text, attrs=None):
+        self.writer.startElement(name, attrs or {})
+        self.writer.characters(text)
+        self.writer.endElement(name)
+
+    def _newline(self):
+        # white space between block elements is not part of any paragraph text
+        self.writer.ignorableWhitespace('\n')
+
+def read_corpus(json_file):
+    """
+    Corpus metadata (title, respStmt) and iterator over the documents of a converted file. Only
+    the JSON corpus format has metadata, the documents of the other formats are streamed.
+    """
+    compression = None
+    name = json_file
+    for compression_name, extension in COMPRESSIONS.items():
+        if name.endswith(extension):
+            compression = compression_name
+            name = name[:-len(extension)]
+    if not name.endswith(".json"):
+        return None, None, iter_converted_documents(json_file)
+    with open_input(json_file, compression) as f:
+        corpus = json.load(f, object_pairs_hook=OrderedDict)
+    return corpus.get("title"), corpus.get("respStmt"), iter(corpus.get("documents", []))
+
+def convert_json_file(json_file, tei_file):
+    """
+    Write the documents of a converted file (any format of TEI2LossyJSON.py) as a teiCorpus file
+    """
+    title, resps, documents = read_corpus(json_file)
+    with open(tei_file, 'wb') as output:
+        writer = TEICorpusWriter(output, title=title if title is not None else os.path.basename(json_file), resps=resps)
+        for document in documents:
+            writer.add_document(document)
+        writer.close()
+    return writer
+
+def verify_round_trip(json_file, tei_file=None):
+    """
+    Convert a converted file back to TEI and the TEI to JSON again, and compare the documents
+    with the original ones. Return the counts and the first differences, as paths in the documents.
+    """
+    temporary = tei_file is None
+    if temporary:
+        handle, tei_file = tempfile.mkstemp(suffix=".tei.xml")
+        os.close(handle)
+    try:
+        writer = convert_json_file(json_file, tei_file)
+        report = OrderedDict([("documents", 0), ("different_documents", 0), ("differences", 0),
+                              ("skipped_spans", writer.skipped_spans), ("reported_differences", [])])
+        _, _, expected_documents = read_corpus(json_file)
+        found_documents = iter_tei_documents(tei_file)
+        for expected, found in _zip_documents(expected_documents, found_documents):
+            report["documents"] += 1
+            differences = list(_differences(_with_ids(expected), _with_ids(found), expected.get("id", '') if expected else ''))
+            if differences:
+                report["different_documents"] += 1
+                report["differences"] += len(differences)
+                for difference in differences:
+                    if len(report["reported_differences"]) < MAX_REPORTED_DIFFERENCES:
+                        report["reported_differences"].append(difference)
+        return report
+    finally:
+        if temporary:
+            os.remove(tei_file)
+
+def _zip_documents(expected_documents, found_documents):
+    # like zip, but a missing document on one side is reported as None
+    sentinel = object()
+    while True:
+        expected = next(expected_documents, sentinel)
+        found = next(found_documents, sentinel)
+        if expected is sentinel and found is sentinel:
+            return
+        yield (None if expected is sentinel else expected), (None if found is sentinel else found)
+
+def _with_ids(document):
+    # paragraph ids are only in the streamed formats, they are compared when present on both sides
+    if document is None:
+        return None
+    return add_paragraph_ids(json.loads(json.dumps(document)))
+
+def _differences(expected, found, path):
+    if isinstance(expected, dict) and isinstance(found, dict):
+        for key in expected:
+            if key not in found:
+                yield path + "/" + str(key) + ": missing"
+            else:
+                yield from _differences(expected[key], found[key], path + "/" + str(key))
+        for key in found:
+            if key not in expected:
+                yield path + "/" + str(key) + ": unexpected"
+    elif isinstance(expected, list) and isinstance(found, list):
+        if len(expected) != len(found):
+            yield path + ": " + str(len(expected)) + " elements, found " + str(len(found))
+        for i, (expected_item, found_item) in enumerate(zip(expected, found)):
+            yield from _differences(expected_item, found_item, path + "/" + str(i))
+    elif expected != found:
+        yield path + ": " + json.dumps(expected) + " != " + json.dumps(found)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Regenerate a teiCorpus file from the output of TEI2LossyJSON.py")
+    parser.add_argument("--json-file", type=str, required=True,
+                        help="path to a converted corpus (.json, .jsonl, .msgpack or .cbor, possibly compressed)")
+    parser.add_argument("--output", type=str, help="path to the teiCorpus file to write (.tei.xml)")
+    parser.add_argument("--verify", action="store_true",
+                        help="convert the written TEI to JSON again and compare it with the input documents")
+
+    args = parser.parse_args()
+    if not os.path.isfile(args.json_file):
+        print("the path to the JSON file is not valid: ", args.json_file)
+        exit(-1)
+
+    if args.verify:
+        report = verify_round_trip(args.json_file, args.output)
+        print(json.dumps(report, indent=4))
+        exit(0 if report["different_documents"] == 0 else 1)
+    if args.output is None:
+        print("an output file is required without --verify")
+        exit(-1)
+    writer = convert_json_file(args.json_file, args.output)
+    print(args.output)
+    print(writer.documents, "documents written,", writer.skipped_spans, "spans not re-inserted")
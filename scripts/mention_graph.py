@@ -0,0 +1,166 @@
+"""
+    Export the software mentions and their relations as a compact mention table and an edge
+    list. The @corresp pointers of the <rs> annotations are resolved once, in the same pass as
+    the conversion, instead of by every consumer of the JSON output.
+"""
+
+import argparse
+import json
+import os
+from array import array
+from collections import OrderedDict
+
+from TEI2LossyJSON import convert_tei_file, iter_tei_documents, _output_file, OUTPUT_FORMATS
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# columns of the mention table, the integer ones are stored in arrays
+MENTION_COLUMNS = ("document", "paragraph", "type", "subtype", "xml_id", "start", "end", "text")
+INTEGER_COLUMNS = ("start", "end")
+
+# number of problematic pointers reported in details, the counts are always complete
+MAX_REPORTED_POINTERS = 1000
+
+class MentionGraphBuilder(object):
+    """
+    Collect the <rs> annotations of each converted document into a columnar mention table, and
+    resolve the @corresp pointers within the document into an edge list (source mention, target
+    mention, relation). The relation is the type of the source annotation (version, publisher,
+    url, language), or its subtype for a software pointing to its environment (component,
+    implicit). Pointers to an unknown xml:id are dangling, pointers to a mention of another
+    paragraph are cross-paragraph: both are counted and reported, and not part of the edges.
+    """
+
+    def __init__(self):
+        self.mentions = OrderedDict()
+        for column in MENTION_COLUMNS:
+            self.mentions[column] = array('l') if column in INTEGER_COLUMNS else []
+        self.edges = OrderedDict([("source", array('l')), ("target", array('l')), ("relation", [])])
+        self.counts = OrderedDict([("documents", 0), ("mentions", 0), ("pointers", 0), ("relations", 0),
+                                   ("dangling", 0), ("cross_paragraph", 0)])
+        self.problems = []
+
+    def add_document(self, document):
+        self.counts["documents"] += 1
+        document_id = document.get("id")
+        # mention row and paragraph of every xml:id of the document, and the pointers to resolve
+        targets = {}
+        pointers = []
+        for prefix, key in (('a', "abstract"), ('b', "body_text")):
+            for i, paragraph in enumerate(document.get(key, [])):
+                # same paragraph ids as add_paragraph_ids()
+                paragraph_id = prefix + str(i)
+                for annotation in paragraph.get("annotations", []):
+                    row = self._add_mention(document_id, paragraph_id, annotation)
+                    if "id" in annotation:
+                        targets[annotation["id"]] = (row, paragraph_id)
+                    if "corresp" in annotation:
+                        pointers.append((row, paragraph_id, annotation))
+
+        for row, paragraph_id, annotation in pointers:
+            for pointer in annotation["corresp"].split():
+                self.counts["pointers"] += 1
+                target = targets.get(pointer[1:] if pointer.startswith('#') else pointer)
+                if target is None:
+                    self._add_problem("dangling", document_id, paragraph_id, annotation, pointer)
+                elif target[1] != paragraph_id:
+                    self._add_problem("cross_paragraph", document_id, paragraph_id, annotation, pointer)
+                else:
+                    self.edges["source"].append(row)
+                    self.edges["target"].append(target[0])
+                    self.edges["relation"].append(_relation(annotation))
+                    self.counts["relations"] += 1
+
+    def _add_mention(self, document_id, paragraph_id, annotation):
+        mentions = self.mentions
+        mentions["document"].append(document_id)
+        mentions["paragraph"].append(paragraph_id)
+        mentions["type"].append(annotation.get("type"))
+        mentions["subtype"].append(annotation.get("subtype"))
+        mentions["xml_id"].append(annotation.get("id"))
+        mentions["start"].append(annotation["start"])
+        mentions["end"].append(annotation["end"])
+        mentions["text"].append(annotation.get("text"))
+        self.counts["mentions"] += 1
+        return self.counts["mentions"] - 1
+
+    def _add_problem(self, kind, document_id, paragraph_id, annotation, pointer):
+        self.counts[kind] += 1
+        if len(self.problems) < MAX_REPORTED_POINTERS:
+            self.problems.append(OrderedDict([("problem", kind), ("document", document_id), ("paragraph", paragraph_id),
+                                              ("type", annotation.get("type")), ("text", annotation.get("text")),
+                                              ("corresp", pointer)]))
+
+    def report(self):
+        report = OrderedDict()
+        report["counts"] = self.counts
+        report["problems"] = self.problems
+        return report
+
+    def save(self, output_prefix):
+        """
+        Write the mention table and the edge list as Parquet files when pyarrow is available,
+        as columnar JSON otherwise, and the pointer report as JSON. Return the written files.
+        """
+        files = []
+        for name, table in (("mentions", self.mentions), ("relations", self.edges)):
+            if pyarrow is not None:
+                output_file = output_prefix + "." + name + ".parquet"
+                pyarrow.parquet.write_table(
+                    pyarrow.table(OrderedDict((column, list(values)) for column, values in table.items())), output_file)
+            else:
+                output_file = output_prefix + "." + name + ".json"
+                with open(output_file, 'w') as f:
+                    json.dump(OrderedDict((column, list(values)) for column, values in table.items()), f)
+            files.append(output_file)
+        report_file = output_prefix + ".mentions-report.json"
+        with open(report_file, 'w') as f:
+            json.dump(self.report(), f, indent=4)
+        files.append(report_file)
+        return files
+
+def _relation(annotation):
+    if annotation.get("type") == "software" and annotation.get("subtype") is not None:
+        return annotation["subtype"]
+    return annotation.get("type")
+
+def load_columns(input_file):
+    """
+    Load a mention table or edge list written by MentionGraphBuilder.save() as a dict of columns
+    """
+    if input_file.endswith(".parquet"):
+        if pyarrow is None:
+            raise ImportError("the pyarrow package is required to read Parquet files, install it with: pip install pyarrow")
+        return pyarrow.parquet.read_table(input_file).to_pydict()
+    with open(input_file) as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the software mention table and relation edge list of a TEI corpus file")
+    parser.add_argument("--tei-file", type=str, required=True, help="path to a teiCorpus file (.tei.xml)")
+    parser.add_argument("--output", type=str,
+                        help="path to an output directory, default is the same directory as the input file")
+    parser.add_argument("--format", type=str, choices=list(OUTPUT_FORMATS.keys()),
+                        help="also write the converted corpus in this format, in the same pass")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes for the conversion, default is 1")
+
+    args = parser.parse_args()
+    if not os.path.isfile(args.tei_file):
+        print("the path to the TEI XML file is not valid: ", args.tei_file)
+        exit(-1)
+
+    builder = MentionGraphBuilder()
+    if args.format is not None:
+        convert_tei_file(args.tei_file, args.output, workers=args.workers, output_format=args.format, observers=[builder])
+    else:
+        for document in iter_tei_documents(args.tei_file):
+            builder.add_document(document)
+
+    for output_file in builder.save(_output_file(args.tei_file, args.output, "")):
+        print(output_file)
+    print(", ".join(key + ": " + str(value) for key, value in builder.counts.items()))
@@ -0,0 +1,308 @@
+"""
+    Build subsets of a teiCorpus file, such as the holdout and working sets, in a single pass: each
+    <TEI> document is parsed once and routed to any number of splits, by lists of document ids or
+    by a deterministic stratified sampler, and the TEI and converted forms of all the splits are
+    written at the same time.
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+from TEI2LossyJSON import (TEIContentHandler, add_paragraph_ids, check_output_format, create_parser, document_encoder,
+                           iter_tei_ranges, open_output, output_extension, parse_tei_fragment, tei_file_stem,
+                           tei_prolog, COMPRESSIONS, DEFAULT_BACKEND, DOCUMENT_FIELDS, OUTPUT_FORMATS, STREAMING_FORMATS)
+
+class IdListRouter(object):
+    """
+    Route the documents whose id, or one of the idno values (DOI, PMC, etc.), is in a list
+    """
+
+    def __init__(self, ids_by_split):
+        self.ids_by_split = ids_by_split
+        self.splits = list(ids_by_split)
+
+    def route(self, document):
+        keys = _document_keys(document)
+        return [name for name, ids in self.ids_by_split.items() if not ids.isdisjoint(keys)]
+
+class StratifiedSampler(object):
+    """
+    Deterministic sampler routing each document to one of the splits given with their fraction of
+    the corpus (the documents left, if the fractions do not sum to 1, go to no split). By default a
+    document goes where a hash of its id and of the seed falls, which does not depend on the order
+    of the documents nor on the other documents: a document stays in the same split when the
+    corpus grows. With balanced, the documents of each stratum (value of the stratify field, for
+    instance the biomedicine and economics subtypes) are routed to the split the most behind its
+    fraction in this stratum, ties broken by the hash, which gives exact proportions per stratum
+    for a given corpus order.
+    """
+
+    def __init__(self, fractions, stratify="subtype", seed=42, balanced=False):
+        if sum(fractions.values()) > 1.0 + 1e-9:
+            raise ValueError("the fractions of the splits sum to more than 1")
+        self.fractions = fractions
+        self.stratify = stratify
+        self.seed = seed
+        self.balanced = balanced
+        self.splits = list(fractions)
+        # counts per stratum, None being the documents routed to no split
+        self.counts = OrderedDict()
+
+    def route(self, document):
+        value = _document_hash(document, self.seed)
+        stratum = document.get(self.stratify, "none") if self.stratify is not None else "all"
+        counts = self.counts.get(stratum)
+        if counts is None:
+            counts = self.counts[stratum] = OrderedDict((name, 0) for name in list(self.fractions) + [None])
+        fractions = list(self.fractions.items()) + [(None, max(0.0, 1.0 - sum(self.fractions.values())))]
+
+        if self.balanced:
+            total = sum(counts.values()) + 1
+            # largest deficit, then the hash rotates the order of the tied splits
+            deficits = [(fraction * total - counts[name], -((i - int(value * len(fractions))) % len(fractions)), name)
+                        for i, (name, fraction) in enumerate(fractions)]
+            selected = max(deficits)[2]
+        else:
+            selected = None
+            threshold = 0.0
+            for name, fraction in fractions:
+                threshold += fraction
+                if value < threshold:
+                    selected = name
+                    break
+        counts[selected] += 1
+        return [selected] if selected is not None else []
+
+def _document_keys(document):
+    keys = set()
+    if "id" in document:
+        keys.add(document["id"])
+    for key, value in document.items():
+        # idno values, as in CorpusIndexWriter
+        if key not in DOCUMENT_FIELDS and isinstance(value, str):
+            keys.add(value)
+    return keys
+
+def _document_hash(document, seed):
+    # uniform value in [0, 1) given by the document id, the title without id
+    key = document.get("id") or document.get("title") or ""
+    digest = hashlib.sha1((str(seed) + ":" + key).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], "big") / float(1 << 64)
+
+def read_id_list(ids_file):
+    # one id or idno value per line, empty lines and lines starting with # are ignored
+    with open(ids_file, encoding='utf-8') as f:
+        return set(line.strip() for line in f if line.strip() and not line.startswith("#"))
+
+class SplitWriter(object):
+    """
+    TEI and converted outputs of a split, both written document per document. The TEI file gets
+    the corpus header and end of the full corpus around the documents of the split. For the JSON
+    formats, the documents are written to a temporary file and the corpus is assembled at the end,
+    as the respStmt found in the documents comes before them in the JSON corpus.
+    """
+
+    def __init__(self, name, output_path, stem, prefix, title, resps, output_format="json", compression=None):
+        self.name = name
+        self.output_format = output_format
+        self.title = title
+        self.resps = list(resps or [])
+        self.documents = 0
+        self.tei_file = os.path.join(output_path, stem + "-" + name + ".tei.xml")
+        self.tei = open(self.tei_file, 'wb')
+        self.tei.write(prefix)
+        self.output_file = os.path.join(output_path, stem + "-" + name + output_extension(output_format, compression))
+        self.compression = compression
+        if output_format in STREAMING_FORMATS:
+            self.encode_document = document_encoder(output_format)
+            self.output = open_output(self.output_file, compression)
+        else:
+            self.output = tempfile.TemporaryFile(dir=output_path)
+
+    def add_document(self, fragment, document, resps):
+        self.tei.write(fragment)
+        self.tei.write(b'\n')
+        self.resps.extend(resps)
+        if self.output_format in STREAMING_FORMATS:
+            self.output.write(self.encode_document(add_paragraph_ids(document)))
+        else:
+            if self.documents > 0:
+                self.output.write(b',' if self.output_format == "compact" else b',\n')
+            if self.output_format == "compact":
+                self.output.write(json.dumps(document, separators=(',', ':')).encode('utf-8'))
+            else:
+                # same indentation as the documents of a corpus written with json.dump(indent=4)
+                lines = json.dumps(document, indent=4).split('\n')
+                self.output.write('\n'.join(' ' * 8 + line for line in lines).encode('utf-8'))
+        self.documents += 1
+
+    def close(self, suffix):
+        self.tei.write(suffix)
+        self.tei.close()
+        if self.output_format in STREAMING_FORMATS:
+            self.output.close()
+            return
+        corpus = OrderedDict()
+        corpus["title"] = self.title
+        if self.resps:
+            corpus["respStmt"] = self.resps
+        compact = self.output_format == "compact"
+        header = json.dumps(corpus, separators=(',', ':')) if compact else json.dumps(corpus, indent=4)
+        with open_output(self.output_file, self.compression) as outfile:
+            # the documents are inserted before the closing brace of the corpus
+            outfile.write(header[:-1].rstrip().encode('utf-8'))
+            if compact:
+                outfile.write(b',"documents":[')
+            else:
+                outfile.write(b',\n    "documents": [' + (b'\n' if self.documents > 0 else b''))
+            self.output.seek(0)
+            shutil.copyfileobj(self.output, outfile, 1024*1024)
+            self.output.close()
+            if compact:
+                outfile.write(b']}')
+            else:
+                outfile.write((b'\n    ]' if self.documents > 0 else b']') + b'\n}')
+
+def split_tei_corpus(tei_file, routers, output_path=None, output_format="json", compression=None,
+                     backend=DEFAULT_BACKEND):
+    """
+    Read a teiCorpus file once and write the TEI and converted forms of every split. The routers
+    are objects with a list of split names, splits, and a route(document) method returning the
+    names of the splits of a converted document, a document can be in several splits or in none.
+    Every split gets its files, even without any document. Return the number of documents written
+    in each split.
+    """
+    check_output_format(output_format, compression)
+    if output_path is None:
+        output_path = os.path.dirname(os.path.abspath(tei_file))
+    stem = tei_file_stem(tei_file)
+
+    writers = OrderedDict()
+    with open(tei_file, 'rb') as tei, mmap.mmap(tei.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        ranges = iter_tei_ranges(data)
+        first = next(ranges, None)
+        if first is None:
+            raise ValueError("no <TEI> document in " + tei_file)
+        prefix = data[:first[0]]
+        prolog = tei_prolog(prefix)
+
+        # corpus title and respStmt, from the header
+        header_handler = TEIContentHandler()
+        header_parser = create_parser(header_handler, backend)
+        header_parser.feed(prefix)
+        title = header_handler.corpus.get("title") if header_handler.corpus is not None else None
+        resps = header_handler.resps
+
+        def writer(name):
+            if name not in writers:
+                writers[name] = SplitWriter(name, output_path, stem, prefix, title, resps,
+                                            output_format=output_format, compression=compression)
+            return writers[name]
+
+        for router in routers:
+            for name in router.splits:
+                writer(name)
+
+        end = first[1]
+        for start, end in _chain(first, ranges):
+            fragment = data[start:end]
+            documents, document_resps = parse_tei_fragment(prolog, fragment, backend=backend)
+            for document in documents:
+                names = []
+                for router in routers:
+                    names.extend(name for name in router.route(document) if name not in names)
+                for index, name in enumerate(names):
+                    # each split gets its own copy, paragraph ids are added by the streaming writers
+                    copied = document if index == len(names) - 1 else copy.deepcopy(document)
+                    writer(name).add_document(fragment, copied, document_resps)
+        suffix = data[end:]
+
+    for split_writer in writers.values():
+        split_writer.close(suffix)
+        print(split_writer.tei_file)
+        print(split_writer.output_file)
+    return OrderedDict((name, split_writer.documents) for name, split_writer in writers.items())
+
+def _chain(first, ranges):
+    yield first
+    for document_range in ranges:
+        yield document_range
+
+def _parse_assignments(values, parse_value):
+    # NAME=VALUE command line arguments
+    result = OrderedDict()
+    for value in values or []:
+        if "=" not in value:
+            raise ValueError("expected NAME=VALUE: " + value)
+        name, assigned = value.split("=", 1)
+        result[name] = parse_value(assigned)
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write subsets of a teiCorpus file, in TEI and converted form, in a single pass")
+    parser.add_argument("--tei-file", type=str, required=True, help="path to the full teiCorpus file")
+    parser.add_argument("--output", type=str, help="output directory, default is the directory of the input file")
+    parser.add_argument("--split", type=str, action="append",
+                        help="NAME=FILE, the documents whose id or idno value is listed in FILE (one per line) go to "
+                             "the split NAME, can be repeated")
+    parser.add_argument("--sample", type=str, action="append",
+                        help="NAME=FRACTION, a sampled split with this fraction of the documents, can be repeated, "
+                             "for instance --sample holdout=0.2 --sample working=0.8")
+    parser.add_argument("--stratify", type=str, default="subtype",
+                        help="document field whose values are sampled separately, default is subtype, none to disable")
+    parser.add_argument("--balanced", action="store_true",
+                        help="exact proportions per stratum for the corpus order, instead of a hash of the document id "
+                             "independent of the other documents")
+    parser.add_argument("--seed", type=int, default=42, help="seed of the sampling hash, default is 42")
+    parser.add_argument("--format", type=str, default="json", choices=list(OUTPUT_FORMATS.keys()),
+                        help="format of the converted splits, default is indented JSON")
+    parser.add_argument("--compress", type=str, choices=list(COMPRESSIONS.keys()),
+                        help="compress the converted splits with gzip or zstd (requires zstandard)")
+    parser.add_argument("--backend", type=str, default=DEFAULT_BACKEND, help="XML parser backend, default is auto")
+    parser.add_argument("--report", type=str, help="path to a JSON file where to write the documents per split and stratum")
+
+    args = parser.parse_args()
+    if not os.path.isfile(args.tei_file):
+        print("the path to the TEI XML file is not valid: ", args.tei_file)
+        exit(-1)
+    if args.output is not None and not os.path.isdir(args.output):
+        print("the output directory is not valid: ", args.output)
+        exit(-1)
+
+    routers = []
+    id_lists = _parse_assignments(args.split, read_id_list)
+    if id_lists:
+        routers.append(IdListRouter(id_lists))
+    sampler = None
+    fractions = _parse_assignments(args.sample, float)
+    if fractions:
+        sampler = StratifiedSampler(fractions, stratify=None if args.stratify == "none" else args.stratify,
+                                    seed=args.seed, balanced=args.balanced)
+        routers.append(sampler)
+    if not routers:
+        print("at least one --split or --sample is required")
+        parser.print_help()
+        exit(-1)
+
+    counts = split_tei_corpus(args.tei_file, routers, output_path=args.output, output_format=args.format,
+                              compression=args.compress, backend=args.backend)
+    for name, count in counts.items():
+        print(name + ":", count, "documents")
+    report = OrderedDict([("documents", counts)])
+    if sampler is not None:
+        report["strata"] = OrderedDict((stratum, OrderedDict((name if name is not None else "unassigned", count)
+                                                   for name, count in split_counts.items()))
+                                       for stratum, split_counts in sampler.counts.items())
+        for stratum, split_counts in report["strata"].items():
+            print(stratum + ":", ", ".join(name + ": " + str(count) for name, count in split_counts.items()))
+    if args.report is not None:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=4)
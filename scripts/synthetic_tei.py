@@ -0,0 +1,156 @@
+"""
+    Generate a synthetic teiCorpus following the Softcite annotation guidelines, to test
+    and benchmark the converter without the full corpus
+"""
+
+import argparse
+import random
+from xml.sax.saxutils import escape
+
+WORDS = ("the data were analyzed using statistical tests and all images processed with standard "
+         "methods as previously described samples measured in triplicate results are shown for each "
+         "condition model estimated from observed values").split()
+
+SOFTWARE_NAMES = ["SPSS", "Matlab", "ImageJ", "R", "Stata", "GraphPad Prism", "BioEdit", "CRISPRFinder",
+                  "Mathematica", "Python", "Excel", "Review Manager"]
+COMPONENT_NAMES = ["pROC", "sdtest", "NetworkX", "lme4", "dprime_simple"]
+IMPLICIT_NAMES = ["program", "script", "code", "package", "macro"]
+PUBLISHERS = ["IBM Co.", "The MathWorks", "FUJIFILM", "Microsoft Corporation", "StataCorp"]
+LANGUAGES = ["Perl", "Python", "C++", "Java", "R"]
+DOMAINS = ["biomedicine", "economics"]
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+def _mention(rng, doc_id, index):
+    """
+    A software mention: software name with possible version, publisher, URL, language and
+    component, related via @corresp to the @xml:id of the software name
+    """
+    software_id = doc_id + "-software-" + str(index)
+    subtype = rng.choice([None, None, None, "environment", "implicit"])
+    if subtype == "implicit":
+        name = rng.choice(IMPLICIT_NAMES)
+    else:
+        name = rng.choice(SOFTWARE_NAMES)
+    pieces = []
+    if subtype == "implicit" and rng.random() < 0.5:
+        pieces.append('<rs type="language" corresp="#%s">%s</rs> ' % (software_id, escape(rng.choice(LANGUAGES))))
+    pieces.append('<rs type="software"%s xml:id="%s">%s</rs>' % (
+        ' subtype="' + subtype + '"' if subtype is not None else '', software_id, escape(name)))
+    if subtype == "environment" and rng.random() < 0.5:
+        pieces.append(' package <rs type="software" subtype="component" corresp="#%s" xml:id="%s-c">%s</rs>' % (
+            software_id, software_id, escape(rng.choice(COMPONENT_NAMES))))
+    if rng.random() < 0.4:
+        pieces.append(' version <rs type="version" corresp="#%s">%d.%d</rs>' % (software_id, rng.randint(1, 20), rng.randint(0, 9)))
+    if rng.random() < 0.3:
+        pieces.append(' (<rs type="publisher" corresp="#%s">%s</rs>)' % (software_id, escape(rng.choice(PUBLISHERS))))
+    if rng.random() < 0.1:
+        pieces.append(' available at <rs type="url" corresp="#%s">https://example.org/%s</rs>' % (software_id, software_id))
+    return ''.join(pieces)
+
+def _paragraph(rng, doc_id, mention_start, options):
+    pieces = [_text(rng, rng.randint(5, options.paragraph_words))]
+    mention_count = rng.randint(0, options.mentions) if options.mentions > 0 else 0
+    for i in range(mention_count):
+        pieces.append(' we used ' + _mention(rng, doc_id, mention_start + i) + ' for ' + _text(rng, rng.randint(3, 15)))
+    for _ in range(rng.randint(0, options.refs)):
+        pieces.append(' <ref type="bibr" target="#b%d">[%d]</ref> %s' % (
+            rng.randint(0, 50), rng.randint(1, 50), _text(rng, rng.randint(3, 10))))
+    if rng.random() < options.formula_rate:
+        pieces.append(' <formula>x = %d + y</formula> %s' % (rng.randint(0, 9), _text(rng, 5)))
+    if rng.random() < options.list_rate:
+        pieces.append(' <list><item>%s</item><label>2.</label><item>%s</item></list>' % (_text(rng, 6), _text(rng, 6)))
+    if rng.random() < 0.2:
+        pieces.append(' <hi rend="italic">%s</hi> %s' % (_text(rng, 2), _text(rng, 4)))
+    pieces.append('.')
+    return '<p>' + ''.join(pieces) + '</p>', mention_count
+
+def _document(rng, index, options):
+    domain = DOMAINS[index % len(DOMAINS)]
+    doc_id = ("PMC%07d" if domain == "biomedicine" else "10.1111%%2Fecin.%05d") % index
+    pieces = ['<TEI xml:lang="en" subtype="%s"><teiHeader><fileDesc xml:id="%s"><titleStmt><title level="a" type="main">%s</title>'
+              '</titleStmt><sourceDesc><bibl><idno type="DOI">10.1000/synthetic.%d</idno>' % (domain, doc_id, escape(_text(rng, 8)), index)]
+    if domain == "biomedicine":
+        pieces.append('<idno type="PMC">%s</idno><idno type="PMID">%d</idno>' % (doc_id, 20000000 + index))
+    pieces.append('</bibl></sourceDesc></fileDesc></teiHeader><text xml:lang="en">')
+
+    mentions = 0
+    if options.abstract_paragraphs > 0:
+        pieces.append('<front><abstract>')
+        for _ in range(options.abstract_paragraphs):
+            paragraph, count = _paragraph(rng, doc_id, mentions, options)
+            pieces.append(paragraph)
+            mentions += count
+        pieces.append('</abstract></front>')
+
+    pieces.append('<body>')
+    for section in range(options.sections):
+        if options.grobid:
+            # GROBID numbers the section titles with @n and puts the equations between the paragraphs
+            pieces.append('<div><head n="%d.">%s</head>' % (section + 1, escape(_text(rng, 3).capitalize())))
+        else:
+            pieces.append('<div><head>%d. %s</head>' % (section + 1, escape(_text(rng, 3).capitalize())))
+        for _ in range(options.paragraphs):
+            paragraph, count = _paragraph(rng, doc_id, mentions, options)
+            pieces.append(paragraph)
+            mentions += count
+            if options.grobid and rng.random() < options.formula_rate:
+                pieces.append('<formula xml:id="formula_%d">y = %d x<label>(%d)</label></formula>' % (
+                    mentions, rng.randint(1, 9), section + 1))
+        pieces.append('</div>')
+    for figure in range(options.figures):
+        pieces.append('<figure xml:id="fig_%d"><head>Figure %d</head><label>%d</label><figDesc>%s</figDesc></figure>' % (
+            figure, figure + 1, figure + 1, escape(_text(rng, 15))))
+    for footnote in range(options.footnotes):
+        pieces.append('<note place="foot" n="%d">%s</note>' % (footnote + 1, _text(rng, 12)))
+    pieces.append('</body></text></TEI>\n')
+    return ''.join(pieces)
+
+def generate_tei_corpus(output_file, documents=100, sections=3, paragraphs=5, abstract_paragraphs=1, mentions=2,
+                        refs=2, formula_rate=0.05, list_rate=0.05, footnotes=1, figures=0, paragraph_words=120,
+                        grobid=False, seed=42):
+    """
+    Write a synthetic teiCorpus file, the content is fully determined by the parameters and the seed. 
+    With grobid, the sections and formulas follow the GROBID TEI output (numbered <head n="...">, 
+    <formula> between the paragraphs). 
+    """
+    options = argparse.Namespace(sections=sections, paragraphs=paragraphs, abstract_paragraphs=abstract_paragraphs,
+                                 mentions=mentions, refs=refs, formula_rate=formula_rate, list_rate=list_rate,
+                                 footnotes=footnotes, figures=figures, paragraph_words=paragraph_words, grobid=grobid)
+    rng = random.Random(seed)
+    with open(output_file, 'w', encoding='utf-8') as out:
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        out.write('<teiCorpus xmlns="http://www.tei-c.org/ns/1.0">\n')
+        out.write('<teiHeader><fileDesc><titleStmt><title>Softcite synthetic corpus</title>'
+                  '<respStmt xml:id="synthetic"><resp>generator</resp><name>synthetic_tei.py</name></respStmt>'
+                  '</titleStmt></fileDesc></teiHeader>\n')
+        for index in range(documents):
+            out.write(_document(rng, index, options))
+        out.write('</teiCorpus>\n')
+    return output_file
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic teiCorpus file following the Softcite annotation guidelines")
+    parser.add_argument("--output", type=str, required=True, help="path to the teiCorpus file to write (.tei.xml)")
+    parser.add_argument("--documents", type=int, default=100, help="number of documents")
+    parser.add_argument("--sections", type=int, default=3, help="number of <div> sections with a <head> per document")
+    parser.add_argument("--paragraphs", type=int, default=5, help="number of paragraphs per section")
+    parser.add_argument("--abstract-paragraphs", type=int, default=1, help="number of paragraphs in the abstract")
+    parser.add_argument("--mentions", type=int, default=2, help="maximum number of software mentions per paragraph")
+    parser.add_argument("--refs", type=int, default=2, help="maximum number of <ref> callouts per paragraph")
+    parser.add_argument("--formula-rate", type=float, default=0.05, help="probability of a <formula> in a paragraph")
+    parser.add_argument("--list-rate", type=float, default=0.05, help="probability of a <list> in a paragraph")
+    parser.add_argument("--footnotes", type=int, default=1, help="number of footnotes per document")
+    parser.add_argument("--figures", type=int, default=0, help="number of figures with a <figDesc> per document")
+    parser.add_argument("--paragraph-words", type=int, default=120, help="maximum number of words of paragraph text")
+    parser.add_argument("--grobid", action="store_true",
+                        help="GROBID-style sections and formulas: <head n=\"...\"> and <formula> between the paragraphs")
+    parser.add_argument("--seed", type=int, default=42, help="random seed")
+
+    args = parser.parse_args()
+    generate_tei_corpus(args.output, documents=args.documents, sections=args.sections, paragraphs=args.paragraphs,
+                        abstract_paragraphs=args.abstract_paragraphs, mentions=args.mentions, refs=args.refs,
+                        formula_rate=args.formula_rate, list_rate=args.list_rate, footnotes=args.footnotes,
+                        figures=args.figures, paragraph_words=args.paragraph_words, grobid=args.grobid, seed=args.seed)
@@ -0,0 +1,205 @@
+"""
+    Asyncio interface of the converter, for services which cannot block their event loop during
+    a parse: the conversions run in a bounded pool of threads or processes, documents are yielded
+    as the consumer asks for them and a cancelled conversion does not leave work behind.
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import weakref
+from collections import deque
+
+from TEI2LossyJSON import (TEIContentHandler, convert_tei_string, create_parser, parse_tei_fragment, read_tei_prolog,
+                           scan_tei_documents, DEFAULT_BACKEND)
+
+class DocumentError(Exception):
+    """
+    Conversion error of one document, with its position in the corpus
+    """
+
+    def __init__(self, index, offset, message):
+        super(DocumentError, self).__init__("document %d at byte offset %d: %s" % (index, offset, message))
+        self.index = index
+        self.offset = offset
+        self.message = message
+
+    def __reduce__(self):
+        # raised in worker processes, rebuilt from its fields
+        return DocumentError, (self.index, self.offset, self.message)
+
+class AsyncConverter(object):
+    """
+    Run conversions in a pool of `workers` threads, or processes with processes=True (faster for
+    CPU-bound loads, the SAX work not being limited by the GIL). At most `max_pending` conversions
+    are submitted to the pool at the same time, the others wait without holding resources, so a
+    burst of requests does not pile up in the pool queue.
+    """
+
+    def __init__(self, workers=None, processes=False, max_pending=None, backend=DEFAULT_BACKEND, cache=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.processes = processes
+        self.max_pending = max_pending or self.workers * 2
+        self.backend = backend
+        self.cache = cache
+        if processes:
+            self.executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        else:
+            self.executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="tei2json")
+        # the incremental parse of a stream keeps a parser object, which cannot go to a process: its
+        # feeds run in a pool of threads, one after the other for a given stream
+        self.stream_executor = None
+        # a semaphore is bound to an event loop, the converter can be used from several ones
+        self.semaphores = weakref.WeakKeyDictionary()
+        # with a cache, the conversion of each input in progress, by event loop and cache key
+        self.in_flight = weakref.WeakKeyDictionary()
+
+    def _pending(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self.semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self.semaphores[loop] = asyncio.Semaphore(self.max_pending)
+        return semaphore
+
+    async def convert(self, tei):
+        """
+        Convert a TEI string (or bytes) into the JSON string of convert_tei_string(). With a cache,
+        identical requests arriving while the input is being converted share this conversion.
+        """
+        loop = asyncio.get_running_loop()
+        data = tei.encode('utf-8') if isinstance(tei, str) else tei
+        if self.cache is None:
+            return await self._convert(loop, data)
+        key = self.cache.key(data, {"indent": 4})
+        in_flight = self.in_flight.setdefault(loop, {})
+        task = in_flight.get(key)
+        if task is None:
+            task = in_flight[key] = loop.create_task(self._convert_cached(loop, key, data))
+            task.add_done_callback(lambda _: in_flight.pop(key, None))
+        # a cancelled request does not cancel the conversion shared with the other ones
+        return await asyncio.shield(task)
+
+    async def _convert(self, loop, data):
+        async with self._pending():
+            return await loop.run_in_executor(self.executor, convert_tei_string, data, self.backend)
+
+    async def _convert_cached(self, loop, key, data):
+        # the disk tier of the cache is read and written out of the event loop
+        result = await loop.run_in_executor(None, self.cache.get, key)
+        if result is None:
+            result = await self._convert(loop, data)
+            await loop.run_in_executor(None, self.cache.put, key, result)
+        return result
+
+    async def iter_documents(self, source, batch_size=8, on_error=None):
+        """
+        Async iterator over the converted documents of a teiCorpus, given as a file path or as an
+        async iterable of byte chunks (for instance a request body).
+
+        Documents of a file are converted separately in batches, at most max_pending batches ahead
+        of the consumer: a slow consumer stops the conversion instead of buffering the corpus. A
+        document which fails is passed as a DocumentError to on_error and skipped, or raised
+        without on_error. A stream is parsed incrementally, chunk by chunk, and an error ends it.
+        """
+        if isinstance(source, (str, os.PathLike)):
+            async for document in self._iter_file_documents(os.fspath(source), batch_size, on_error):
+                yield document
+        else:
+            async for document in self._iter_stream_documents(source):
+                yield document
+
+    async def _iter_file_documents(self, tei_file, batch_size, on_error):
+        loop = asyncio.get_running_loop()
+        ranges = await loop.run_in_executor(None, scan_tei_documents, tei_file)
+        if not ranges:
+            return
+        prolog = await loop.run_in_executor(None, read_tei_prolog, tei_file, ranges[0][0])
+        tasks = deque((tei_file, prolog, ranges[i:i+batch_size], i, self.backend)
+                      for i in range(0, len(ranges), batch_size))
+        pending = deque()
+        try:
+            while tasks or pending:
+                while tasks and len(pending) < self.max_pending:
+                    pending.append(loop.run_in_executor(self.executor, _convert_tei_documents, tasks.popleft()))
+                for result in await pending.popleft():
+                    if isinstance(result, DocumentError):
+                        if on_error is None:
+                            raise result
+                        on_error(result)
+                    else:
+                        yield result
+        finally:
+            # closed or cancelled before the end: the batches not started are dropped
+            for future in pending:
+                future.cancel()
+
+    async def _iter_stream_documents(self, chunks):
+        loop = asyncio.get_running_loop()
+        if self.stream_executor is None:
+            self.stream_executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="tei2json-stream")
+        documents = deque()
+        handler = TEIContentHandler(document_sink=documents.append)
+        parser = create_parser(handler, self.backend)
+        index = 0
+        offset = 0
+        async for chunk in chunks:
+            try:
+                await loop.run_in_executor(self.stream_executor, parser.feed, chunk)
+            except Exception as e:
+                raise DocumentError(index, offset, str(e)) from e
+            offset += len(chunk)
+            while documents:
+                index += 1
+                yield documents.popleft()
+        try:
+            await loop.run_in_executor(self.stream_executor, parser.close)
+        except Exception as e:
+            raise DocumentError(index, offset, str(e)) from e
+        while documents:
+            yield documents.popleft()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.stream_executor is not None:
+            self.stream_executor.shutdown(wait=False, cancel_futures=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+def _convert_tei_documents(task):
+    # worker side: each document is parsed on its own, so that an error stays local
+    tei_file, prolog, ranges, first_index, backend = task
+    results = []
+    with open(tei_file, 'rb') as tei:
+        for index, (start, end) in enumerate(ranges, first_index):
+            try:
+                tei.seek(start)
+                documents, _ = parse_tei_fragment(prolog, tei.read(end - start), backend=backend)
+            except Exception as e:
+                results.append(DocumentError(index, start, str(e)))
+                continue
+            results.extend(documents)
+    return results
+
+_default_converter = None
+
+def _converter():
+    global _default_converter
+    if _default_converter is None:
+        _default_converter = AsyncConverter()
+    return _default_converter
+
+async def convert(tei):
+    """
+    Convert a TEI string with the default converter, a pool of threads
+    """
+    return await _converter().convert(tei)
+
+def iter_documents(source, batch_size=8, on_error=None):
+    """
+    Async iterator over the documents of a teiCorpus file or stream with the default converter
+    """
+    return _converter().iter_documents(source, batch_size=batch_size, on_error=on_error)